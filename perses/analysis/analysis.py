@@ -166,6 +166,7 @@ class Analysis(object):
             for envname in ['NCMCEngine', 'NCMCHybridEngine']: #self.get_environments():
                 modname = envname
                 work = dict()
+                work_steps = dict()
                 for direction in ['delete', 'insert']:
                     varname = '/' + modname + '/' + 'total_work_' + direction
                     try:
@@ -174,7 +175,12 @@ class Analysis(object):
                         work[direction] = self._ncfile[varname][:-1,:]
                         print('Found %s' % varname)
                     except Exception as e:
-                        pass
+                        continue
+                    # The work may have been recorded every few steps, in which case the steps are stored with it
+                    try:
+                        work_steps[direction] = np.array(self._ncfile['/' + modname + '/' + 'work_steps_' + direction][0,:])
+                    except Exception as e:
+                        work_steps[direction] = np.arange(work[direction].shape[1])
 
                 def plot_work_trajectories(pdf, work, title=""):
                     """Generate figures for the specified switching legs.
@@ -193,13 +199,13 @@ class Analysis(object):
                         plt.subplot2grid((nrows,ncols), (row, col), colspan=(ncols-workcols))
 
                         # Plot average work distribution in think solid line
-                        plt.plot(work[direction].mean(0), 'k-', linewidth=1.0, alpha=1.0)
+                        plt.plot(work_steps[direction], work[direction].mean(0), 'k-', linewidth=1.0, alpha=1.0)
                         # Plot bundle of work trajectories in transparent lines
-                        plt.plot(work[direction].T, 'k-', linewidth=0.5, alpha=0.3)
+                        plt.plot(work_steps[direction], work[direction].T, 'k-', linewidth=0.5, alpha=0.3)
                         # Adjust axes to eliminate large-magnitude outliers (keep 98% of data in-range)
                         workvals = np.ravel(np.abs(work[direction]))
                         worklim = np.percentile(workvals, 98)
-                        nsteps = work[direction].shape[1]
+                        nsteps = work_steps[direction][-1]
                         plt.axis([0, nsteps, -worklim, +worklim])
                         # Label plot
                         if row == 1: plt.xlabel('steps')
@@ -1,11 +1,18 @@
 from __future__ import print_function
 import numpy as np
 import copy
+import collections
+import hashlib
 import logging
+import os
+import threading
 import traceback
+import weakref
 from simtk import openmm, unit
 from perses.storage import NetCDFStorageView
 from perses.tests.utils import quantity_is_finite
+from perses.rjmc.random_state import get_random_state
+from perses.rjmc.cache_files import write_cache_file
 from openmmtools.constants import kB
 
 default_functions = {
@@ -43,6 +50,542 @@ class NaNException(Exception):
     def __init__(self, *args, **kwargs):
         super(NaNException,self).__init__(*args,**kwargs)
 
+# Properties computed from Systems, keyed by id(system) and validated with a weak reference to the System
+_system_property_cache = dict()
+_system_property_lock = threading.Lock()
+
+def _cached_system_property(system, name, compute):
+    """
+    Get a property of a System computed by compute(system), caching it for this System object.
+
+    The cache holds weak references and does not keep Systems alive. A System whose number of forces
+    changed since the property was cached is computed again; other modifications are not detected.
+    """
+    key = id(system)
+    n_forces = system.getNumForces()
+    with _system_property_lock:
+        entry = _system_property_cache.get(key, None)
+        if (entry is not None) and (entry[0]() is system) and (entry[1] == n_forces) and (name in entry[2]):
+            return entry[2][name]
+
+    value = compute(system)
+
+    def remove_entry(system_reference, key=key):
+        with _system_property_lock:
+            if (key in _system_property_cache) and (_system_property_cache[key][0] is system_reference):
+                del _system_property_cache[key]
+    with _system_property_lock:
+        entry = _system_property_cache.get(key, None)
+        if (entry is None) or (entry[0]() is not system) or (entry[1] != n_forces):
+            try:
+                entry = (weakref.ref(system, remove_entry), n_forces, dict())
+            except TypeError:
+                return value
+            _system_property_cache[key] = entry
+        entry[2][name] = value
+    return value
+
+def get_global_parameter_names(system):
+    """
+    Get the names of the global parameters defined by the forces of a System.
+
+    The names are cached for each System object, so that the forces of a large alchemical System are only walked
+    once however many times it is switched. The cache holds weak references and does not keep Systems alive.
+    A System whose number of forces changed since it was cached is walked again.
+
+    Parameters
+    ----------
+    system : simtk.openmm.System
+        The system
+
+    Returns
+    -------
+    parameter_names : frozenset of str
+        The names of the global parameters of all forces in the system
+    """
+    def compute_parameter_names(system):
+        parameter_names = set()
+        for force_index in range(system.getNumForces()):
+            force = system.getForce(force_index)
+            if hasattr(force, 'getNumGlobalParameters'):
+                for parameter_index in range(force.getNumGlobalParameters()):
+                    parameter_names.add(force.getGlobalParameterName(parameter_index))
+        return frozenset(parameter_names)
+    return _cached_system_property(system, 'global_parameter_names', compute_parameter_names)
+
+def get_system_hash(system):
+    """
+    Get the SHA1 hash of the serialized XML of a System, which identifies its particles, forces, parameters and box.
+
+    The hash is cached for each System object like get_global_parameter_names(), so a System must not be modified
+    after it is hashed.
+
+    Parameters
+    ----------
+    system : simtk.openmm.System
+        The system
+
+    Returns
+    -------
+    system_hash : str
+        The hexadecimal SHA1 hash of the serialized System
+    """
+    return _cached_system_property(system, 'hash', lambda system: hashlib.sha1(openmm.XmlSerializer.serialize(system).encode()).hexdigest())
+
+def get_system_signature(system):
+    """
+    Get a signature of a System from its number of particles and constraints, box, and the class, nonbonded method,
+    cutoff, number of terms and global parameters of each force.
+
+    Unlike get_system_hash(), the signature does not depend on the per-particle and per-term parameters, so it is
+    computed in time proportional to the number of forces and does not serialize the System. It distinguishes
+    environments and simulation settings, but not Systems that only differ in their parameters.
+
+    Parameters
+    ----------
+    system : simtk.openmm.System
+        The system
+
+    Returns
+    -------
+    signature : tuple
+        The signature
+    """
+    def compute_signature(system):
+        forces = []
+        for force_index in range(system.getNumForces()):
+            force = system.getForce(force_index)
+            force_signature = [force.__class__.__name__]
+            if hasattr(force, 'getNonbondedMethod'):
+                force_signature.append(int(force.getNonbondedMethod()))
+            if hasattr(force, 'getCutoffDistance'):
+                force_signature.append(force.getCutoffDistance().value_in_unit(unit.nanometers))
+            for method_name in ['getNumBonds', 'getNumAngles', 'getNumTorsions', 'getNumParticles', 'getNumExceptions', 'getNumExclusions']:
+                if hasattr(force, method_name):
+                    force_signature.append(getattr(force, method_name)())
+            if hasattr(force, 'getNumGlobalParameters'):
+                for parameter_index in range(force.getNumGlobalParameters()):
+                    force_signature.append((force.getGlobalParameterName(parameter_index), force.getGlobalParameterDefaultValue(parameter_index)))
+            forces.append(tuple(force_signature))
+        box_vectors = tuple(tuple(vector.value_in_unit(unit.nanometers)) for vector in system.getDefaultPeriodicBoxVectors())
+        return (system.getNumParticles(), system.getNumConstraints(), box_vectors, tuple(forces))
+    return _cached_system_property(system, 'signature', compute_signature)
+
+class AlchemicalContextCacheEntry(object):
+    """
+    An alchemical system with the integrator and Context used to switch it, held by AlchemicalContextCache.
+
+    Parameters
+    ----------
+    alchemical_system : simtk.openmm.System
+        The alchemically modified system
+    integrator : NCMCAlchemicalIntegrator subclasses
+        The NCMC switching integrator bound to the Context
+    context : openmm.Context
+        The alchemical Context
+    """
+
+    # Rough device memory footprint used for the cache memory limit
+    _BYTES_PER_PARTICLE = 2048
+    _BYTES_PER_TERM = 128
+
+    def __init__(self, alchemical_system, integrator, context):
+        self.alchemical_system = alchemical_system
+        self.integrator = integrator
+        self.context = context
+        n_terms = 0
+        for force in alchemical_system.getForces():
+            for method_name in ['getNumBonds', 'getNumAngles', 'getNumTorsions', 'getNumParticles', 'getNumExceptions', 'getNumExclusions']:
+                if hasattr(force, method_name):
+                    n_terms += getattr(force, method_name)()
+        self.memory = alchemical_system.getNumParticles()*self._BYTES_PER_PARTICLE + n_terms*self._BYTES_PER_TERM
+
+class AlchemicalContextCache(object):
+    """
+    Least-recently-used cache of alchemical Contexts and their integrators, so that NCMC switching for a
+    chemical state transition that was already attempted does not create a new System, integrator and Context.
+
+    Entries are checked out with get() and returned with put() once the switching is done, so an entry
+    is never used by two switching protocols at the same time. Evicted Contexts are deleted, releasing their
+    device memory.
+
+    Parameters
+    ----------
+    max_size : int, optional, default=4
+        Maximum number of cached Contexts. If 0, nothing is cached.
+    max_memory : float, optional, default=1024
+        Maximum estimated device memory of the cached Contexts, in megabytes
+
+    Properties
+    ----------
+    n_hits : int
+        Number of times a cached Context was found
+    n_misses : int
+        Number of times no cached Context was found
+    n_evictions : int
+        Number of Contexts evicted to respect max_size or max_memory
+    """
+
+    def __init__(self, max_size=4, max_memory=1024):
+        self.max_size = max_size
+        self.max_memory = max_memory
+        self._entries = collections.OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    @staticmethod
+    def make_key(chemical_state_key, direction, system, alchemical_atoms, protocol_settings):
+        """
+        Make the cache key of an alchemical Context.
+
+        Parameters
+        ----------
+        chemical_state_key : str
+            The chemical state key of the system being switched
+        direction : str
+            The direction of switching, 'insert' or 'delete'
+        system : simtk.openmm.System
+            The unmodified system, whose number of particles distinguishes environments with the same chemical state key
+        alchemical_atoms : list of int
+            The atoms being switched, which depend on the other chemical state of the proposal
+        protocol_settings : tuple
+            The settings of the engine that determine the alchemical system and the integrator
+
+        Returns
+        -------
+        key : tuple
+            The cache key
+        """
+        return (chemical_state_key, direction, system.getNumParticles(), tuple(sorted(alchemical_atoms)), protocol_settings)
+
+    def get(self, key):
+        """
+        Check out the cached entry for key, removing it from the cache.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+
+        Returns
+        -------
+        entry : AlchemicalContextCacheEntry or None
+            The cached entry, or None if there is none
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.n_misses += 1
+            else:
+                self._memory -= entry.memory
+                self.n_hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Return an entry to the cache, evicting the least recently used entries if needed.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+        entry : AlchemicalContextCacheEntry
+            The entry to cache
+        """
+        if (self.max_size <= 0) or (entry.memory > self.max_memory*1024**2):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._memory -= self._entries.pop(key).memory
+            self._entries[key] = entry
+            self._memory += entry.memory
+            while (len(self._entries) > self.max_size) or (self._memory > self.max_memory*1024**2):
+                _, evicted_entry = self._entries.popitem(last=False)
+                self._memory -= evicted_entry.memory
+                self.n_evictions += 1
+                del evicted_entry
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._memory = 0
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups that found a cached Context
+        """
+        n_lookups = self.n_hits + self.n_misses
+        if n_lookups == 0:
+            return 0.0
+        return float(self.n_hits) / n_lookups
+
+    @property
+    def statistics(self):
+        """
+        Dict of cache statistics
+        """
+        return {'n_entries' : len(self._entries), 'memory' : self._memory / 1024.0**2, 'n_hits' : self.n_hits,
+                'n_misses' : self.n_misses, 'n_evictions' : self.n_evictions, 'hit_rate' : self.hit_rate}
+
+class AlchemicalSystemStore(object):
+    """
+    Least-recently-used store of alchemically modified Systems, so that the alchemical factory is not run again
+    for a chemical state and set of alchemical atoms that were already switched.
+
+    In memory, Systems are keyed by the chemical state key, the signature of the unmodified System (see
+    get_system_signature), the alchemical atoms and the alchemical factory options. The signature is cheap to compute
+    for the fresh System a proposal engine builds for every proposal, and a chemical state key is assumed to always
+    give the same parameters within a run.
+
+    If a cache directory is given, each System is also serialized to an XML file named after the SHA1 hash of its key
+    and of the serialized unmodified System (see get_system_hash), so that restarted jobs and other workers can
+    deserialize it instead of running the alchemical factory, but never load a file written for a different force
+    field. The unmodified System is only serialized when the directory is read or written, after a miss in memory.
+
+    Stored Systems are shared by all the callers that get them, and must not be modified.
+
+    Parameters
+    ----------
+    max_size : int, optional, default=16
+        Maximum number of Systems kept in memory
+    cache_directory : str, optional, default=None
+        Directory of the persistent store; if None, Systems are only kept in memory
+
+    Properties
+    ----------
+    n_hits : int
+        Number of times a System was found in memory
+    n_disk_hits : int
+        Number of times a System was loaded from the cache directory
+    n_misses : int
+        Number of times no System was found
+    """
+
+    def __init__(self, max_size=16, cache_directory=None):
+        self.max_size = max_size
+        self._cache_directory = cache_directory
+        self._systems = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_disk_hits = 0
+        self.n_misses = 0
+        if cache_directory is not None:
+            if not os.path.exists(cache_directory):
+                os.makedirs(cache_directory)
+
+    @staticmethod
+    def make_key(chemical_state_key, system, alchemical_atoms, direction, disable_barostat=False, factory_options=None):
+        """
+        Make the key of an alchemically modified System.
+
+        Parameters
+        ----------
+        chemical_state_key : str
+            The chemical state key of the unmodified system
+        system : simtk.openmm.System
+            The unmodified system, identified by its signature (see get_system_signature), so that Systems of
+            different environments or with a different nonbonded method, cutoff or box get different keys
+        alchemical_atoms : list of int
+            The atoms that are alchemically modified
+        direction : str
+            The direction of switching, 'insert' or 'delete'
+        disable_barostat : bool, optional, default=False
+            Whether the barostat of the alchemical system is disabled
+        factory_options : dict, optional, default=None
+            The options of the alchemical factory used to modify the system
+
+        Returns
+        -------
+        key : tuple
+            The key
+        """
+        factory_options = tuple(sorted(factory_options.items())) if factory_options is not None else None
+        return (chemical_state_key, get_system_signature(system), tuple(sorted(alchemical_atoms)), direction, disable_barostat, factory_options)
+
+    def _cache_filename(self, key, unmodified_system):
+        return os.path.join(self._cache_directory, '%s.xml' % hashlib.sha1((repr(key) + get_system_hash(unmodified_system)).encode()).hexdigest())
+
+    def get(self, key, unmodified_system=None):
+        """
+        Get the System for key, from memory or from the cache directory.
+
+        Parameters
+        ----------
+        key : tuple
+            The key from make_key()
+        unmodified_system : simtk.openmm.System, optional, default=None
+            The unmodified system the key was made for; if None, the cache directory is not read
+
+        Returns
+        -------
+        system : simtk.openmm.System or None
+            The stored System, or None if there is none
+        """
+        with self._lock:
+            if key in self._systems:
+                self._systems.move_to_end(key)
+                self.n_hits += 1
+                return self._systems[key]
+        system = None
+        if (self._cache_directory is not None) and (unmodified_system is not None):
+            filename = self._cache_filename(key, unmodified_system)
+            if os.path.exists(filename):
+                with open(filename, 'r') as infile:
+                    system = openmm.XmlSerializer.deserialize(infile.read())
+        with self._lock:
+            if system is None:
+                self.n_misses += 1
+                return None
+            self.n_disk_hits += 1
+        self._store(key, system)
+        return system
+
+    def put(self, key, system, unmodified_system=None):
+        """
+        Store a System, writing it to the cache directory if there is one.
+
+        Parameters
+        ----------
+        key : tuple
+            The key from make_key()
+        system : simtk.openmm.System
+            The alchemically modified System
+        unmodified_system : simtk.openmm.System, optional, default=None
+            The unmodified system the key was made for; if None, the System is not written to the cache directory
+        """
+        if (self._cache_directory is not None) and (unmodified_system is not None):
+            def write_system(filename):
+                with open(filename, 'w') as outfile:
+                    outfile.write(openmm.XmlSerializer.serialize(system))
+            write_cache_file(self._cache_filename(key, unmodified_system), write_system)
+        self._store(key, system)
+
+    def _store(self, key, system):
+        """
+        Keep a System in memory, evicting the least recently used Systems if needed.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._systems[key] = system
+            self._systems.move_to_end(key)
+            while len(self._systems) > self.max_size:
+                self._systems.popitem(last=False)
+
+    @property
+    def statistics(self):
+        """
+        Dict of store statistics
+        """
+        return {'n_systems' : len(self._systems), 'n_hits' : self.n_hits, 'n_disk_hits' : self.n_disk_hits, 'n_misses' : self.n_misses}
+
+class HybridTopologyFactoryCache(object):
+    """
+    Least-recently-used cache of HybridTopologyFactory objects, so that the hybrid System and topology of a
+    pair of chemical states are only built once. Only the positions differ between repeated proposals of the
+    same pair, and these are computed from a cached factory with HybridTopologyFactory.compute_hybrid_positions().
+
+    Cached factories are shared by all the callers that get them, and their hybrid Systems must not be modified.
+
+    Parameters
+    ----------
+    max_size : int, optional, default=8
+        Maximum number of cached factories
+
+    Properties
+    ----------
+    n_hits : int
+        Number of times a cached factory was found
+    n_misses : int
+        Number of times no cached factory was found
+    """
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self._factories = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+
+    @staticmethod
+    def make_key(topology_proposal, disable_barostat=False):
+        """
+        Make the cache key of the hybrid factory of a topology proposal.
+
+        Parameters
+        ----------
+        topology_proposal : TopologyProposal
+            The proposal, whose old and new chemical state keys and atom map identify the hybrid System
+        disable_barostat : bool, optional, default=False
+            Whether the barostat of the hybrid System is disabled
+
+        Returns
+        -------
+        key : tuple
+            The cache key
+        """
+        atom_map = np.array(sorted(topology_proposal.new_to_old_atom_map.items()), dtype=np.int64)
+        atom_map_hash = hashlib.sha1(atom_map.tobytes()).hexdigest()
+        return (topology_proposal.old_chemical_state_key, topology_proposal.new_chemical_state_key,
+                topology_proposal.old_system.getNumParticles(), topology_proposal.new_system.getNumParticles(),
+                atom_map_hash, disable_barostat)
+
+    def get(self, key):
+        """
+        Get the cached factory for key.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+
+        Returns
+        -------
+        factory : HybridTopologyFactory or None
+            The cached factory, or None if there is none
+        """
+        with self._lock:
+            factory = self._factories.get(key, None)
+            if factory is None:
+                self.n_misses += 1
+            else:
+                self._factories.move_to_end(key)
+                self.n_hits += 1
+        return factory
+
+    def put(self, key, factory):
+        """
+        Cache a factory, evicting the least recently used factories if needed.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+        factory : HybridTopologyFactory
+            The factory to cache
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._factories[key] = factory
+            self._factories.move_to_end(key)
+            while len(self._factories) > self.max_size:
+                self._factories.popitem(last=False)
+
+    @property
+    def statistics(self):
+        """
+        Dict of cache statistics
+        """
+        return {'n_factories' : len(self._factories), 'n_hits' : self.n_hits, 'n_misses' : self.n_misses}
+
 class NCMCEngine(object):
     """
     NCMC switching engine
@@ -64,7 +607,9 @@ class NCMCEngine(object):
 
     """
 
-    def __init__(self, temperature=default_temperature, functions=None, nsteps=default_nsteps, steps_per_propagation=default_steps_per_propagation, timestep=default_timestep, constraint_tolerance=None, platform=None, write_ncmc_interval=None, integrator_type='GHMC', storage=None, verbose=False):
+    def __init__(self, temperature=default_temperature, functions=None, nsteps=default_nsteps, steps_per_propagation=default_steps_per_propagation, timestep=default_timestep, constraint_tolerance=None, platform=None, write_ncmc_interval=None, integrator_type='GHMC', storage=None, verbose=False,
+                 single_call_switching=False, work_record_interval=None, context_cache_size=0, context_cache_memory=1024,
+                 alchemical_system_cache_size=0, alchemical_system_cache_directory=None):
         """
         This is the base class for NCMC switching between two different systems.
 
@@ -94,6 +639,26 @@ class NCMCEngine(object):
             If specified, write data using this class.
         verbose : bool, optional, default=False
             If True, print debug information.
+        single_call_switching : bool, optional, default=False
+            If True, the whole switching protocol is run with a single call to integrator.step(nsteps) instead of one
+            call per step, and the work is read back from the integrator at the end. If write_ncmc_interval or
+            work_record_interval is set, the protocol is run in chunks of steps between trajectory frames and work
+            records instead. The stored work trajectories then hold the work at the start, every work_record_interval
+            steps and at the end of the protocol.
+        work_record_interval : int, optional, default=None
+            With single_call_switching, the interval in steps at which the accumulated work is read back from the
+            integrator; if None, only the final work is stored.
+        context_cache_size : int, optional, default=0
+            If greater than 0, the alchemical Contexts of this many chemical state transitions are kept in an
+            AlchemicalContextCache and reused, resetting their integrators, instead of being created for every switch.
+        context_cache_memory : float, optional, default=1024
+            Maximum estimated device memory of the cached Contexts, in megabytes
+        alchemical_system_cache_size : int, optional, default=0
+            If greater than 0, this many alchemically modified Systems are kept in an AlchemicalSystemStore, keyed by
+            chemical state key, alchemical atoms and direction, instead of being rebuilt for every switch.
+        alchemical_system_cache_directory : str, optional, default=None
+            If specified, the alchemically modified Systems are also stored in this directory as serialized XML,
+            and loaded from it by later runs and other workers.
         """
         # Handle some defaults.
         if functions == None:
@@ -115,6 +680,14 @@ class NCMCEngine(object):
         self.steps_per_propagation = steps_per_propagation
         self.verbose = verbose
         self.disable_barostat = False
+        self.alchemical_factory_options = dict(annihilate_electrostatics=True, annihilate_sterics=True, alchemical_torsions=True, alchemical_bonds=True, alchemical_angles=True, softcore_beta=0.0)
+        self.single_call_switching = single_call_switching
+        self.work_record_interval = work_record_interval
+        self.context_cache = AlchemicalContextCache(max_size=context_cache_size, max_memory=context_cache_memory) if context_cache_size > 0 else None
+        self.alchemical_system_store = None
+        if (alchemical_system_cache_size > 0) or (alchemical_system_cache_directory is not None):
+            self.alchemical_system_store = AlchemicalSystemStore(max_size=alchemical_system_cache_size, cache_directory=alchemical_system_cache_directory)
+        self._logger = logging.getLogger("ncmc")
 
         self.nattempted = 0
 
@@ -146,15 +719,7 @@ class NCMCEngine(object):
             The list of available context parameters in the system
 
         """
-        parameters = list()
-        for force_index in range(system.getNumForces()):
-            force = system.getForce(force_index)
-            if hasattr(force, 'getNumGlobalParameters'):
-                for parameter_index in range(force.getNumGlobalParameters()):
-                    parameter_name = force.getGlobalParameterName(parameter_index)
-                    if parameter_name[0:(len(prefix)+1)] == (prefix + '_'):
-                        parameters.append(parameter_name)
-        return parameters
+        return sorted(parameter_name for parameter_name in get_global_parameter_names(system) if parameter_name.startswith(prefix + '_'))
 
     def _computeEnergyContribution(self, integrator):
         """
@@ -220,7 +785,7 @@ class NCMCEngine(object):
         elif direction == 'insert':
             return topology_proposal.new_topology, topology_proposal.unique_new_atoms, topology_proposal.new_system
 
-    def make_alchemical_system(self, unmodified_system, alchemical_atoms, direction='insert'):
+    def make_alchemical_system(self, unmodified_system, alchemical_atoms, direction='insert', chemical_state_key=None):
         """
         Generate an alchemically-modified system at the correct atoms
         based on the topology proposal
@@ -233,15 +798,25 @@ class NCMCEngine(object):
             List of the indices of atoms that are turned on / off
         direction : str, optional, default='insert'
             Direction of topology proposal to use for identifying alchemical atoms (allowed values: ['insert', 'delete'])
+        chemical_state_key : str, optional, default=None
+            The chemical state key of the unmodified system. If specified and the engine has an alchemical_system_store,
+            the alchemically-modified system is taken from the store, or built and stored; it must then not be modified.
 
         Returns
         -------
         alchemical_system : simtk.openmm.System
             The system with appropriate atoms alchemically modified
         """
+        system_key = None
+        if (self.alchemical_system_store is not None) and (chemical_state_key is not None):
+            system_key = self.alchemical_system_store.make_key(chemical_state_key, unmodified_system, alchemical_atoms, direction, disable_barostat=self.disable_barostat, factory_options=self.alchemical_factory_options)
+            alchemical_system = self.alchemical_system_store.get(system_key, unmodified_system=unmodified_system)
+            if alchemical_system is not None:
+                return alchemical_system
+
         # Create an alchemical factory.
         from alchemy import AbsoluteAlchemicalFactory
-        alchemical_factory = AbsoluteAlchemicalFactory(unmodified_system, ligand_atoms=alchemical_atoms, annihilate_electrostatics=True, annihilate_sterics=True, alchemical_torsions=True, alchemical_bonds=True, alchemical_angles=True, softcore_beta=0.0)
+        alchemical_factory = AbsoluteAlchemicalFactory(unmodified_system, ligand_atoms=alchemical_atoms, **self.alchemical_factory_options)
 
         # Return the alchemically-modified system in fully-interacting form.
         alchemical_system = alchemical_factory.createPerturbedSystem()
@@ -251,6 +826,9 @@ class NCMCEngine(object):
                 if hasattr(force, 'setFrequency'):
                     force.setFrequency(0)
 
+        if system_key is not None:
+            self.alchemical_system_store.put(system_key, alchemical_system, unmodified_system=unmodified_system)
+
         return alchemical_system
 
     def _integrate_switching(self, integrator, context, topology, indices, iteration, direction):
@@ -296,41 +874,60 @@ class NCMCEngine(object):
             total_work = np.zeros([nsteps+1], np.float64) # work[n] is the accumulated total work up to step n
             shadow_work = np.zeros([nsteps+1], np.float64) # work[n] is the accumulated shadow work up to step n
             protocol_work = np.zeros([nsteps+1], np.float64) # work[n] is the accumulated protocol work up to step n
+            work_steps = np.arange(nsteps+1, dtype=np.int64) # work_steps[n] is the step at which work[n] was recorded
 
             # Write trajectory frame.
             if self._storage and self.write_ncmc_interval:
                 positions = context.getState(getPositions=True, enforcePeriodicBox=True).getPositions(asNumpy=True)
                 self._storage.write_configuration('positions', positions, topology, iteration=iteration, frame=0, nframes=(self.nsteps+1))
 
-            # Perform NCMC integration.
-            for step in range(nsteps):
-                # Take a step.
-                try:
-                    integrator.step(1)
-                except Exception as e:
-                    print(e)
-                    for index in range(integrator.getNumGlobalVariables()):
-                        name = integrator.getGlobalVariableName(index)
-                        val = integrator.getGlobalVariable(index)
-                        print(name, val)
-                    for index in range(integrator.getNumPerDofVariables()):
-                        name = integrator.getPerDofVariableName(index)
-                        val = integrator.getPerDofVariable(index)
-                        print(name, val)
-
-                # Store accumulated work
-                total_work[step+1] = integrator.getTotalWork(context)
-                shadow_work[step+1] = integrator.getShadowWork(context)
-                protocol_work[step+1] = integrator.getProtocolWork(context)
-
-                # Write trajectory frame.
-                if self._storage and self.write_ncmc_interval and (self.write_ncmc_interval % (step+1) == 0):
-                    positions = context.getState(getPositions=True, enforcePeriodicBox=True).getPositions(asNumpy=True)
-                    assert quantity_is_finite(positions) == True
-                    self._storage.write_configuration('positions', positions, topology, iteration=iteration, frame=(step+1), nframes=(self.nsteps+1))
+            if self.single_call_switching:
+                # Run the protocol in one call, or in chunks of steps between trajectory frames and work records.
+                write_interval = self.write_ncmc_interval if (self._storage and self.write_ncmc_interval) else nsteps
+                record_interval = self.work_record_interval if self.work_record_interval else nsteps
+                chunk_ends = sorted(set(range(write_interval, nsteps, write_interval)) | set(range(record_interval, nsteps, record_interval)) | {nsteps})
+                work_steps = [0]
+                step = 0
+                for chunk_end in chunk_ends:
+                    self._step_integrator(integrator, chunk_end - step)
+                    step = chunk_end
+
+                    # Store accumulated work
+                    if (step % record_interval == 0) or (step == nsteps):
+                        work_steps.append(step)
+                        shadow_work[len(work_steps)-1] = integrator.getShadowWork(context)
+                        protocol_work[len(work_steps)-1] = integrator.getProtocolWork(context)
+
+                    # Write trajectory frame.
+                    if self._storage and self.write_ncmc_interval and ((step % write_interval == 0) or (step == nsteps)):
+                        positions = context.getState(getPositions=True, enforcePeriodicBox=True).getPositions(asNumpy=True)
+                        assert quantity_is_finite(positions) == True
+                        self._storage.write_configuration('positions', positions, topology, iteration=iteration, frame=step, nframes=(self.nsteps+1))
+                nrecords = len(work_steps)
+                work_steps = np.array(work_steps, np.int64)
+                shadow_work = shadow_work[:nrecords]
+                protocol_work = protocol_work[:nrecords]
+                total_work = shadow_work + protocol_work
+            else:
+                # Perform NCMC integration one step at a time.
+                for step in range(nsteps):
+                    # Take a step.
+                    self._step_integrator(integrator, 1)
+
+                    # Store accumulated work
+                    total_work[step+1] = integrator.getTotalWork(context)
+                    shadow_work[step+1] = integrator.getShadowWork(context)
+                    protocol_work[step+1] = integrator.getProtocolWork(context)
+
+                    # Write trajectory frame.
+                    if self._storage and self.write_ncmc_interval and (self.write_ncmc_interval % (step+1) == 0):
+                        positions = context.getState(getPositions=True, enforcePeriodicBox=True).getPositions(asNumpy=True)
+                        assert quantity_is_finite(positions) == True
+                        self._storage.write_configuration('positions', positions, topology, iteration=iteration, frame=(step+1), nframes=(self.nsteps+1))
 
             # Store work values.
             if self._storage:
+                self._storage.write_array('work_steps_%s' % direction, work_steps, iteration=iteration)
                 self._storage.write_array('total_work_%s' % direction, total_work, iteration=iteration)
                 self._storage.write_array('shadow_work_%s' % direction, shadow_work, iteration=iteration)
                 self._storage.write_array('protocol_work_%s' % direction, protocol_work, iteration=iteration)
@@ -353,6 +950,30 @@ class NCMCEngine(object):
         logP_NCMC = integrator.getLogAcceptanceProbability(context)
         return final_positions, logP_NCMC
 
+    def _step_integrator(self, integrator, nsteps):
+        """
+        Take integrator steps, printing the integrator variables if the integrator fails.
+
+        Parameters
+        ----------
+        integrator : NCMCAlchemicalIntegrator subclasses
+            NCMC switching integrator to annihilate or introduce particles alchemically.
+        nsteps : int
+            The number of steps to take
+        """
+        try:
+            integrator.step(nsteps)
+        except Exception as e:
+            print(e)
+            for index in range(integrator.getNumGlobalVariables()):
+                name = integrator.getGlobalVariableName(index)
+                val = integrator.getGlobalVariable(index)
+                print(name, val)
+            for index in range(integrator.getNumPerDofVariables()):
+                name = integrator.getPerDofVariableName(index)
+                val = integrator.getPerDofVariable(index)
+                print(name, val)
+
     def _choose_integrator(self, alchemical_system, functions, direction):
         """
         Instantiate the appropriate type of NCMC integrator, setting
@@ -387,6 +1008,9 @@ class NCMCEngine(object):
         if self.constraint_tolerance is not None:
             integrator.setConstraintTolerance(self.constraint_tolerance)
 
+        # Seed from this thread's random stream so threaded updates are reproducible.
+        integrator.setRandomNumberSeed(get_random_state().randint(np.iinfo(np.int32).max))
+
         return integrator
 
     def _create_context(self, system, integrator, positions):
@@ -413,6 +1037,22 @@ class NCMCEngine(object):
             context = openmm.Context(system, integrator, self.platform)
         else:
             context = openmm.Context(system, integrator)
+        self._initialize_context(context, integrator, positions)
+        return context
+
+    def _initialize_context(self, context, integrator, positions):
+        """
+        Set the positions of an alchemical context, and draw velocities at the engine temperature.
+
+        Parameters
+        ----------
+        context : openmm.Context
+            Alchemical context
+        itegrator : NCMCAlchemicalIntegrator subclasses
+            NCMC switching integrator bound to the context
+        positions : simtk.unit.Quantity with dimension [natoms, 3] with units of distance.
+            Positions of the atoms at the beginning of the NCMC switching.
+        """
         #print('before setpositions:')
         #print('positions', context.getState(getPositions=True).getPositions(asNumpy=True))
         #print('velocities', context.getState(getVelocities=True).getVelocities(asNumpy=True))
@@ -426,7 +1066,7 @@ class NCMCEngine(object):
         #print('velocities', context.getState(getVelocities=True).getVelocities(asNumpy=True))
         # Set velocities to temperature and apply velocity constraints.
         #print('after setVelocitiesToTemperature:')
-        context.setVelocitiesToTemperature(self.temperature)
+        context.setVelocitiesToTemperature(self.temperature, get_random_state().randint(np.iinfo(np.int32).max))
         #print('positions', context.getState(getPositions=True).getPositions(asNumpy=True))
         #print('velocities', context.getState(getVelocities=True).getVelocities(asNumpy=True))
         context.applyVelocityConstraints(integrator.getConstraintTolerance())
@@ -443,7 +1083,19 @@ class NCMCEngine(object):
         #write_file('integrator.xml', openmm.XmlSerializer.serialize(integrator))
         #write_file('state.xml', openmm.XmlSerializer.serialize(state))
 
-        return context
+    def _protocol_settings(self):
+        """
+        The settings of the engine that determine the alchemical system and the switching integrator, for cache keys.
+
+        Returns
+        -------
+        protocol_settings : tuple
+            The integrator type, number of steps, steps per propagation, timestep (in fs), temperature (in K),
+            constraint tolerance, switching functions and whether the barostat is disabled
+        """
+        return (self.integrator_type, self.nsteps, self.steps_per_propagation, self.timestep.value_in_unit(unit.femtoseconds),
+                self.temperature.value_in_unit(unit.kelvin), self.constraint_tolerance, tuple(sorted(self.functions.items())),
+                self.disable_barostat)
 
     def _get_functions(self, system):
         """
@@ -460,7 +1112,7 @@ class NCMCEngine(object):
             functions[parameter] is the function (parameterized by 't' which switched from 0 to 1) that
             controls how alchemical context parameter 'parameter' is switched
         """
-        available_parameters = self._getAvailableParameters(system)
+        available_parameters = set(self._getAvailableParameters(system))
         functions = { parameter_name : self.functions[parameter_name] for parameter_name in self.functions if (parameter_name in available_parameters) }
         return functions
 
@@ -528,12 +1180,29 @@ class NCMCEngine(object):
 
         topology, indices, system = self._choose_system_from_direction(topology_proposal, direction)
 
-        # Create alchemical system.
-        alchemical_system = self.make_alchemical_system(system, indices, direction=direction)
+        chemical_state_key = topology_proposal.old_chemical_state_key if direction == 'delete' else topology_proposal.new_chemical_state_key
 
-        functions = self._get_functions(alchemical_system)
-        integrator = self._choose_integrator(alchemical_system, functions, direction)
-        context = self._create_context(alchemical_system, integrator, initial_positions)
+        # Reuse the alchemical Context of this transition if it is cached.
+        context_entry = None
+        if self.context_cache is not None:
+            context_key = self.context_cache.make_key(chemical_state_key, direction, system, indices, self._protocol_settings())
+            context_entry = self.context_cache.get(context_key)
+
+        if context_entry is None:
+            # Create alchemical system.
+            alchemical_system = self.make_alchemical_system(system, indices, direction=direction, chemical_state_key=chemical_state_key)
+
+            functions = self._get_functions(alchemical_system)
+            integrator = self._choose_integrator(alchemical_system, functions, direction)
+            context = self._create_context(alchemical_system, integrator, initial_positions)
+            if self.context_cache is not None:
+                context_entry = AlchemicalContextCacheEntry(alchemical_system, integrator, context)
+        else:
+            alchemical_system, integrator, context = context_entry.alchemical_system, context_entry.integrator, context_entry.context
+            # A new Context would start from the default box vectors, whatever a barostat did in the last switch
+            context.setPeriodicBoxVectors(*alchemical_system.getDefaultPeriodicBoxVectors())
+            integrator.reset()
+            self._initialize_context(context, integrator, initial_positions)
 
         # Integrate switching
         final_positions, logP_work = self._integrate_switching(integrator, context, topology, indices, iteration, direction)
@@ -541,6 +1210,9 @@ class NCMCEngine(object):
         # Compute contribution from switching between real and alchemical systems in correct order
         logP_energy = self._computeEnergyContribution(integrator)
 
+        if self.context_cache is not None:
+            self.context_cache.put(context_key, context_entry)
+            self._logger.debug("Alchemical context cache statistics: %s" % str(self.context_cache.statistics))
         self._clean_up_integration(alchemical_system, context, integrator)
 
         # Return
@@ -571,7 +1243,8 @@ class NCMCHybridEngine(NCMCEngine):
                  nsteps=default_nsteps, timestep=default_timestep,
                  constraint_tolerance=None, platform=None,
                  write_ncmc_interval=None, integrator_type='GHMC',
-                 storage=None):
+                 storage=None, single_call_switching=False, work_record_interval=None,
+                 hybrid_factory_cache_size=0, context_cache_size=0, context_cache_memory=1024):
         """
         Subclass of NCMCEngine which switches directly between two different
         systems using an alchemical hybrid topology.
@@ -601,13 +1274,32 @@ class NCMCHybridEngine(NCMCEngine):
             PDB file generated for each attempt.
         integrator_type : str, optional, default='GHMC'
             NCMC internal integrator type ['GHMC', 'VV']
+        single_call_switching : bool, optional, default=False
+            If True, run the switching protocol with a single call to integrator.step(nsteps), see NCMCEngine
+        work_record_interval : int, optional, default=None
+            With single_call_switching, the interval in steps at which the accumulated work is read back, see NCMCEngine
+        hybrid_factory_cache_size : int, optional, default=0
+            If greater than 0, the HybridTopologyFactory objects of this many (old state, new state, atom map)
+            combinations are kept in a HybridTopologyFactoryCache, and only the hybrid positions are computed
+            for repeated proposals.
+        context_cache_size : int, optional, default=0
+            If greater than 0, the hybrid Contexts of this many proposals are kept in an AlchemicalContextCache
+            and reused, see NCMCEngine. Requires hybrid_factory_cache_size > 0, so that the cached Contexts
+            are bound to the cached hybrid Systems.
+        context_cache_memory : float, optional, default=1024
+            Maximum estimated device memory of the cached Contexts, in megabytes
         """
         if functions is None:
             functions = default_hybrid_functions
+        if (context_cache_size > 0) and (hybrid_factory_cache_size <= 0):
+            raise ValueError("context_cache_size requires hybrid_factory_cache_size > 0")
         super(NCMCHybridEngine, self).__init__(temperature=temperature, functions=functions, nsteps=nsteps,
                                                timestep=timestep, constraint_tolerance=constraint_tolerance,
                                                platform=platform, write_ncmc_interval=write_ncmc_interval,
-                                               storage=storage, integrator_type=integrator_type)
+                                               storage=storage, integrator_type=integrator_type,
+                                               single_call_switching=single_call_switching, work_record_interval=work_record_interval,
+                                               context_cache_size=context_cache_size, context_cache_memory=context_cache_memory)
+        self.hybrid_factory_cache = HybridTopologyFactoryCache(max_size=hybrid_factory_cache_size) if hybrid_factory_cache_size > 0 else None
 
     def make_alchemical_system(self, topology_proposal, old_positions,
                                new_positions):
@@ -646,9 +1338,9 @@ class NCMCHybridEngine(NCMCEngine):
 
         atom_map = topology_proposal.old_to_new_atom_map
 
-        #take the unique atoms as those not in the {new_atom : old_atom} atom map
-        unmodified_old_system = copy.deepcopy(topology_proposal.old_system)
-        unmodified_new_system = copy.deepcopy(topology_proposal.new_system)
+        # The hybrid factory only reads the old and new systems, so they are not copied
+        unmodified_old_system = topology_proposal.old_system
+        unmodified_new_system = topology_proposal.new_system
         old_topology = topology_proposal.old_topology
         new_topology = topology_proposal.new_topology
 
@@ -660,24 +1352,36 @@ class NCMCHybridEngine(NCMCEngine):
         #                                           old_positions,
         #                                           new_positions, atom_map)
 
-        from perses.annihilation.new_relative import HybridTopologyFactory
-        alchemical_factory = HybridTopologyFactory(topology_proposal, old_positions, new_positions)
+        # Reuse the hybrid factory of this pair of chemical states if it is cached, only computing the new positions.
+        alchemical_factory = None
+        if self.hybrid_factory_cache is not None:
+            factory_key = self.hybrid_factory_cache.make_key(topology_proposal, disable_barostat=self.disable_barostat)
+            alchemical_factory = self.hybrid_factory_cache.get(factory_key)
+
+        if alchemical_factory is None:
+            from perses.annihilation.new_relative import HybridTopologyFactory
+            alchemical_factory = HybridTopologyFactory(topology_proposal, old_positions, new_positions)
+            alchemical_positions = alchemical_factory.hybrid_positions
+
+            # Disable barostat so that it isn't used during NCMC
+            if self.disable_barostat:
+                for force in alchemical_factory.hybrid_system.getForces():
+                    if hasattr(force, 'setFrequency'):
+                        force.setFrequency(0)
+
+            if self.hybrid_factory_cache is not None:
+                self.hybrid_factory_cache.put(factory_key, alchemical_factory)
+        else:
+            alchemical_positions = alchemical_factory.compute_hybrid_positions(old_positions, new_positions)
+
         alchemical_system = alchemical_factory.hybrid_system
         final_atom_map = alchemical_factory.new_to_hybrid_atom_map
         initial_atom_map = alchemical_factory.old_to_hybrid_atom_map
-        alchemical_positions = alchemical_factory.hybrid_positions
         alchemical_topology = alchemical_factory.omm_hybrid_topology
 
-
         # Return the alchemically-modified system in fully-interacting form.
         #alchemical_system, alchemical_topology, alchemical_positions, final_atom_map, initial_atom_map = alchemical_factory.createPerturbedSystem()
 
-        # Disable barostat so that it isn't used during NCMC
-        if self.disable_barostat:
-            for force in alchemical_system.getForces():
-                if hasattr(force, 'setFrequency'):
-                    force.setFrequency(0)
-
         return [unmodified_old_system, unmodified_new_system,
                 alchemical_system, alchemical_topology, alchemical_positions, final_atom_map,
                 initial_atom_map]
@@ -727,9 +1431,28 @@ class NCMCHybridEngine(NCMCEngine):
                                             proposed_positions)
 
         indices = [initial_to_hybrid_atom_map[idx] for idx in topology_proposal.unique_old_atoms] + [final_to_hybrid_atom_map[idx] for idx in topology_proposal.unique_new_atoms]
-        functions = self._get_functions(alchemical_system)
-        integrator = self._choose_integrator(alchemical_system, functions, direction)
-        context = self._create_context(alchemical_system, integrator, alchemical_positions)
+
+        # Reuse the hybrid Context of this proposal if it is cached; it is bound to the cached hybrid System.
+        context_entry = None
+        if self.context_cache is not None:
+            hybrid_key = self.hybrid_factory_cache.make_key(topology_proposal, disable_barostat=self.disable_barostat)
+            context_key = self.context_cache.make_key(hybrid_key, direction, alchemical_system, indices, self._protocol_settings())
+            context_entry = self.context_cache.get(context_key)
+            if (context_entry is not None) and (context_entry.alchemical_system is not alchemical_system):
+                # The hybrid factory was evicted and rebuilt since the Context was cached
+                context_entry = None
+
+        if context_entry is None:
+            functions = self._get_functions(alchemical_system)
+            integrator = self._choose_integrator(alchemical_system, functions, direction)
+            context = self._create_context(alchemical_system, integrator, alchemical_positions)
+            if self.context_cache is not None:
+                context_entry = AlchemicalContextCacheEntry(alchemical_system, integrator, context)
+        else:
+            integrator, context = context_entry.integrator, context_entry.context
+            context.setPeriodicBoxVectors(*alchemical_system.getDefaultPeriodicBoxVectors())
+            integrator.reset()
+            self._initialize_context(context, integrator, alchemical_positions)
 
         final_hybrid_positions, logP_work = self._integrate_switching(integrator, context, alchemical_topology, indices, iteration, direction)
         final_positions = self._convert_hybrid_positions_to_final(final_hybrid_positions, final_to_hybrid_atom_map)
@@ -737,6 +1460,12 @@ class NCMCHybridEngine(NCMCEngine):
 
         logP_energy = self._computeEnergyContribution(integrator)
 
+        if self.context_cache is not None:
+            self.context_cache.put(context_key, context_entry)
+            self._logger.debug("Hybrid context cache statistics: %s" % str(self.context_cache.statistics))
+        if self.hybrid_factory_cache is not None:
+            self._logger.debug("Hybrid factory cache statistics: %s" % str(self.hybrid_factory_cache.statistics))
+
         self._clean_up_integration(alchemical_system, context, integrator)
 
         # Return
@@ -786,13 +1515,8 @@ class NCMCAlchemicalIntegrator(openmm.CustomIntegrator):
         self.nsteps = nsteps
 
         # Make a list of parameters in the system
-        self.system_parameters = set()
+        self.system_parameters = set(get_global_parameter_names(system))
         self.alchemical_functions = functions
-        for force_index in range(system.getNumForces()):
-            force = system.getForce(force_index)
-            if hasattr(force, 'getNumGlobalParameters'):
-                for parameter_index in range(force.getNumGlobalParameters()):
-                    self.system_parameters.add(force.getGlobalParameterName(parameter_index))
 
     def addAlchemicalResetStep(self):
         """
@@ -1090,7 +1814,8 @@ class NCMCVVAlchemicalIntegrator(NCMCAlchemicalIntegrator):
             For `insert`, the parameter 'lambda' is switched from 0 to 1.
             For `delete`, the parameter 'lambda' is switched from 1 to 0.
 
-        Note that each call to integrator.step(1) executes the entire integration program; this should not be called with more than one step.
+        Each call to integrator.step(1) takes one switching step, so integrator.step(nsteps) runs the entire protocol;
+        further steps have no effect until reset() is called.
 
         A symmetric protocol is used, in which the protocol begins and ends with a velocity Verlet step.
 
@@ -1187,7 +1912,8 @@ class NCMCGHMCAlchemicalIntegrator(NCMCAlchemicalIntegrator):
             For `insert`, the parameter 'lambda' is switched from 0 to 1.
             For `delete`, the parameter 'lambda' is switched from 1 to 0.
 
-        Note that each call to integrator.step(1) executes the entire integration program; this should not be called with more than one step.
+        Each call to integrator.step(1) takes one switching step, so integrator.step(nsteps) runs the entire protocol;
+        further steps have no effect until reset() is called.
 
         A symmetric protocol is used, in which the protocol begins and ends with a velocity Verlet step.
 
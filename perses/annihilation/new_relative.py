@@ -64,8 +64,9 @@ class HybridTopologyFactory(object):
             If functions is not None, all lambdas must be specified.
         """
         self._topology_proposal = topology_proposal
-        self._old_system = copy.deepcopy(topology_proposal.old_system)
-        self._new_system = copy.deepcopy(topology_proposal.new_system)
+        # The old and new systems are only read, so they are not copied
+        self._old_system = topology_proposal.old_system
+        self._new_system = topology_proposal.new_system
         self._old_to_hybrid_map = {}
         self._new_to_hybrid_map = {}
         self._hybrid_system_forces = dict()
@@ -1509,14 +1510,34 @@ class HybridTopologyFactory(object):
         mapped positions from the new system. This means that there is an assumption that the positions common to old
         and new are the same (which is the case for perses as-is).
 
+        Returns
+        -------
+        hybrid_positions : np.ndarray [n, 3]
+            Positions of the hybrid system, in nm
+        """
+        return self.compute_hybrid_positions(self._old_positions, self._new_positions)
+
+    def compute_hybrid_positions(self, old_positions, new_positions):
+        """
+        Compute the positions of the hybrid system from positions of the old and new systems, as for the
+        positions given to the constructor. This allows the factory to be reused for other positions of the same
+        old and new systems; the factory is left unchanged.
+
+        Parameters
+        ----------
+        old_positions : [n, 3] Quantity with units of length
+            The positions of the old system
+        new_positions : [m, 3] Quantity with units of length
+            The positions of the new system
+
         Returns
         -------
         hybrid_positions : np.ndarray [n, 3]
             Positions of the hybrid system, in nm
         """
         #get unitless positions
-        old_positions_without_units = np.array(self._old_positions.value_in_unit(unit.nanometer))
-        new_positions_without_units = np.array(self._new_positions.value_in_unit(unit.nanometer))
+        old_positions_without_units = np.array(old_positions.value_in_unit(unit.nanometer))
+        new_positions_without_units = np.array(new_positions.value_in_unit(unit.nanometer))
 
         #determine the number of particles in the system
         n_atoms_hybrid = self._hybrid_system.getNumParticles()
@@ -1 +1,2 @@
-from perses.rjmc import geometry, coordinate_numba, coordinate_tools, topology_proposal
+from perses.rjmc import geometry, coordinate_numba, coordinate_tools, topology_proposal, growth_energy, topology_view, random_state
+from perses.rjmc.coordinate_numba import warmup
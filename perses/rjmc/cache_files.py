@@ -0,0 +1,33 @@
+"""
+Files of persistent caches shared between threads and processes.
+
+Cache files are written to a uniquely named temporary file in the cache directory and then moved into place,
+so that concurrent readers never see a partial file and concurrent writers of the same entry never write
+to the same file; the last writer wins.
+"""
+import os
+import tempfile
+
+def write_cache_file(filename, write, suffix=''):
+    """
+    Write a cache file atomically.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the cache file
+    write : callable
+        write(temporary_filename) writes the contents of the cache file to temporary_filename
+    suffix : str, optional, default=''
+        Suffix of the temporary file, for writers that choose the file format from the extension
+    """
+    directory, basename = os.path.split(os.path.abspath(filename))
+    file_descriptor, temporary_filename = tempfile.mkstemp(prefix='%s.' % basename, suffix='.tmp%s' % suffix, dir=directory)
+    os.close(file_descriptor)
+    try:
+        write(temporary_filename)
+        os.replace(temporary_filename, filename)
+    except:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        raise
@@ -1,4 +1,4 @@
-from numba import jit, float64
+from numba import jit, float32, float64, void
 import numpy as np
 
 @jit(float64[:](float64[:], float64[:]), nopython=True, nogil=True, cache=True)
@@ -14,75 +14,184 @@ def _norm(a):
     n_2 = np.dot(a, a)
     return np.sqrt(n_2)
 
-@jit(float64[:,:](float64[:], float64), nopython=True, nogil=True, cache=True)
-def _rotation_matrix(axis, angle):
+@jit([void(float64[:], float64[:], float64[:], float64[:,:]),
+      void(float32[:], float32[:], float32[:], float32[:,:])], nopython=True, nogil=True, cache=True)
+def _local_frame(bond_position, angle_position, torsion_position, frame):
     """
-    This method produces a rotation matrix given an axis and an angle.
+    Compute the local frame of an atom placed from the given bond, angle and torsion atoms.
+
+    The rows of frame are set to the unit vector from the bond atom to the angle atom, the unit vector
+    perpendicular to it in the plane of the bond, angle and torsion atoms, and the unit normal of that plane.
+    The position of the atom is then
+    bond_position + r*(cos(theta)*frame[0] + sin(theta)*(-cos(phi)*frame[1] + sin(phi)*frame[2])),
+    which is the same as rotating r times the first frame vector by theta about the normal of the plane
+    and then by -(phi+pi) about the first frame vector.
+    """
+    a = angle_position - bond_position
+    b = angle_position - torsion_position
+    a_u = a / np.sqrt(np.sum(a**2))
+    b_u = b / np.sqrt(np.sum(b**2))
+    normal = np.cross(a_u, b_u)
+    normal_u = normal / np.sqrt(np.sum(normal**2))
+    frame[0, :] = a_u
+    frame[1, :] = np.cross(normal_u, a_u)
+    frame[2, :] = normal_u
+
+@jit([void(float64[:], float64[:,:], float64, float64, float64, float64, float64[:]),
+      void(float32[:], float32[:,:], float32, float32, float32, float32, float32[:])], nopython=True, nogil=True, cache=True)
+def _place_atom(bond_position, frame, r, theta, cos_phi, sin_phi, xyz):
     """
-    axis_norm = _norm(axis)
+    Set xyz to the position of the atom with the given internal coordinates in its local frame.
+    """
+    r_cos_theta = r*np.cos(theta)
+    r_sin_theta = r*np.sin(theta)
     for k in range(3):
-        axis[k] = axis[k] / axis_norm
-    axis_squared = axis**2
-    cos_angle = np.cos(angle)
-    sin_angle = np.sin(angle)
+        xyz[k] = bond_position[k] + r_cos_theta*frame[0, k] + r_sin_theta*(sin_phi*frame[2, k] - cos_phi*frame[1, k])
+
+@jit(float64[:](float64[:], float64[:], float64[:], float64[:]), nopython=True, nogil=True, cache=True)
+def internal_to_cartesian(bond_position, angle_position, torsion_position, internal_coordinates):
+    frame = np.zeros((3, 3))
+    _local_frame(bond_position, angle_position, torsion_position, frame)
+    xyz = np.zeros(3)
+    _place_atom(bond_position, frame, internal_coordinates[0], internal_coordinates[1], np.cos(internal_coordinates[2]), np.sin(internal_coordinates[2]), xyz)
+    return xyz
 
-    rotation_matrix = np.zeros((3,3), dtype=float64)
 
-    rotation_matrix[0, 0] = cos_angle + axis_squared[0]*(1.0-cos_angle)
-    rotation_matrix[0, 1] = axis[0]*axis[1]*(1.0-cos_angle) - axis[2]*sin_angle
-    rotation_matrix[0, 2] = axis[0]*axis[2]*(1.0-cos_angle) + axis[1]*sin_angle
+@jit(float64[:,:](float64[:], float64[:], float64[:], float64[:], float64[:]), nopython=True, nogil=True, cache=True)
+def torsion_scan(bond_position, angle_position, torsion_position, internal_coordinates, phi_set):
+    n_phis = len(phi_set)
+    xyzs = np.zeros((n_phis, 3))
+    frame = np.zeros((3, 3))
+    _local_frame(bond_position, angle_position, torsion_position, frame)
+    for i in range(n_phis):
+        _place_atom(bond_position, frame, internal_coordinates[0], internal_coordinates[1], np.cos(phi_set[i]), np.sin(phi_set[i]), xyzs[i])
+    return xyzs
 
-    rotation_matrix[1, 0] = axis[1]*axis[0]*(1.0-cos_angle) + axis[2]*sin_angle
-    rotation_matrix[1, 1] = cos_angle + axis_squared[1]*(1.0-cos_angle)
-    rotation_matrix[1, 2] = axis[1]*axis[2]*(1.0-cos_angle) - axis[0]*sin_angle
+@jit([void(float64[:,:], float64[:,:], float64[:,:], float64[:,:,:]),
+      void(float32[:,:], float32[:,:], float32[:,:], float32[:,:,:])], nopython=True, nogil=True, cache=True)
+def _local_frames_kernel(bond_positions, angle_positions, torsion_positions, frames):
+    for i in range(bond_positions.shape[0]):
+        _local_frame(bond_positions[i], angle_positions[i], torsion_positions[i], frames[i])
 
-    rotation_matrix[2, 0] = axis[2]*axis[0]*(1.0-cos_angle) - axis[1]*sin_angle
-    rotation_matrix[2, 1] = axis[2]*axis[1]*(1.0-cos_angle) + axis[0]*sin_angle
-    rotation_matrix[2, 2] = cos_angle + axis_squared[2]*(1.0-cos_angle)
+@jit([void(float64[:,:], float64[:,:,:], float64[:,:], float64[:,:], float64[:]),
+      void(float32[:,:], float32[:,:,:], float32[:,:], float32[:,:], float32[:])], nopython=True, nogil=True, cache=True)
+def _internal_to_cartesian_kernel(bond_positions, frames, internal_coordinates, xyzs, detJ):
+    for i in range(bond_positions.shape[0]):
+        r = internal_coordinates[i, 0]
+        theta = internal_coordinates[i, 1]
+        phi = internal_coordinates[i, 2]
+        _place_atom(bond_positions[i], frames[i], r, theta, np.cos(phi), np.sin(phi), xyzs[i])
+        detJ[i] = np.abs(r**2*np.sin(theta))
 
-    return rotation_matrix
+@jit([void(float64[:,:], float64[:,:,:], float64[:,:], float64[:,:], float64[:,:,:], float64[:]),
+      void(float32[:,:], float32[:,:,:], float32[:,:], float32[:,:], float32[:,:,:], float32[:])], nopython=True, nogil=True, cache=True)
+def _torsion_scan_kernel(bond_positions, frames, internal_coordinates, phis, xyzs, detJ):
+    for i in range(bond_positions.shape[0]):
+        r = internal_coordinates[i, 0]
+        theta = internal_coordinates[i, 1]
+        for j in range(phis.shape[1]):
+            _place_atom(bond_positions[i], frames[i], r, theta, np.cos(phis[i, j]), np.sin(phis[i, j]), xyzs[i, j])
+        detJ[i] = np.abs(r**2*np.sin(theta))
 
-@jit(float64[:](float64[:], float64[:], float64[:], float64[:]), nopython=True, nogil=True, cache=True)
-def internal_to_cartesian(bond_position, angle_position, torsion_position, internal_coordinates):
-    r = internal_coordinates[0]
-    theta = internal_coordinates[1]
-    phi = internal_coordinates[2]
-    a = angle_position - bond_position
-    b = angle_position - torsion_position
+def _kernel_dtype(array):
+    """
+    The floating point type of the batched kernels for an input array: float32 for float32 input, otherwise float64.
+    """
+    return np.float32 if np.asarray(array).dtype == np.float32 else np.float64
 
-    a_u = a / _norm(a)
-    b_u = b / _norm(b)
+def local_frames(bond_positions, angle_positions, torsion_positions):
+    """
+    Compute the local frames of many atoms, which can be reused to place each atom at any internal coordinates.
 
-    d_r = r*a_u
+    Parameters
+    ----------
+    bond_positions : np.ndarray [n, 3] of float32 or float64
+        The positions of the atoms bonded to the atoms being placed
+    angle_positions : np.ndarray [n, 3]
+        The positions of the second atoms of the angles
+    torsion_positions : np.ndarray [n, 3]
+        The positions of the third atoms of the torsions
 
-    normal = _cross_vec3(a_u, b_u)
+    Returns
+    -------
+    frames : np.ndarray [n, 3, 3], with the dtype of bond_positions
+        The local frames of the atoms
+    """
+    dtype = _kernel_dtype(bond_positions)
+    bond_positions = np.ascontiguousarray(bond_positions, dtype=dtype).reshape(-1, 3)
+    angle_positions = np.ascontiguousarray(angle_positions, dtype=dtype).reshape(-1, 3)
+    torsion_positions = np.ascontiguousarray(torsion_positions, dtype=dtype).reshape(-1, 3)
+    frames = np.zeros((bond_positions.shape[0], 3, 3), dtype=dtype)
+    _local_frames_kernel(bond_positions, angle_positions, torsion_positions, frames)
+    return frames
 
-    #construct the angle rotation matrix
-    angle_axis = normal / _norm(normal)
-    angle_rotation_matrix = _rotation_matrix(angle_axis, theta)
+def internal_to_cartesian_batch(bond_positions, frames, internal_coordinates):
+    """
+    Place many atoms at the given internal coordinates in one call.
 
-    #apply it
-    d_ang = np.dot(angle_rotation_matrix, d_r)
+    Parameters
+    ----------
+    bond_positions : np.ndarray [n, 3] of float32 or float64
+        The positions of the atoms bonded to the atoms being placed
+    frames : np.ndarray [n, 3, 3]
+        The local frames of the atoms, from local_frames
+    internal_coordinates : np.ndarray [n, 3]
+        The bond length, angle and torsion angle (r, theta, phi) of each atom
 
-    #construct the torsion rotation matrix and apply it
-    torsion_axis = a_u
-    torsion_rotation_matrix = _rotation_matrix(torsion_axis, -(phi+np.pi))
-    #apply it
-    d_torsion = np.dot(torsion_rotation_matrix, d_ang)
+    Returns
+    -------
+    xyzs : np.ndarray [n, 3], with the dtype of bond_positions
+        The cartesian coordinates of the atoms
+    detJ : np.ndarray [n]
+        The absolute value of the determinant of the Jacobian of each transformation, r**2*sin(theta)
+    """
+    dtype = _kernel_dtype(bond_positions)
+    bond_positions = np.ascontiguousarray(bond_positions, dtype=dtype).reshape(-1, 3)
+    frames = np.ascontiguousarray(frames, dtype=dtype).reshape(-1, 3, 3)
+    internal_coordinates = np.ascontiguousarray(internal_coordinates, dtype=dtype).reshape(-1, 3)
+    n_atoms = bond_positions.shape[0]
+    xyzs = np.zeros((n_atoms, 3), dtype=dtype)
+    detJ = np.zeros(n_atoms, dtype=dtype)
+    _internal_to_cartesian_kernel(bond_positions, frames, internal_coordinates, xyzs, detJ)
+    return xyzs, detJ
 
-    #add the positions of the bond atom
-    xyz = bond_position + d_torsion
-    return xyz
+def torsion_scan_batch(bond_positions, frames, r, theta, phis):
+    """
+    Place many atoms at many torsion angles in one call.
 
+    Parameters
+    ----------
+    bond_positions : np.ndarray [n, 3] of float32 or float64
+        The positions of the atoms bonded to the atoms being placed
+    frames : np.ndarray [n, 3, 3]
+        The local frames of the atoms, from local_frames
+    r : float or np.ndarray [n]
+        The bond length of each atom
+    theta : float or np.ndarray [n]
+        The bond angle of each atom
+    phis : np.ndarray [m] or [n, m]
+        The torsion angles, the same for all atoms or for each atom
 
-@jit(float64[:,:](float64[:], float64[:], float64[:], float64[:], float64[:]), nopython=True, nogil=True, cache=True)
-def torsion_scan(bond_position, angle_position, torsion_position, internal_coordinates, phi_set):
-    n_phis = len(phi_set)
-    xyzs = np.zeros((n_phis, 3))
-    for i in range(n_phis):
-        internal_coordinates[2] = phi_set[i]
-        xyzs[i] = internal_to_cartesian(bond_position, angle_position, torsion_position, internal_coordinates)
-    return xyzs
+    Returns
+    -------
+    xyzs : np.ndarray [n, m, 3], with the dtype of bond_positions
+        The cartesian coordinates of each atom at each torsion angle
+    detJ : np.ndarray [n]
+        The absolute value of the determinant of the Jacobian of each atom, which does not depend on the torsion angle
+    """
+    dtype = _kernel_dtype(bond_positions)
+    bond_positions = np.ascontiguousarray(bond_positions, dtype=dtype).reshape(-1, 3)
+    frames = np.ascontiguousarray(frames, dtype=dtype).reshape(-1, 3, 3)
+    n_atoms = bond_positions.shape[0]
+    internal_coordinates = np.zeros((n_atoms, 2), dtype=dtype)
+    internal_coordinates[:, 0] = r
+    internal_coordinates[:, 1] = theta
+    phis = np.asarray(phis, dtype=dtype)
+    phis = np.array(np.broadcast_to(phis, (n_atoms, phis.shape[-1])))
+    xyzs = np.zeros((n_atoms, phis.shape[1], 3), dtype=dtype)
+    detJ = np.zeros(n_atoms, dtype=dtype)
+    _torsion_scan_kernel(bond_positions, frames, internal_coordinates, phis, xyzs, detJ)
+    return xyzs, detJ
 
 @jit(float64(float64[:], float64[:], float64[:]), nopython=True, nogil=True, cache=True)
 def calculate_angle(atom_position, bond_position, angle_position):
@@ -138,3 +247,30 @@ def cartesian_to_internal(atom_position, bond_position, angle_position, torsion_
                 phi = -phi
 
             return np.array([r, theta, phi])
+
+def warmup():
+    """
+    Load or compile all coordinate kernels and call each of them once, so that the first geometry
+    proposal of a process does not pay for compilation.
+
+    All kernels have explicit signatures and are compiled when this module is imported, using the
+    on-disk numba cache (cache=True) when it is available. Workers can call this at startup, e.g.
+    as perses.rjmc.warmup(). The cache is written next to this module, or to NUMBA_CACHE_DIR if set.
+
+    Returns
+    -------
+    elapsed_time : float
+        The time spent calling the kernels, in seconds
+    """
+    import time
+    initial_time = time.time()
+    positions = np.array([[0.0, 0.0, 0.0], [0.15, 0.0, 0.0], [0.2, 0.14, 0.0], [0.35, 0.14, 0.05]])
+    internal_coordinates = cartesian_to_internal(positions[0], positions[1], positions[2], positions[3])
+    calculate_angle(positions[0], positions[1], positions[2])
+    internal_to_cartesian(positions[1], positions[2], positions[3], internal_coordinates)
+    torsion_scan(positions[1], positions[2], positions[3], internal_coordinates.copy(), np.linspace(-np.pi, np.pi, 4))
+    for dtype in [np.float64, np.float32]:
+        frames = local_frames(positions[1:2].astype(dtype), positions[2:3], positions[3:4])
+        internal_to_cartesian_batch(positions[1:2].astype(dtype), frames, internal_coordinates)
+        torsion_scan_batch(positions[1:2].astype(dtype), frames, internal_coordinates[0], internal_coordinates[1], np.linspace(-np.pi, np.pi, 4))
+    return time.time() - initial_time
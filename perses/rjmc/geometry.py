@@ -2,7 +2,6 @@
 This contains the base class for the geometry engine, which proposes new positions
 for each additional atom that must be added.
 """
-import parmed
 import simtk.unit as units
 import logging
 import numpy as np
@@ -15,6 +14,13 @@ import openeye.oeomega as oeomega
 import simtk.openmm.app as app
 import time
 import logging
+import threading
+import contextlib
+import concurrent.futures
+from perses.rjmc.growth_energy import GrowthSystemEnergy
+from perses.rjmc.topology_view import GeometryTorsion
+from perses.rjmc.random_state import get_random_state
+from perses.rjmc.cache_files import write_cache_file
 
 class GeometryEngine(object):
     """
@@ -72,6 +78,35 @@ class GeometryEngine(object):
         """
         return 0.0
 
+    def propose_and_logp_reverse(self, top_proposal, current_positions, beta):
+        """
+        Make a geometry proposal for the appropriate atoms, and calculate the logp of the reverse
+        proposal of the current positions of the old atoms.
+
+        The default implementation calls propose and then logp_reverse.
+
+        Arguments
+        ----------
+        top_proposal : TopologyProposal object
+            Object containing the relevant results of a topology proposal
+        current_positions : [n, 3] ndarray
+            The positions of the old system
+        beta : float
+            The inverse temperature
+
+        Returns
+        -------
+        new_positions : [n, 3] ndarray
+            The new positions of the system
+        logp_forward : float
+            The log probability of the forward-only proposal
+        logp_reverse : float
+            The log probability of the reverse proposal
+        """
+        new_positions, logp_forward = self.propose(top_proposal, current_positions, beta)
+        logp_reverse = self.logp_reverse(top_proposal, new_positions, current_positions, beta)
+        return new_positions, logp_forward, logp_reverse
+
 
 class FFAllAngleGeometryEngine(GeometryEngine):
     """
@@ -82,18 +117,89 @@ class FFAllAngleGeometryEngine(GeometryEngine):
     use_sterics : bool, optional, default=False
         If True, sterics will be used in proposals to minimize clashes.
         This may significantly slow down the simulation, however.
+    use_vectorized_energies : bool, optional, default=False
+        If True, the torsion energies are computed for all torsion divisions at once with numpy
+        from the terms involving the atom being placed, instead of setting positions in an OpenMM
+        Context for each division.
+    check_vectorized_energies : bool, optional, default=False
+        If True (and use_vectorized_energies is True), the vectorized torsion energies are also
+        computed with the OpenMM Context and an Exception is raised if they do not agree.
+    growth_system_cache_size : int, optional, default=16
+        Number of growth systems and Contexts to keep for reuse by later proposals with the same
+        chemical state and proposal order. If 0, growth systems are rebuilt for every proposal.
+    growth_system_cache_memory : float, optional, default=1024
+        Maximum estimated memory of the cached growth systems and Contexts, in megabytes
+    n_torsion_divisions : int, optional, default=360
+        Number of divisions of the torsion grid, or the finest resolution of the adaptive torsion grid
+    adaptive_torsion_grid : bool, optional, default=False
+        If True, torsions are proposed from a grid of n_coarse_torsion_divisions bins in which the probable
+        bins are refined to the resolution of n_torsion_divisions, instead of a uniform grid of n_torsion_divisions.
+        The logp is the normalized probability density on the adaptive grid.
+    n_coarse_torsion_divisions : int, optional, default=36
+        Number of divisions of the coarse adaptive torsion grid; must divide n_torsion_divisions
+    torsion_refinement_threshold : float, optional, default=1.0e-3
+        Coarse bins of the adaptive torsion grid with at least this probability are refined, with their neighbors
+    use_sterics_neighbor_list : bool, optional, default=True
+        If True (and use_sterics is True), the sterics of the growing atoms only include the particles that can come
+        within the sterics cutoff of them, found with a cell list of the positions before the proposal. Cached growth
+        systems include the neighbors within a further sterics_neighbor_padding, and are reused as long as that set
+        still contains the neighbors of later proposals; since the sterics are cut off, the energies are the same.
+        With periodic systems, minimum image distances use the default box vectors of the system, both in the
+        neighbor search and in the growth system, which are stale if the box was changed by a barostat.
+    growth_context_pool_size : int, optional, default=0
+        If greater than 0, growth systems and Contexts are kept in a GrowthContextPool of this size instead of the
+        growth system cache, and reused for any proposal order of the same atoms by updating their parameters.
+        With use_sterics_neighbor_list, pooled growth systems have the padded sterics neighbor lists of cached ones, and
+        are only reused while the environment stays within the padding; see GrowthContextPool.
+    batch_hydrogens : bool, optional, default=False
+        If True, the hydrogens bonded to the same atom (up to three) are proposed jointly as a rotor: their torsions
+        are drawn from a joint grid of n_hydrogen_rotor_divisions bins per hydrogen, with one vectorized energy
+        evaluation of all grid points, instead of one torsion scan per hydrogen. Requires use_vectorized_energies.
+    n_hydrogen_rotor_divisions : int, optional, default=10
+        Number of torsion bins of each hydrogen in the joint rotor grid
+    torsion_pmf_cache_size : int, optional, default=0
+        If greater than 0, valence-only torsion PMFs (without sterics) are memoized in a TorsionPMFCache of this size,
+        and computed at r, theta and local coordinates binned to the tolerances below. Requires use_vectorized_energies.
+    torsion_pmf_length_tolerance : float, optional, default=1.0e-3
+        Bin width of the bond lengths and local coordinates in the torsion PMF cache keys, in nm
+    torsion_pmf_angle_tolerance : float, optional, default=1.0e-2
+        Bin width of the bond angles in the torsion PMF cache keys, in radians
 
     """
-    def __init__(self, metadata=None, use_sterics=False, verbose=True):
+    def __init__(self, metadata=None, use_sterics=False, verbose=True, use_vectorized_energies=False, check_vectorized_energies=False,
+                 growth_system_cache_size=16, growth_system_cache_memory=1024, n_torsion_divisions=360,
+                 adaptive_torsion_grid=False, n_coarse_torsion_divisions=36, torsion_refinement_threshold=1.0e-3,
+                 use_sterics_neighbor_list=True, growth_context_pool_size=0, batch_hydrogens=False, n_hydrogen_rotor_divisions=10,
+                 torsion_pmf_cache_size=0, torsion_pmf_length_tolerance=1.0e-3, torsion_pmf_angle_tolerance=1.0e-2):
         self._metadata = metadata
         self.write_proposal_pdb = False # if True, will write PDB for sequential atom placements
         self.pdb_filename_prefix = 'geometry-proposal' # PDB file prefix for writing sequential atom placements
         self.nproposed = 0 # number of times self.propose() has been called
-        self._energy_time = 0.0
-        self._torsion_coordinate_time = 0.0
-        self._position_set_time = 0.0
+        self._counter_lock = threading.Lock() # guards self.nproposed when samplers share this engine across threads
+        self.profiler = None # if not None, a GeometryProfiler collecting a timing record for each proposal
+        self._profile_state = threading.local() # timing record of the proposal in progress in each thread
         self.verbose = verbose
         self.use_sterics = use_sterics
+        self.use_vectorized_energies = use_vectorized_energies
+        self.check_vectorized_energies = check_vectorized_energies
+        self.growth_system_cache = GrowthSystemCache(max_size=growth_system_cache_size, max_memory=growth_system_cache_memory)
+        self.growth_context_pool = GrowthContextPool(max_size=growth_context_pool_size, max_memory=growth_system_cache_memory) if growth_context_pool_size > 0 else None
+        if adaptive_torsion_grid and (n_torsion_divisions % n_coarse_torsion_divisions != 0):
+            raise ValueError("n_torsion_divisions (%d) must be a multiple of n_coarse_torsion_divisions (%d)." % (n_torsion_divisions, n_coarse_torsion_divisions))
+        self.n_torsion_divisions = n_torsion_divisions
+        self.adaptive_torsion_grid = adaptive_torsion_grid
+        self.n_coarse_torsion_divisions = n_coarse_torsion_divisions
+        self.torsion_refinement_threshold = torsion_refinement_threshold
+        self.use_sterics_neighbor_list = use_sterics_neighbor_list
+        if batch_hydrogens and not use_vectorized_energies:
+            raise ValueError("batch_hydrogens requires use_vectorized_energies.")
+        self.batch_hydrogens = batch_hydrogens
+        self.n_hydrogen_rotor_divisions = n_hydrogen_rotor_divisions
+        if (torsion_pmf_cache_size > 0) and not use_vectorized_energies:
+            raise ValueError("torsion_pmf_cache_size requires use_vectorized_energies.")
+        self.torsion_pmf_cache = TorsionPMFCache(max_size=torsion_pmf_cache_size, length_tolerance=torsion_pmf_length_tolerance, angle_tolerance=torsion_pmf_angle_tolerance) if torsion_pmf_cache_size > 0 else None
+        self.sterics_bond_length_n_sigma = 6.0 # bond lengths are bounded by r0 + n_sigma*sigma_r in the sterics neighbor search
+        self.sterics_neighbor_padding = 0.3 * units.nanometers # padding of the neighbor sets of cached growth systems
         self._logger = logging.getLogger("geometry")
 
     def propose(self, top_proposal, current_positions, beta):
@@ -116,12 +222,12 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         """
         current_positions = current_positions.in_units_of(units.nanometers)
         if not top_proposal.unique_new_atoms:
-            structure = parmed.openmm.load_topology(top_proposal.old_topology, top_proposal.old_system)
-            atoms_with_positions = [structure.atoms[atom_idx] for atom_idx in top_proposal.new_to_old_atom_map.keys()]
+            atoms_with_positions = top_proposal.new_topology_view.atoms(top_proposal.new_to_old_atom_map.keys())
             new_positions = self._copy_positions(atoms_with_positions, top_proposal, current_positions)
             return new_positions, 0.0
         logp_proposal, new_positions = self._logp_propose(top_proposal, current_positions, beta, direction='forward')
-        self.nproposed += 1
+        with self._counter_lock:
+            self.nproposed += 1
         return new_positions, logp_proposal
 
 
@@ -152,6 +258,52 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         logp_proposal, _ = self._logp_propose(top_proposal, old_coordinates, beta, new_positions=new_coordinates, direction='reverse')
         return logp_proposal
 
+    def propose_and_logp_reverse(self, top_proposal, current_positions, beta):
+        """
+        Make a geometry proposal for the appropriate atoms, and calculate the logp of the reverse
+        proposal of the current positions of the old atoms.
+
+        Both proposal orders are determined first, sharing the topology views and proposal plans
+        of the TopologyProposal. Since the reverse logp only depends on the old positions, the reverse
+        growth is then run in a worker thread, with its own growth system and Context, while the forward
+        proposal is made. All random numbers are drawn in the calling thread, so seeded runs are reproducible,
+        but the random number stream differs from calling propose and logp_reverse in sequence.
+
+        Arguments
+        ----------
+        top_proposal : TopologyProposal object
+            Object containing the relevant results of a topology proposal
+        current_positions : [n, 3] ndarray
+            The positions of the old system
+        beta : float
+            The inverse temperature
+
+        Returns
+        -------
+        new_positions : [n, 3] ndarray
+            The new positions of the system
+        logp_forward : float
+            The log probability of the forward-only proposal
+        logp_reverse : float
+            The log probability of the reverse proposal
+        """
+        if self.write_proposal_pdb or not (top_proposal.unique_new_atoms and top_proposal.unique_old_atoms):
+            # The debug PDB files are written with the forward positions, and there is nothing to overlap with a single direction
+            return super(FFAllAngleGeometryEngine, self).propose_and_logp_reverse(top_proposal, current_positions, beta)
+
+        current_positions = current_positions.in_units_of(units.nanometers)
+        proposal_order_tool = ProposalOrderTools(top_proposal)
+        forward_proposal_order = proposal_order_tool.determine_proposal_order(direction='forward', group_hydrogens=self.batch_hydrogens)
+        reverse_proposal_order = proposal_order_tool.determine_proposal_order(direction='reverse', group_hydrogens=self.batch_hydrogens)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            reverse_future = executor.submit(self._logp_propose, top_proposal, current_positions, beta, direction='reverse', proposal_order=reverse_proposal_order)
+            logp_forward, new_positions = self._logp_propose(top_proposal, current_positions, beta, direction='forward', proposal_order=forward_proposal_order)
+            logp_reverse, _ = reverse_future.result()
+        with self._counter_lock:
+            self.nproposed += 1
+        return new_positions, logp_forward, logp_reverse
+
     def _write_partial_pdb(self, pdbfile, topology, positions, atoms_with_positions, model_index):
         """
         Write the subset of the molecule for which positions are defined.
@@ -169,7 +321,7 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         pdbfile.flush()
         pdbfile.write('ENDMDL\n')
 
-    def _logp_propose(self, top_proposal, old_positions, beta, new_positions=None, direction='forward'):
+    def _logp_propose(self, top_proposal, old_positions, beta, new_positions=None, direction='forward', proposal_order=None):
         """
         This is an INTERNAL function that handles both the proposal and the logp calculation,
         to reduce code duplication. Whether it proposes or just calculates a logp is based on
@@ -189,6 +341,9 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             The new coordinates, if any. For proposal this is none
         direction : str
             Whether to make a proposal (forward) or just calculate logp (reverse)
+        proposal_order : tuple of (OrderedDict, float), optional
+            The atom proposal order and its logp, as returned by ProposalOrderTools.determine_proposal_order
+            for this direction. If None, the proposal order is determined here.
 
         Returns
         -------
@@ -196,34 +351,67 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             the logp of the proposal
         new_positions : [n,3] np.ndarray
             The new positions (same as input if direction='reverse')
+
+        Notes
+        -----
+        Units are only handled at entry and exit: the growth loop works with unitless
+        positions (nm), bond lengths (nm), angles (radians) and energies (kJ/mol) with beta in mol/kJ.
         """
+        from perses.rjmc import coordinate_numba
         initial_time = time.time()
-        proposal_order_tool = ProposalOrderTools(top_proposal)
-        proposal_order_time = time.time() - initial_time
+        if direction not in ['forward', 'reverse']:
+            raise ValueError("Parameter 'direction' must be forward or reverse")
+        if proposal_order is None:
+            proposal_order = ProposalOrderTools(top_proposal).determine_proposal_order(direction=direction, group_hydrogens=self.batch_hydrogens)
+        atom_proposal_order, logp_choice = proposal_order
+        profile_record = GeometryProfiler.new_record(direction)
+        profile_record['proposal_order_time'] = time.time() - initial_time
+        profile_record['n_atoms'] = len(atom_proposal_order)
+        self._profile_state.record = profile_record
         growth_parameter_name = 'growth_stage'
         if direction=="forward":
-            forward_init = time.time()
-            atom_proposal_order, logp_choice = proposal_order_tool.determine_proposal_order(direction='forward')
-            proposal_order_forward = time.time() - forward_init
-            structure = parmed.openmm.load_topology(top_proposal.new_topology, top_proposal.new_system)
+            topology_view = top_proposal.new_topology_view
 
             #find and copy known positions
-            atoms_with_positions = [structure.atoms[atom_idx] for atom_idx in top_proposal.new_to_old_atom_map.keys()]
+            atoms_with_positions = topology_view.atoms(top_proposal.new_to_old_atom_map.keys())
             new_positions = self._copy_positions(atoms_with_positions, top_proposal, old_positions)
-            system_init = time.time()
-            growth_system_generator = GeometrySystemGenerator(top_proposal.new_system, atom_proposal_order.keys(), growth_parameter_name, reference_topology=top_proposal.new_topology, use_sterics=self.use_sterics)
-            growth_system = growth_system_generator.get_modified_system()
-            growth_system_time = time.time() - system_init
-        elif direction=='reverse':
-            if new_positions is None:
+            reference_system, reference_topology = top_proposal.new_system, top_proposal.new_topology
+            chemical_state_key = top_proposal.new_chemical_state_key
+        else:
+            # The reverse logp only depends on the old positions; the new positions are only written to the debug PDB files
+            if new_positions is None and self.write_proposal_pdb:
                 raise ValueError("For reverse proposals, new_positions must not be none.")
-            atom_proposal_order, logp_choice = proposal_order_tool.determine_proposal_order(direction='reverse')
-            structure = parmed.openmm.load_topology(top_proposal.old_topology, top_proposal.old_system)
-            atoms_with_positions = [structure.atoms[atom_idx] for atom_idx in top_proposal.old_to_new_atom_map.keys()]
-            growth_system_generator = GeometrySystemGenerator(top_proposal.old_system, atom_proposal_order.keys(), growth_parameter_name, reference_topology=top_proposal.old_topology, use_sterics=self.use_sterics)
-            growth_system = growth_system_generator.get_modified_system()
+            topology_view = top_proposal.old_topology_view
+            atoms_with_positions = topology_view.atoms(top_proposal.old_to_new_atom_map.keys())
+            reference_system, reference_topology = top_proposal.old_system, top_proposal.old_topology
+            chemical_state_key = top_proposal.old_chemical_state_key
+
+        # Strip units once for the growth loop; old_positions is copied, since it must not be modified
+        beta_unitless = beta.value_in_unit(units.mole/units.kilojoule)
+        old_positions_unitless = np.array(old_positions.value_in_unit(units.nanometers), dtype=np.float64)
+        if direction == 'forward':
+            new_positions_unitless = np.array(new_positions.value_in_unit(units.nanometers), dtype=np.float64)
+            placed_positions = new_positions_unitless
         else:
-            raise ValueError("Parameter 'direction' must be forward or reverse")
+            placed_positions = old_positions_unitless
+
+        # Index the bonds and angles of the atoms being proposed, and the constraints if bond lengths will be proposed
+        term_index = GeometryTermIndex.from_view(topology_view, [atom.idx for atom in atom_proposal_order.keys()], system=reference_system if direction == 'forward' else None)
+
+        # Reuse the growth system and Context of an earlier proposal with the same proposal order, if cached,
+        # or with the same atoms in any order, if pooled. With sterics, the environment of the growing atoms
+        # is restricted to their spatial neighbors.
+        system_init = time.time()
+        use_sterics_neighbor_list = self.use_sterics and self.use_sterics_neighbor_list
+        growth_system_cache = self.growth_system_cache if self.growth_context_pool is None else self.growth_context_pool
+        growth_system_entry = self._checkout_growth_system(growth_system_cache, chemical_state_key, reference_system, reference_topology, atom_proposal_order,
+                                                           growth_parameter_name, use_sterics_neighbor_list, topology_view, atoms_with_positions, placed_positions, term_index, beta_unitless)
+        if self.growth_context_pool is not None:
+            self.growth_context_pool.reorder(growth_system_entry, list(atom_proposal_order.keys()))
+        growth_system_key = growth_system_entry.key
+        growth_system_generator = growth_system_entry.growth_system_generator
+        growth_system = growth_system_entry.growth_system
+        profile_record['system_generation_time'] = time.time() - system_init
 
         logp_proposal = logp_choice
 
@@ -254,9 +442,20 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         else:
             platform_name = 'Reference'
 
-        platform = openmm.Platform.getPlatformByName(platform_name)
-        integrator = openmm.VerletIntegrator(1*units.femtoseconds)
-        context = openmm.Context(growth_system, integrator, platform)
+        # The Context is only needed if the torsion energies are not computed with numpy, or to check them
+        if ((not self.use_vectorized_energies) or self.check_vectorized_energies) and (growth_system_entry.context is None):
+            context_init = time.time()
+            platform = openmm.Platform.getPlatformByName(platform_name)
+            growth_system_entry.integrator = openmm.VerletIntegrator(1*units.femtoseconds)
+            growth_system_entry.context = openmm.Context(growth_system, growth_system_entry.integrator, platform)
+            profile_record['context_creation_time'] = time.time() - context_init
+        context = growth_system_entry.context if ((not self.use_vectorized_energies) or self.check_vectorized_energies) else None
+        growth_energy = None
+        if self.use_vectorized_energies:
+            if growth_system_entry.growth_energy is None:
+                growth_system_entry.growth_energy = GrowthSystemEnergy(growth_system)
+            growth_energy = growth_system_entry.growth_energy
+            growth_energy.reset(placed_positions)
         growth_system_generator.set_growth_parameter_index(len(atom_proposal_order.keys())+1, context)
         debug = False
         if debug:
@@ -265,10 +464,28 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             state = context.getState(getEnergy=True)
             self._logger.debug("The potential of the valence terms is %s" % str(state.getPotentialEnergy()))
         growth_parameter_value = 1
+        # Hydrogens proposed jointly, keyed by the first hydrogen of each rotor
+        hydrogen_rotors = self._get_hydrogen_rotors(atom_proposal_order) if self.batch_hydrogens else dict()
+        rotor_atoms = set(atom.idx for rotor in hydrogen_rotors.values() for (atom, torsion) in rotor)
         #now for the main loop:
         logging.debug("There are %d new atoms" % len(atom_proposal_order.items()))
         for atom, torsion in atom_proposal_order.items():
+            if atom.idx in hydrogen_rotors:
+                rotor = hydrogen_rotors[atom.idx]
+                logp_proposal += self._propose_hydrogen_rotor_unitless(rotor, growth_parameter_value, direction, term_index, growth_energy, placed_positions, beta_unitless)
+                growth_parameter_value += len(rotor)
+                growth_system_generator.set_growth_parameter_index(growth_parameter_value-1, context=context)
+                for (rotor_atom, rotor_torsion) in rotor:
+                    atoms_with_positions.append(rotor_atom)
+                if self.write_proposal_pdb:
+                    self._write_partial_pdb(pdbfile, reference_topology, units.Quantity(placed_positions, unit=units.nanometers), atoms_with_positions, growth_parameter_value)
+                continue
+            elif atom.idx in rotor_atoms:
+                # Placed with the first hydrogen of its rotor
+                continue
             growth_system_generator.set_growth_parameter_index(growth_parameter_value, context=context)
+            if growth_energy is not None:
+                growth_energy.set_growth_stage(growth_parameter_value)
             bond_atom = torsion.atom2
             angle_atom = torsion.atom3
             torsion_atom = torsion.atom4
@@ -277,50 +494,34 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             if atom != torsion.atom1:
                 raise Exception('atom != torsion.atom1')
 
-            #get internal coordinates if direction is reverse
+            #get internal coordinates if direction is reverse, or propose a bond length and angle, and calculate their probability
             if direction=='reverse':
-                atom_coords = old_positions[atom.idx]
-                bond_coords = old_positions[bond_atom.idx]
-                angle_coords = old_positions[angle_atom.idx]
-                torsion_coords = old_positions[torsion_atom.idx]
-                internal_coordinates, detJ = self._cartesian_to_internal(atom_coords, bond_coords, angle_coords, torsion_coords)
-                r = internal_coordinates[0]*atom_coords.unit
-                theta = internal_coordinates[1]*units.radian
-                phi = internal_coordinates[2]*units.radian
-
-            bond = self._get_relevant_bond(atom, bond_atom)
-            if bond is not None:
-                if direction=='forward':
-                    r = self._propose_bond(bond, beta)
-                bond_k = bond.type.k
-                sigma_r = units.sqrt(1/(beta*bond_k))
-                logZ_r = np.log((np.sqrt(2*np.pi)*(sigma_r.value_in_unit(units.angstrom))))
-                logp_r = self._bond_logq(r, bond, beta) - logZ_r
+                internal_coordinates = coordinate_numba.cartesian_to_internal(old_positions_unitless[atom.idx], old_positions_unitless[bond_atom.idx], old_positions_unitless[angle_atom.idx], old_positions_unitless[torsion_atom.idx])
+                r, theta, phi = internal_coordinates
+                r, theta, logp_r, logp_theta = self._propose_bond_and_angle_unitless(atom, bond_atom, angle_atom, term_index, beta_unitless, r=r, theta=theta)
             else:
-                if direction == 'forward':
-                    constraint = self._get_bond_constraint(atom, bond_atom, top_proposal.new_system)
-                    if constraint is None:
-                        raise ValueError("Structure contains a topological bond [%s - %s] with no constraint or bond information." % (str(atom), str(bond_atom)))
-                    r = constraint #set bond length to exactly constraint
-                logp_r = 0.0
-
-            #propose an angle and calculate its probability
-            angle = self._get_relevant_angle(atom, bond_atom, angle_atom)
-            if direction=='forward':
-                theta = self._propose_angle(angle, beta)
-            angle_k = angle.type.k
-            sigma_theta = units.sqrt(1/(beta*angle_k))
-            logZ_theta = np.log((np.sqrt(2*np.pi)*(sigma_theta.value_in_unit(units.radians))))
-            logp_theta = self._angle_logq(theta, angle, beta) - logZ_theta
+                r, theta, logp_r, logp_theta = self._propose_bond_and_angle_unitless(atom, bond_atom, angle_atom, term_index, beta_unitless)
 
             #propose a torsion angle and calcualate its probability
             if direction=='forward':
-                phi, logp_phi = self._propose_torsion(context, torsion, new_positions, r, theta, beta, n_divisions=360)
-                xyz, detJ = self._internal_to_cartesian(new_positions[bond_atom.idx], new_positions[angle_atom.idx], new_positions[torsion_atom.idx], r, theta, phi)
-                new_positions[atom.idx] = xyz
+                if self.adaptive_torsion_grid:
+                    phi, logp_phi = self._propose_torsion_adaptive_unitless(context, torsion, new_positions_unitless, r, theta, beta_unitless, growth_energy=growth_energy)
+                else:
+                    phi, logp_phi = self._propose_torsion_unitless(context, torsion, new_positions_unitless, r, theta, beta_unitless, n_divisions=self.n_torsion_divisions, growth_energy=growth_energy)
+                frames = coordinate_numba.local_frames(new_positions_unitless[bond_atom.idx], new_positions_unitless[angle_atom.idx], new_positions_unitless[torsion_atom.idx])
+                xyzs, detJs = coordinate_numba.internal_to_cartesian_batch(new_positions_unitless[bond_atom.idx], frames, np.array([r, theta, phi]))
+                new_positions_unitless[atom.idx] = xyzs[0]
+                detJ = detJs[0]
             else:
-                old_positions_for_torsion = copy.deepcopy(old_positions)
-                logp_phi = self._torsion_logp(context, torsion, old_positions_for_torsion, r, theta, phi, beta, n_divisions=360)
+                if self.adaptive_torsion_grid:
+                    logp_phi = self._torsion_logp_adaptive_unitless(context, torsion, old_positions_unitless, r, theta, phi, beta_unitless, growth_energy=growth_energy)
+                else:
+                    logp_phi = self._torsion_logp_unitless(context, torsion, old_positions_unitless, r, theta, phi, beta_unitless, n_divisions=self.n_torsion_divisions, growth_energy=growth_energy)
+                detJ = np.abs(r**2*np.sin(theta))
+
+            # Cache the energy of the placed atom for the following growth stages
+            if growth_energy is not None:
+                growth_energy.update_fixed_energy(atom.idx, placed_positions)
 
             #accumulate logp
             if direction == 'reverse':
@@ -332,10 +533,13 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             atoms_with_positions.append(atom)
             if self.write_proposal_pdb:
                 if direction=='forward':
-                    self._write_partial_pdb(pdbfile, top_proposal.new_topology, new_positions, atoms_with_positions, growth_parameter_value)
+                    self._write_partial_pdb(pdbfile, top_proposal.new_topology, units.Quantity(new_positions_unitless, unit=units.nanometers), atoms_with_positions, growth_parameter_value)
                 else:
                     self._write_partial_pdb(pdbfile, top_proposal.old_topology, old_positions, atoms_with_positions, growth_parameter_value)
 
+        if direction == 'forward':
+            new_positions = units.Quantity(new_positions_unitless, unit=units.nanometers)
+
         if self.write_proposal_pdb:
             pdbfile.close()
             # Close proposal probability PDB file
@@ -346,14 +550,301 @@ class FFAllAngleGeometryEngine(GeometryEngine):
                 pdbfile = open('%s-final.pdb' % prefix, 'w')
                 PDBFile.writeFile(top_proposal.new_topology, new_positions, file=pdbfile)
                 pdbfile.close()
-        total_time = time.time() - initial_time
+        growth_system_cache.put(growth_system_key, growth_system_entry)
+        self._logger.debug("Growth system cache statistics: %s" % str(growth_system_cache.statistics))
+        if self.torsion_pmf_cache is not None:
+            self._logger.debug("Torsion PMF cache statistics: %s" % str(self.torsion_pmf_cache.statistics))
+        profile_record['total_time'] = time.time() - initial_time
+        self._profile_state.record = None
         if direction=='forward':
-            logging.log(logging.DEBUG, "Proposal order time: %f s | Growth system generation: %f s | Total torsion scan time %f s | Total energy computation time %f s | Position set time %f s| Total time %f s" % (proposal_order_time, growth_system_time , self._torsion_coordinate_time, self._energy_time, self._position_set_time, total_time))
-        self._torsion_coordinate_time = 0.0
-        self._energy_time = 0.0
-        self._position_set_time = 0.0
+            logging.log(logging.DEBUG, "Proposal order time: %f s | Growth system generation: %f s | Total torsion scan time %f s | Total energy computation time %f s | Position set time %f s| Total time %f s" % (profile_record['proposal_order_time'], profile_record['system_generation_time'], profile_record['torsion_scan_time'], profile_record['energy_time'], profile_record['position_set_time'], profile_record['total_time']))
+        if self.profiler is not None:
+            self.profiler.add_record(profile_record)
         return logp_proposal, new_positions
 
+    def _profile(self, field, value):
+        """
+        Add a time or count to the timing record of the proposal in progress in the calling thread, if any.
+        """
+        record = getattr(self._profile_state, 'record', None)
+        if record is not None:
+            record[field] += value
+
+    def _propose_bond_and_angle_unitless(self, atom, bond_atom, angle_atom, term_index, beta, r=None, theta=None):
+        """
+        Propose a bond length and angle for an atom from their harmonic terms, or calculate the probability of given ones.
+
+        Parameters
+        ----------
+        atom, bond_atom, angle_atom : GeometryAtom
+            The atom being placed, and the atoms defining its bond and angle
+        term_index : GeometryTermIndex
+            The index of the bonds, angles and constraints of the atoms being proposed
+        beta : float
+            Inverse temperature, in mol/kJ
+        r : float, optional, default=None
+            The bond length in nm; if None, it is proposed
+        theta : float, optional, default=None
+            The angle in radians; if None, it is proposed
+
+        Returns
+        -------
+        r, theta : float
+            The bond length (nm) and angle (radians)
+        logp_r, logp_theta : float
+            The log probability densities of the bond length and angle
+        """
+        bond = self._get_relevant_bond(atom, bond_atom, term_index)
+        if bond is not None:
+            r0, bond_k = self._get_bond_parameters(bond)
+            sigma_r = np.sqrt(1.0/(beta*bond_k))
+            if r is None:
+                r = sigma_r*get_random_state().randn() + r0
+            # The bond length density is normalized with sigma_r in angstroms, as it has always been
+            logZ_r = np.log(np.sqrt(2*np.pi)*sigma_r*10.0)
+            logp_r = -0.5*beta*bond_k*(r-r0)**2 - logZ_r
+        else:
+            if r is None:
+                constraint = self._get_bond_constraint(atom, bond_atom, term_index)
+                if constraint is None:
+                    raise ValueError("Structure contains a topological bond [%s - %s] with no constraint or bond information." % (str(atom), str(bond_atom)))
+                r = constraint.value_in_unit(units.nanometers) #set bond length to exactly constraint
+            logp_r = 0.0
+
+        angle = self._get_relevant_angle(atom, bond_atom, angle_atom, term_index)
+        theta0, angle_k = self._get_angle_parameters(angle)
+        sigma_theta = np.sqrt(1.0/(beta*angle_k))
+        if theta is None:
+            theta = sigma_theta*get_random_state().randn() + theta0
+        logZ_theta = np.log(np.sqrt(2*np.pi)*sigma_theta)
+        logp_theta = -0.5*beta*angle_k*(theta-theta0)**2 - logZ_theta
+        return r, theta, logp_r, logp_theta
+
+    # Largest number of hydrogens proposed jointly; the joint torsion grid has n_hydrogen_rotor_divisions**size points
+    _max_hydrogen_rotor_size = 3
+
+    def _get_hydrogen_rotors(self, atom_proposal_order):
+        """
+        Find the hydrogens that are proposed jointly: consecutive hydrogens in the proposal order that share
+        their bond, angle and torsion atoms, as ordered by ProposalOrderTools with group_hydrogens, in rotors
+        of at most _max_hydrogen_rotor_size hydrogens.
+
+        Returns
+        -------
+        hydrogen_rotors : dict of int : list of (GeometryAtom, GeometryTorsion)
+            The hydrogens of each rotor of two or more hydrogens, keyed by the index of its first hydrogen
+        """
+        groups = list()
+        for atom, torsion in atom_proposal_order.items():
+            torsion_atoms = (torsion.atom2.idx, torsion.atom3.idx, torsion.atom4.idx)
+            if (atom.atomic_number == 1) and groups and (groups[-1][0] == torsion_atoms) and (len(groups[-1][1]) < self._max_hydrogen_rotor_size):
+                groups[-1][1].append((atom, torsion))
+            else:
+                groups.append((torsion_atoms if atom.atomic_number == 1 else None, [(atom, torsion)]))
+        return {rotor[0][0].idx : rotor for (torsion_atoms, rotor) in groups if (torsion_atoms is not None) and (len(rotor) > 1)}
+
+    def _propose_hydrogen_rotor_unitless(self, rotor, growth_stage, direction, term_index, growth_energy, positions, beta):
+        """
+        Propose the positions of the hydrogens of a rotor jointly, or calculate the log probability of their positions.
+
+        The bond length and angle of each hydrogen are proposed as for any atom. The torsions are proposed from a grid of
+        n_hydrogen_rotor_divisions bins per hydrogen: a grid cell is chosen with probability proportional to
+        exp(-beta*U) of the hydrogens placed at the centers of its bins, and each torsion is uniform within its bin.
+        The joint density of the torsions is thus p(cell) / bin_width**n_hydrogens.
+
+        Parameters
+        ----------
+        rotor : list of (GeometryAtom, GeometryTorsion)
+            The hydrogens in proposal order, with torsions that share the bond, angle and torsion atoms
+        growth_stage : int
+            The growth stage of the first hydrogen; the others follow consecutively
+        direction : str
+            'forward' to propose the positions, 'reverse' to calculate the probability of the current positions
+        term_index : GeometryTermIndex
+            The index of the bonds, angles and constraints of the atoms being proposed
+        growth_energy : perses.rjmc.growth_energy.GrowthSystemEnergy
+            The vectorized growth system energy
+        positions : np.ndarray [n, 3] of float, in nm
+            Positions of the system; the hydrogen positions are set if direction is 'forward'
+        beta : float
+            Inverse temperature, in mol/kJ
+
+        Returns
+        -------
+        logp : float
+            The log probability density of the hydrogen positions, including the Jacobians
+        """
+        from perses.rjmc import coordinate_numba
+        n_hydrogens = len(rotor)
+        n_divisions = self.n_hydrogen_rotor_divisions
+        bin_width = 2*np.pi/n_divisions
+        bin_centers = -np.pi + bin_width*(np.arange(n_divisions) + 0.5)
+        torsion = rotor[0][1]
+        bond_position = positions[torsion.atom2.idx]
+        frames = coordinate_numba.local_frames(bond_position, positions[torsion.atom3.idx], positions[torsion.atom4.idx])
+
+        internal_coordinates = np.zeros([n_hydrogens, 3])
+        logp = 0.0
+        for hydrogen_index, (atom, hydrogen_torsion) in enumerate(rotor):
+            if direction == 'reverse':
+                r, theta, phi = coordinate_numba.cartesian_to_internal(positions[atom.idx], bond_position, positions[torsion.atom3.idx], positions[torsion.atom4.idx])
+                r, theta, logp_r, logp_theta = self._propose_bond_and_angle_unitless(atom, torsion.atom2, torsion.atom3, term_index, beta, r=r, theta=theta)
+            else:
+                r, theta, logp_r, logp_theta = self._propose_bond_and_angle_unitless(atom, torsion.atom2, torsion.atom3, term_index, beta)
+                phi = 0.0
+            internal_coordinates[hydrogen_index] = [r, theta, phi]
+            logp += logp_r + logp_theta + np.log(np.abs(r**2*np.sin(theta)))
+
+        # Positions of each hydrogen at each bin center, and the bin of each hydrogen in each grid cell
+        bin_xyzs = [coordinate_numba.torsion_scan_batch(bond_position, frames, internal_coordinates[hydrogen_index, 0], internal_coordinates[hydrogen_index, 1], bin_centers)[0][0] for hydrogen_index in range(n_hydrogens)]
+        cell_bins = np.stack([bins.ravel() for bins in np.meshgrid(*([np.arange(n_divisions)]*n_hydrogens), indexing='ij')], axis=1)
+
+        # Energy of the terms of each hydrogen at its growth stage, with the previous hydrogens of the rotor moving with it
+        energy_computation_init = time.time()
+        energies = np.zeros(len(cell_bins))
+        for hydrogen_index, (atom, hydrogen_torsion) in enumerate(rotor):
+            growth_energy.set_growth_stage(growth_stage + hydrogen_index)
+            moving_positions = {rotor[previous_index][0].idx : bin_xyzs[previous_index][cell_bins[:, previous_index]] for previous_index in range(hydrogen_index)}
+            energies += growth_energy.compute_atom_energies(atom.idx, bin_xyzs[hydrogen_index][cell_bins[:, hydrogen_index]], positions, moving_positions=moving_positions)
+        self._profile('energy_time', time.time() - energy_computation_init)
+        self._profile('n_energy_calls', n_hydrogens)
+        self._profile('n_energy_evaluations', n_hydrogens*len(cell_bins))
+        logq = -beta*energies
+        if np.all(np.isnan(logq)):
+            raise Exception("All %d hydrogen rotor energies are NaN." % len(logq))
+        logq[np.isnan(logq)] = -np.inf
+        logq -= max(logq)
+        logp_cells = logq - np.log(np.sum(np.exp(logq)))
+
+        if direction == 'forward':
+            cell_index = get_random_state().choice(len(cell_bins), p=np.exp(logp_cells))
+            internal_coordinates[:, 2] = bin_centers[cell_bins[cell_index]] + get_random_state().uniform(-bin_width/2, bin_width/2, n_hydrogens)
+            xyzs, _ = coordinate_numba.internal_to_cartesian_batch(np.tile(bond_position, (n_hydrogens, 1)), np.tile(frames, (n_hydrogens, 1, 1)), internal_coordinates)
+            for hydrogen_index, (atom, hydrogen_torsion) in enumerate(rotor):
+                positions[atom.idx] = xyzs[hydrogen_index]
+        else:
+            old_bins = np.floor((internal_coordinates[:, 2] + np.pi)/bin_width).astype(np.int64) % n_divisions
+            cell_index = np.ravel_multi_index(tuple(old_bins), (n_divisions,)*n_hydrogens)
+        logp += logp_cells[cell_index] - n_hydrogens*np.log(bin_width)
+
+        # Cache the energy of the placed hydrogens for the following growth stages
+        for hydrogen_index, (atom, hydrogen_torsion) in enumerate(rotor):
+            growth_energy.set_growth_stage(growth_stage + hydrogen_index)
+            growth_energy.update_fixed_energy(atom.idx, positions)
+        return logp
+
+    def _checkout_growth_system(self, growth_system_cache, chemical_state_key, reference_system, reference_topology, atom_proposal_order,
+                                growth_parameter_name, use_sterics_neighbor_list, topology_view, atoms_with_positions, positions, term_index, beta):
+        """
+        Check out the growth system of a proposal from a growth system cache, or create it.
+
+        If use_sterics_neighbor_list is True, a cached growth system is only used if its neighbor set still contains
+        the sterics neighbors of the growing atoms, and a new growth system gets the neighbors within a further
+        sterics_neighbor_padding, so that it can be reused while the environment moves less than the padding.
+
+        Returns
+        -------
+        growth_system_entry : GrowthSystemCacheEntry
+            The entry, whose key is the cache key to put it back with
+        """
+        growth_indices = [atom.idx for atom in atom_proposal_order.keys()]
+        positioned_indices = [atom.idx for atom in atoms_with_positions]
+        sterics_neighbor_indices = None
+        if use_sterics_neighbor_list:
+            sterics_neighbor_indices = self._get_sterics_neighbors(topology_view, reference_system, positioned_indices, growth_indices, positions, term_index, beta)
+        growth_system_key = growth_system_cache.make_key(chemical_state_key, reference_system, growth_indices, self.use_sterics, sterics_neighbor_list=use_sterics_neighbor_list)
+        growth_system_entry = growth_system_cache.get(growth_system_key)
+        if (growth_system_entry is not None) and not growth_system_entry.contains_sterics_neighbors(sterics_neighbor_indices):
+            # The environment moved out of the padded neighbor set of the cached growth system
+            growth_system_entry = None
+        if growth_system_entry is None:
+            if use_sterics_neighbor_list:
+                padding = self.sterics_neighbor_padding.value_in_unit(units.nanometers)
+                sterics_neighbor_indices = self._get_sterics_neighbors(topology_view, reference_system, positioned_indices, growth_indices, positions, term_index, beta, padding=padding)
+            growth_system_generator = GeometrySystemGenerator(reference_system, atom_proposal_order.keys(), growth_parameter_name, reference_topology=reference_topology, use_sterics=self.use_sterics, sterics_neighbor_indices=sterics_neighbor_indices)
+            growth_system_entry = GrowthSystemCacheEntry(growth_system_generator, growth_system_generator.get_modified_system(), sterics_neighbor_indices=sterics_neighbor_indices)
+        growth_system_entry.key = growth_system_key
+        return growth_system_entry
+
+    def _get_sterics_neighbors(self, topology_view, reference_system, positioned_indices, growth_indices, positions, term_index, beta, padding=0.0):
+        """
+        Find the particles that may be within the sterics cutoff of the growing atoms, with a cell list of the positioned atoms.
+
+        Each growing atom is at most (number of bonds to the nearest positioned atom) * (maximum bond length)
+        from a positioned atom bonded to a growing atom, so all particles within the cutoff of the growing atoms
+        are within the cutoff plus that distance of these anchor atoms. Bond lengths are drawn from Gaussians, so
+        the maximum bond length is a heuristic bound of r0 + sterics_bond_length_n_sigma*sigma_r over the bonds of
+        the growing atoms; with the default of 6 sigma, a bond is longer with a probability of about 1e-9. Bonds without
+        harmonic parameters have the length of their constraint, or their current length if they are not constrained.
+
+        Parameters
+        ----------
+        topology_view : perses.rjmc.topology_view.GeometryTopologyView
+            View of the topology being grown
+        reference_system : simtk.openmm.System
+            The system being grown
+        positioned_indices : list of int
+            The atoms that have positions
+        growth_indices : list of int
+            The atoms being grown
+        positions : np.ndarray [n, 3] of float
+            Positions of the system, in nm; only those of the positioned atoms are used
+        term_index : GeometryTermIndex
+            The index of the bonds and constraints of the growing atoms
+        beta : float
+            Inverse temperature, in mol/kJ, which sets the width of the bond length distributions
+        padding : float, optional, default=0.0
+            Additional search radius, in nm
+
+        Returns
+        -------
+        neighbor_indices : np.ndarray of int
+            The sorted indices of the positioned particles that may interact with the growing atoms
+        """
+        indptr, indices = topology_view.bond_graph
+        positioned_indices = np.asarray(positioned_indices, dtype=np.int64)
+        growing = np.zeros(topology_view.n_atoms, dtype=bool)
+        growing[growth_indices] = True
+        has_position = np.zeros(topology_view.n_atoms, dtype=bool)
+        has_position[positioned_indices] = True
+
+        # Anchors are positioned atoms bonded to growing atoms; the growing atoms are at most n_hops bonds away from them
+        growing_neighbors = np.concatenate([indices[indptr[atom_index]:indptr[atom_index+1]] for atom_index in growth_indices])
+        anchors = np.unique(growing_neighbors[has_position[growing_neighbors]])
+        reached = has_position.copy()
+        frontier = anchors
+        n_hops = 0
+        while not np.all(reached[growing]):
+            neighbors = np.concatenate([indices[indptr[atom_index]:indptr[atom_index+1]] for atom_index in frontier]) if len(frontier) > 0 else np.zeros(0, dtype=np.int64)
+            frontier = np.unique(neighbors[~reached[neighbors]])
+            if len(frontier) == 0:
+                raise Exception("Some growing atoms are not bonded to any atom with positions.")
+            reached[frontier] = True
+            n_hops += 1
+
+        max_bond_length = 0.0
+        for bond in term_index.bonds:
+            if bond.type is not None:
+                r0, bond_k = self._get_bond_parameters(bond)
+                bond_length = r0 + self.sterics_bond_length_n_sigma*np.sqrt(1.0/(beta*bond_k)) if bond_k > 0.0 else r0
+            else:
+                constraint = term_index.get_constraint(bond.atom1.idx, bond.atom2.idx)
+                if constraint is not None:
+                    bond_length = constraint.value_in_unit(units.nanometers)
+                else:
+                    bond_length = np.sqrt(np.sum((positions[bond.atom1.idx] - positions[bond.atom2.idx])**2))
+            max_bond_length = max(max_bond_length, bond_length)
+
+        cutoff = GeometrySystemGenerator.sterics_cutoff_distance.value_in_unit(units.nanometers)
+        radius = cutoff + n_hops*max_bond_length + padding
+        box_lengths = None
+        nonbonded_forces = [force for force in reference_system.getForces() if isinstance(force, openmm.NonbondedForce)]
+        if nonbonded_forces and nonbonded_forces[0].getNonbondedMethod() in [openmm.NonbondedForce.CutoffPeriodic, openmm.NonbondedForce.PME, openmm.NonbondedForce.Ewald]:
+            box_vectors = reference_system.getDefaultPeriodicBoxVectors()
+            box_lengths = np.array([box_vectors[i][i].value_in_unit(units.nanometers) for i in range(3)])
+        cell_list = NeighborCellList(positions[positioned_indices], radius, box_lengths=box_lengths, particle_indices=positioned_indices)
+        return cell_list.query(positions[anchors], radius)
+
     @staticmethod
     def _oemol_from_residue(res, verbose=True):
         """
@@ -423,7 +914,7 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         Copy the current positions to an array that will also hold new positions
         Parameters
         ----------
-        atoms_with_positions : list of parmed.Atom
+        atoms_with_positions : list of GeometryAtom
             atoms that currently have positions
         top_proposal : topology_proposal.TopologyProposal
             topology proposal object
@@ -435,18 +926,17 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         new_positions : np.ndarray in nm
             Array for new positions with known positions filled in
         """
-        new_positions = units.Quantity(np.zeros([top_proposal.n_atoms_new, 3]), unit=units.nanometers)
         # Workaround for CustomAngleForce NaNs: Create random non-zero positions for new atoms.
-        new_positions = units.Quantity(np.random.random([top_proposal.n_atoms_new, 3]), unit=units.nanometers)
+        new_positions = get_random_state().random([top_proposal.n_atoms_new, 3])
 
-        current_positions = current_positions.in_units_of(units.nanometers)
+        current_positions = current_positions.value_in_unit(units.nanometers)
         #copy positions
-        for atom in atoms_with_positions:
-            old_index = top_proposal.new_to_old_atom_map[atom.idx]
-            new_positions[atom.idx] = current_positions[old_index]
-        return new_positions
+        new_indices = np.array([atom.idx for atom in atoms_with_positions], dtype=np.int64)
+        old_indices = np.array([top_proposal.new_to_old_atom_map[atom_index] for atom_index in new_indices], dtype=np.int64)
+        new_positions[new_indices] = np.asarray(current_positions)[old_indices]
+        return units.Quantity(new_positions, unit=units.nanometers)
 
-    def _get_relevant_bond(self, atom1, atom2):
+    def _get_relevant_bond(self, atom1, atom2, term_index):
         """
         utility function to get the bond connecting atoms 1 and 2.
         Returns either a bond object or None
@@ -458,6 +948,8 @@ class FFAllAngleGeometryEngine(GeometryEngine):
              One of the atoms in the bond
         atom2 : parmed.atom object
              The other atom in the bond
+        term_index : GeometryTermIndex
+             Index of the bonds of the atoms being proposed
 
         Returns
         -------
@@ -465,16 +957,15 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             Bond connecting the two atoms, if there is one. None if constrained or
             no bond.
         """
-        bonds_1 = set(atom1.bonds)
-        bonds_2 = set(atom2.bonds)
-        relevant_bond_set = bonds_1.intersection(bonds_2)
-        relevant_bond = relevant_bond_set.pop()
+        relevant_bond = term_index.get_bond(atom1.idx, atom2.idx)
+        if relevant_bond is None:
+            raise Exception('Atoms %s-%s do not share a parmed Bond term' % (atom1, atom2))
         if relevant_bond.type is None:
             return None
         relevant_bond_with_units = self._add_bond_units(relevant_bond)
         return relevant_bond_with_units
 
-    def _get_bond_constraint(self, atom1, atom2, system):
+    def _get_bond_constraint(self, atom1, atom2, term_index):
         """
         Get the constraint parameters corresponding to the bond
         between the given atoms
@@ -485,44 +976,24 @@ class FFAllAngleGeometryEngine(GeometryEngine):
            the first atom of the constrained bond
         atom2 : parmed.Atom object
            the second atom of the constrained bond
-        system : openmm.System object
-           The system containing the constraint
+        term_index : GeometryTermIndex
+           Index of the constraints of the system containing the constraint
 
         Returns
         -------
         constraint : float, quantity nm
             the parameters of the bond constraint
         """
-        atom_indices = {atom1.idx, atom2.idx}
-        n_constraints = system.getNumConstraints()
-        constraint = None
-        for i in range(n_constraints):
-            constraint_parameters = system.getConstraintParameters(i)
-            constraint_atoms = set(constraint_parameters[:2])
-            if len(constraint_atoms.intersection(atom_indices))==2:
-                constraint = constraint_parameters[2]
-        return constraint
+        return term_index.get_constraint(atom1.idx, atom2.idx)
 
-    def _get_relevant_angle(self, atom1, atom2, atom3):
+    def _get_relevant_angle(self, atom1, atom2, atom3, term_index):
         """
         Get the angle containing the 3 given atoms
         """
-        atom1_angles = set(atom1.angles)
-        atom2_angles = set(atom2.angles)
-        atom3_angles = set(atom3.angles)
-        relevant_angle_set = atom1_angles.intersection(atom2_angles, atom3_angles)
-
-        # DEBUG
-        if len(relevant_angle_set) == 0:
-            print('atom1_angles:')
-            print(atom1_angles)
-            print('atom2_angles:')
-            print(atom2_angles)
-            print('atom3_angles:')
-            print(atom3_angles)
+        relevant_angle = term_index.get_angle(atom1.idx, atom2.idx, atom3.idx)
+        if relevant_angle is None:
             raise Exception('Atoms %s-%s-%s do not share a parmed Angle term' % (atom1, atom2, atom3))
 
-        relevant_angle = relevant_angle_set.pop()
         if type(relevant_angle.type.k) != units.Quantity:
             relevant_angle_with_units = self._add_angle_units(relevant_angle)
         else:
@@ -588,28 +1059,31 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         torsion.type.phase = units.Quantity(torsion.type.phase, unit=units.degree)
         return torsion
 
-    def _rotation_matrix(self, axis, angle):
+    def _get_bond_parameters(self, bond):
         """
-        This method produces a rotation matrix given an axis and an angle.
-        """
-        axis = axis/np.linalg.norm(axis)
-        axis_squared = np.square(axis)
-        cos_angle = np.cos(angle)
-        sin_angle = np.sin(angle)
-        rot_matrix_row_one = np.array([cos_angle+axis_squared[0]*(1-cos_angle),
-                                       axis[0]*axis[1]*(1-cos_angle) - axis[2]*sin_angle,
-                                       axis[0]*axis[2]*(1-cos_angle)+axis[1]*sin_angle])
+        Get the unitless parameters of a bond with units
 
-        rot_matrix_row_two = np.array([axis[1]*axis[0]*(1-cos_angle)+axis[2]*sin_angle,
-                                      cos_angle+axis_squared[1]*(1-cos_angle),
-                                      axis[1]*axis[2]*(1-cos_angle) - axis[0]*sin_angle])
+        Returns
+        -------
+        r0 : float
+            equilibrium bond length in nm
+        k : float
+            spring constant in kJ/mol/nm**2
+        """
+        return bond.type.req.value_in_unit(units.nanometers), bond.type.k.value_in_unit(units.kilojoule_per_mole/units.nanometers**2)
 
-        rot_matrix_row_three = np.array([axis[2]*axis[0]*(1-cos_angle)-axis[1]*sin_angle,
-                                        axis[2]*axis[1]*(1-cos_angle)+axis[0]*sin_angle,
-                                        cos_angle+axis_squared[2]*(1-cos_angle)])
+    def _get_angle_parameters(self, angle):
+        """
+        Get the unitless parameters of an angle with units
 
-        rotation_matrix = np.array([rot_matrix_row_one, rot_matrix_row_two, rot_matrix_row_three])
-        return rotation_matrix
+        Returns
+        -------
+        theta0 : float
+            equilibrium angle in radians
+        k : float
+            spring constant in kJ/mol/radian**2
+        """
+        return angle.type.theteq.value_in_unit(units.radians), angle.type.k.value_in_unit(units.kilojoule_per_mole/units.radians**2)
 
     def _cartesian_to_internal(self, atom_position, bond_position, angle_position, torsion_position):
         """
@@ -638,10 +1112,11 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         bond_position = bond_position.value_in_unit(units.nanometers).astype(np.float64)
         angle_position = angle_position.value_in_unit(units.nanometers).astype(np.float64)
         torsion_position = torsion_position.value_in_unit(units.nanometers).astype(np.float64)
-        xyz = coordinate_numba.internal_to_cartesian(bond_position, angle_position, torsion_position, np.array([r, theta, phi], dtype=np.float64))
-        xyz = units.Quantity(xyz, unit=units.nanometers)
+        frames = coordinate_numba.local_frames(bond_position, angle_position, torsion_position)
+        xyzs, detJs = coordinate_numba.internal_to_cartesian_batch(bond_position, frames, np.array([r, theta, phi]))
+        xyz = units.Quantity(xyzs[0], unit=units.nanometers)
 
-        return xyz, np.abs(r**2*np.sin(theta))
+        return xyz, detJs[0]
 
     def _bond_logq(self, r, bond, beta):
         """
@@ -688,7 +1163,7 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         r0 = bond.type.req
         k = bond.type.k
         sigma_r = units.sqrt(1.0/(beta*k))
-        r = sigma_r*np.random.randn() + r0
+        r = sigma_r*get_random_state().randn() + r0
         return r
 
     def _propose_angle(self, angle, beta):
@@ -698,7 +1173,7 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         theta0 = angle.type.theteq
         k = angle.type.k
         sigma_theta = units.sqrt(1.0/(beta*k))
-        theta = sigma_theta*np.random.randn() + theta0
+        theta = sigma_theta*get_random_state().randn() + theta0
         return theta
 
     def _torsion_scan(self, torsion, positions, r, theta, n_divisions=360):
@@ -722,27 +1197,58 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         phis : np.ndarray, in radians
             The torsions angles at which a potential will be calculated
         """
+        positions = positions.value_in_unit(units.nanometers).astype(np.float64)
+        xyzs, phis = self._torsion_scan_unitless(torsion, positions, r.value_in_unit(units.nanometers), theta.value_in_unit(units.radians), n_divisions=n_divisions)
+        return units.Quantity(xyzs, unit=units.nanometers), units.Quantity(phis, unit=units.radians)
+
+    def _torsion_scan_unitless(self, torsion, positions, r, theta, n_divisions=360):
+        """
+        Unitless version of _torsion_scan(): positions and r are in nm, theta in radians.
+        Only the positions of the bond, angle and torsion atoms are read.
+
+        Returns
+        -------
+        xyzs : np.ndarray [n_divisions, 3], in nm
+            The cartesian coordinates of each
+        phis : np.ndarray [n_divisions], in radians
+            The torsions angles at which a potential will be calculated
+        """
+        phis = np.arange(-np.pi, +np.pi, (2.0*np.pi)/n_divisions)
+        return self._torsion_xyzs_unitless(torsion, positions, r, theta, phis), phis
+
+    def _torsion_xyzs_unitless(self, torsion, positions, r, theta, phis):
+        """
+        Compute the cartesian coordinates of the atom being placed at each of the given torsion angles
+
+        Parameters
+        ----------
+        torsion : GeometryTorsion
+            torsion containing relevant atoms
+        positions : [n,3] np.ndarray of float, in nm
+            positions of the atoms in the system
+        r : float
+            bond length, in nm
+        theta : float
+            bond angle, in radians
+        phis : np.ndarray of float
+            torsion angles, in radians
+
+        Returns
+        -------
+        xyzs : np.ndarray [len(phis), 3], in nm
+            The cartesian coordinates at each torsion angle
+        """
         from perses.rjmc import coordinate_numba
         torsion_scan_init = time.time()
-        positions_copy = copy.deepcopy(positions)
-        positions_copy = positions_copy.value_in_unit(units.nanometers)
-        positions_copy = positions_copy.astype(np.float64)
-        r = r.value_in_unit(units.nanometers)
-        theta = theta.value_in_unit(units.radians)
-        bond_atom = torsion.atom2
-        angle_atom = torsion.atom3
-        torsion_atom = torsion.atom4
-        phis = np.arange(-np.pi, +np.pi, (2.0*np.pi)/n_divisions) # Can't use units here.
-        xyzs = coordinate_numba.torsion_scan(positions_copy[bond_atom.idx], positions_copy[angle_atom.idx], positions_copy[torsion_atom.idx], np.array([r, theta, 0.0]), phis)
-        xyzs_quantity = units.Quantity(xyzs, unit=units.nanometers) #have to put the units back now
-        phis = units.Quantity(phis, unit=units.radians)
-        torsion_scan_time = time.time() - torsion_scan_init
-        self._torsion_coordinate_time += torsion_scan_time
-        return xyzs_quantity, phis
+        frames = coordinate_numba.local_frames(positions[torsion.atom2.idx], positions[torsion.atom3.idx], positions[torsion.atom4.idx])
+        xyzs, _ = coordinate_numba.torsion_scan_batch(positions[torsion.atom2.idx], frames, r, theta, phis)
+        xyzs = xyzs[0]
+        self._profile('torsion_scan_time', time.time() - torsion_scan_init)
+        return xyzs
 
-    def _torsion_log_probability_mass_function(self, growth_context, torsion, positions, r, theta, beta, n_divisions=360):
+    def _torsion_log_probability_mass_function(self, growth_context, torsion, positions, r, theta, beta, n_divisions=360, growth_energy=None):
         """
-        Calculate the torsion logp pmf using OpenMM
+        Calculate the torsion logp pmf using OpenMM, or using numpy if growth_energy is specified
 
         Parameters
         ----------
@@ -760,6 +1266,11 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             inverse temperature
         n_divisions : int, optional
             number of divisions for the torsion scan
+        growth_energy : perses.rjmc.growth_energy.GrowthSystemEnergy, optional, default=None
+            If specified, the energies of all divisions are computed at once from the cached
+            energy of the placed atoms and the terms involving the atom being placed. If
+            check_vectorized_energies is True and a growth_context is also given, the energies
+            are compared with those from the Context.
 
         Returns
         -------
@@ -768,24 +1279,36 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         phis : np.ndarray, in radians
             The torsions angles at which a potential was calculated
         """
-        logq = np.zeros(n_divisions)
+        positions = positions.value_in_unit(units.nanometers).astype(np.float64)
+        logp_torsions, phis = self._torsion_log_probability_mass_function_unitless(growth_context, torsion, positions, r.value_in_unit(units.nanometers), theta.value_in_unit(units.radians), beta.value_in_unit(units.mole/units.kilojoule), n_divisions=n_divisions, growth_energy=growth_energy)
+        return logp_torsions, units.Quantity(phis, unit=units.radians)
+
+    def _torsion_log_probability_mass_function_unitless(self, growth_context, torsion, positions, r, theta, beta, n_divisions=360, growth_energy=None):
+        """
+        Unitless version of _torsion_log_probability_mass_function(): positions and r are in nm,
+        theta in radians and beta in mol/kJ. The positions are left unchanged.
+
+        If the engine has a torsion_pmf_cache and the PMF only depends on valence terms, the PMF is computed at the
+        binned geometry of TorsionPMFCache.make_key, or taken from the cache.
+
+        Returns
+        -------
+        logp_torsions : np.ndarray of float
+            normalized probability of each of n_divisions of torsion
+        phis : np.ndarray of float
+            The torsions angles at which a potential was calculated, in radians
+        """
         atom_idx = torsion.atom1.idx
-        xyzs, phis = self._torsion_scan(torsion, positions, r, theta, n_divisions=n_divisions)
-        xyzs = xyzs.value_in_unit_system(units.md_unit_system)
-        positions = positions.value_in_unit_system(units.md_unit_system)
-        for i, xyz in enumerate(xyzs):
-            positions[atom_idx,:] = xyz
-            position_set = time.time()
-            growth_context.setPositions(positions)
-            position_time = time.time() - position_set
-            self._position_set_time += position_time
-            energy_computation_init = time.time()
-            state = growth_context.getState(getEnergy=True)
-            potential_energy = state.getPotentialEnergy()
-            energy_computation_time = time.time() - energy_computation_init
-            self._energy_time += energy_computation_time
-            logq_i = -beta*potential_energy
-            logq[i] = logq_i
+        pmf_key = None
+        energy_positions = positions
+        if (self.torsion_pmf_cache is not None) and (growth_energy is not None) and not self.write_proposal_pdb:
+            pmf_key, energy_positions, r, theta = self.torsion_pmf_cache.make_key(growth_energy, torsion, positions, r, theta, beta, n_divisions)
+            if pmf_key is not None:
+                logp_torsions = self.torsion_pmf_cache.get(pmf_key)
+                if logp_torsions is not None:
+                    return logp_torsions, np.arange(-np.pi, +np.pi, (2.0*np.pi)/n_divisions)
+        xyzs, phis = self._torsion_scan_unitless(torsion, positions, r, theta, n_divisions=n_divisions)
+        logq = -beta*self._compute_torsion_energies(growth_context, atom_idx, xyzs, energy_positions, growth_energy=growth_energy)
 
         if np.sum(np.isnan(logq)) == n_divisions:
             raise Exception("All %d torsion energies in torsion PMF are NaN." % n_divisions)
@@ -794,6 +1317,8 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         q = np.exp(logq)
         Z = np.sum(q)
         logp_torsions = logq - np.log(Z)
+        if pmf_key is not None:
+            self.torsion_pmf_cache.put(pmf_key, logp_torsions)
 
         if hasattr(self, '_proposal_pdbfile'):
             # Write proposal probabilities to PDB file as B-factors for inert atoms
@@ -812,8 +1337,90 @@ class FFAllAngleGeometryEngine(GeometryEngine):
 
         return logp_torsions, phis
 
+    def _compute_torsion_energies(self, growth_context, atom_idx, xyzs, positions, growth_energy=None):
+        """
+        Compute the growth energy with the atom being placed at each of the given positions, with numpy
+        if growth_energy is specified (checking against the Context if requested), otherwise with the Context.
+
+        Returns
+        -------
+        energies : np.ndarray [n_positions] of float
+            The growth energy at each position, in kJ/mol
+        """
+        if growth_energy is not None:
+            energy_computation_init = time.time()
+            energies = growth_energy.compute_growth_energies(atom_idx, xyzs, positions)
+            self._profile('energy_time', time.time() - energy_computation_init)
+            self._profile('n_energy_calls', 1)
+            self._profile('n_energy_evaluations', len(xyzs))
+            if self.check_vectorized_energies and (growth_context is not None):
+                context_energies = self._compute_torsion_energies_with_context(growth_context, atom_idx, xyzs, positions)
+                self._check_vectorized_energies(energies, context_energies)
+        else:
+            energies = self._compute_torsion_energies_with_context(growth_context, atom_idx, xyzs, positions)
+        return energies
+
+    def _compute_torsion_energies_with_context(self, growth_context, atom_idx, xyzs, positions):
+        """
+        Compute the potential energy of the growth context with the atom being placed at each of the given positions
+
+        Parameters
+        ----------
+        growth_context : openmm.Context
+            Context containing the modified system
+        atom_idx : int
+            Index of the atom being placed
+        xyzs : np.ndarray [n_divisions, 3] of float, in nm
+            Positions of the atom being placed at each torsion division
+        positions : np.ndarray [n, 3] of float, in nm
+            Positions of all atoms in the system; the entry for atom_idx is restored on return
+
+        Returns
+        -------
+        energies : np.ndarray [n_divisions] of float
+            The potential energy at each torsion division, in kJ/mol
+        """
+        atom_position = np.array(positions[atom_idx])
+        energies = np.zeros(len(xyzs))
+        for i, xyz in enumerate(xyzs):
+            positions[atom_idx,:] = xyz
+            position_set = time.time()
+            growth_context.setPositions(positions)
+            self._profile('position_set_time', time.time() - position_set)
+            energy_computation_init = time.time()
+            state = growth_context.getState(getEnergy=True)
+            potential_energy = state.getPotentialEnergy()
+            self._profile('energy_time', time.time() - energy_computation_init)
+            self._profile('n_energy_calls', 1)
+            self._profile('n_energy_evaluations', 1)
+            energies[i] = potential_energy.value_in_unit(units.kilojoule_per_mole)
+        positions[atom_idx,:] = atom_position
+        return energies
+
+    def _check_vectorized_energies(self, energies, context_energies, atol=1.0e-2, rtol=1.0e-4):
+        """
+        Check that the vectorized torsion energies agree with the Context energies.
 
-    def _propose_torsion(self, growth_context, torsion, positions, r, theta, beta, n_divisions=360):
+        Parameters
+        ----------
+        energies : np.ndarray of float
+            Vectorized energies at each torsion division, in kJ/mol
+        context_energies : np.ndarray of float
+            Context energies at each torsion division, in kJ/mol
+        atol : float, optional, default=1.0e-2
+            Absolute tolerance, in kJ/mol
+        rtol : float, optional, default=1.0e-4
+            Tolerance relative to the magnitude of the Context energy
+        """
+        finite = np.isfinite(energies) & np.isfinite(context_energies)
+        if np.any(np.isfinite(energies) != np.isfinite(context_energies)):
+            raise Exception("Vectorized torsion energies and Context energies are not finite at the same torsion divisions.")
+        deviations = np.abs(context_energies[finite] - energies[finite])
+        tolerances = atol + rtol*np.abs(context_energies[finite])
+        if np.any(finite) and np.any(deviations > tolerances):
+            raise Exception("Vectorized torsion energies do not match Context energies (maximum deviation %f kJ/mol)." % np.max(deviations))
+
+    def _propose_torsion(self, growth_context, torsion, positions, r, theta, beta, n_divisions=360, growth_energy=None):
         """
         Propose a torsion using OpenMM
 
@@ -833,6 +1440,8 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             inverse temperature
         n_divisions : int, optional
             number of divisions for the torsion scan. default 360
+        growth_energy : perses.rjmc.growth_energy.GrowthSystemEnergy, optional, default=None
+            If specified, torsion energies are computed with numpy instead of the growth_context
 
         Returns
         -------
@@ -841,16 +1450,24 @@ class FFAllAngleGeometryEngine(GeometryEngine):
         logp : float
             The log probability of the proposal.
         """
-        logp_torsions, phis = self._torsion_log_probability_mass_function(growth_context, torsion, positions, r, theta, beta, n_divisions=n_divisions)
-        division = units.Quantity(2*np.pi/n_divisions, unit=units.radian)
-        phi_median_idx = np.random.choice(range(len(phis)), p=np.exp(logp_torsions))
+        positions = positions.value_in_unit(units.nanometers).astype(np.float64)
+        phi, logp = self._propose_torsion_unitless(growth_context, torsion, positions, r.value_in_unit(units.nanometers), theta.value_in_unit(units.radians), beta.value_in_unit(units.mole/units.kilojoule), n_divisions=n_divisions, growth_energy=growth_energy)
+        return units.Quantity(phi, unit=units.radian), logp
+
+    def _propose_torsion_unitless(self, growth_context, torsion, positions, r, theta, beta, n_divisions=360, growth_energy=None):
+        """
+        Unitless version of _propose_torsion(): positions and r are in nm, theta and the returned phi in radians, and beta in mol/kJ.
+        """
+        logp_torsions, phis = self._torsion_log_probability_mass_function_unitless(growth_context, torsion, positions, r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
+        division = 2*np.pi/n_divisions
+        phi_median_idx = get_random_state().choice(range(len(phis)), p=np.exp(logp_torsions))
         phi_min = phis[phi_median_idx] - division/2.0
         phi_max = phis[phi_median_idx] + division/2.0
-        phi = np.random.uniform(phi_min.value_in_unit(units.radian), phi_max.value_in_unit(units.radian))
+        phi = get_random_state().uniform(phi_min, phi_max)
         logp = logp_torsions[phi_median_idx] - np.log(2*np.pi / n_divisions) # convert from probability mass function to probability density function so that sum(dphi*p) = 1, with dphi = (2*pi)/n_divisions
-        return units.Quantity(phi, unit=units.radian), logp
+        return phi, logp
 
-    def _torsion_logp(self, growth_context, torsion, positions, r, theta, phi, beta, n_divisions=360):
+    def _torsion_logp(self, growth_context, torsion, positions, r, theta, phi, beta, n_divisions=360, growth_energy=None):
         """
         Calculate the logp of a torsion using OpenMM
 
@@ -872,17 +1489,128 @@ class FFAllAngleGeometryEngine(GeometryEngine):
             inverse temperature
         n_divisions : int, optional
             number of divisions for logp calculation. default 360.
+        growth_energy : perses.rjmc.growth_energy.GrowthSystemEnergy, optional, default=None
+            If specified, torsion energies are computed with numpy instead of the growth_context
 
         Returns
         -------
         torsion_logp : float
             the logp of this torsion
         """
-        logp_torsions, phis = self._torsion_log_probability_mass_function(growth_context, torsion, positions, r, theta, beta, n_divisions=n_divisions)
+        positions = positions.value_in_unit(units.nanometers).astype(np.float64)
+        return self._torsion_logp_unitless(growth_context, torsion, positions, r.value_in_unit(units.nanometers), theta.value_in_unit(units.radians), phi.value_in_unit(units.radians), beta.value_in_unit(units.mole/units.kilojoule), n_divisions=n_divisions, growth_energy=growth_energy)
+
+    def _torsion_logp_unitless(self, growth_context, torsion, positions, r, theta, phi, beta, n_divisions=360, growth_energy=None):
+        """
+        Unitless version of _torsion_logp(): positions and r are in nm, theta and phi in radians, and beta in mol/kJ.
+        """
+        logp_torsions, phis = self._torsion_log_probability_mass_function_unitless(growth_context, torsion, positions, r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
         phi_idx = np.argmin(np.abs(phi-phis)) # WARNING: This assumes both phi and phis have domain of [-pi,+pi)
         torsion_logp = logp_torsions[phi_idx] - np.log(2*np.pi / n_divisions) # convert from probability mass function to probability density function so that sum(dphi*p) = 1, with dphi = (2*pi)/n_divisions.
         return torsion_logp
 
+    def _adaptive_torsion_grid_unitless(self, growth_context, torsion, positions, r, theta, beta, growth_energy=None):
+        """
+        Construct an adaptive discretization of the torsion distribution.
+
+        The torsion domain [-pi, pi) is first divided into n_coarse_torsion_divisions bins, and the bins whose
+        probability exceeds torsion_refinement_threshold, together with their neighbors, are subdivided so
+        that they have the resolution of n_torsion_divisions. Each bin has the Boltzmann weight of the energy
+        at its center times its width. The grid only depends on the positions of the atoms already placed, r and theta,
+        so that the forward proposal and the reverse logp construct the same grid.
+
+        Parameters
+        ----------
+        growth_context : openmm.Context
+            Context containing the modified system
+        torsion : GeometryTorsion
+            torsion containing relevant atoms
+        positions : [n,3] np.ndarray of float, in nm
+            positions of the atoms in the system; left unchanged
+        r : float
+            bond length, in nm
+        theta : float
+            bond angle, in radians
+        beta : float
+            inverse temperature, in mol/kJ
+        growth_energy : perses.rjmc.growth_energy.GrowthSystemEnergy, optional, default=None
+            If specified, torsion energies are computed with numpy instead of the growth_context
+
+        Returns
+        -------
+        bin_edges : np.ndarray [n_bins+1] of float
+            The increasing bin edges from -pi to pi, in radians
+        logp_bins : np.ndarray [n_bins] of float
+            The normalized log probability of each bin
+        """
+        atom_idx = torsion.atom1.idx
+        n_coarse = self.n_coarse_torsion_divisions
+        refinement = self.n_torsion_divisions // n_coarse
+
+        # Coarse pass
+        coarse_edges = np.linspace(-np.pi, np.pi, n_coarse+1)
+        coarse_centers = 0.5*(coarse_edges[:-1] + coarse_edges[1:])
+        coarse_xyzs = self._torsion_xyzs_unitless(torsion, positions, r, theta, coarse_centers)
+        coarse_logq = -beta*self._compute_torsion_energies(growth_context, atom_idx, coarse_xyzs, positions, growth_energy=growth_energy)
+        coarse_logp = self._normalize_log_weights(coarse_logq)
+
+        # Refine the probable bins and their periodic neighbors
+        refine = coarse_logp >= np.log(self.torsion_refinement_threshold)
+        refine = refine | np.roll(refine, 1) | np.roll(refine, -1)
+        if refinement == 1 or not np.any(refine):
+            return coarse_edges, coarse_logp
+        fine_offsets = np.arange(refinement) * (coarse_edges[1] - coarse_edges[0]) / refinement
+        fine_edges = (coarse_edges[:-1][refine][:, np.newaxis] + fine_offsets[np.newaxis, :]).ravel()
+        fine_centers = fine_edges + 0.5*(coarse_edges[1] - coarse_edges[0]) / refinement
+        fine_xyzs = self._torsion_xyzs_unitless(torsion, positions, r, theta, fine_centers)
+        fine_logq = -beta*self._compute_torsion_energies(growth_context, atom_idx, fine_xyzs, positions, growth_energy=growth_energy)
+
+        # Merge the unrefined coarse bins and the fine bins, in order of their lower edges
+        lower_edges = np.concatenate([coarse_edges[:-1][~refine], fine_edges])
+        logq = np.concatenate([coarse_logq[~refine], fine_logq])
+        order = np.argsort(lower_edges, kind='mergesort')
+        bin_edges = np.append(lower_edges[order], np.pi)
+        logp_bins = self._normalize_log_weights(logq[order] + np.log(np.diff(bin_edges)))
+        return bin_edges, logp_bins
+
+    @staticmethod
+    def _normalize_log_weights(logq):
+        """
+        Normalize log weights, treating NaN weights as zero.
+        """
+        logq = np.array(logq, dtype=np.float64)
+        if np.all(np.isnan(logq)):
+            raise Exception("All %d torsion energies in torsion PMF are NaN." % len(logq))
+        logq[np.isnan(logq)] = -np.inf
+        logq -= np.max(logq)
+        return logq - np.log(np.sum(np.exp(logq)))
+
+    def _propose_torsion_adaptive_unitless(self, growth_context, torsion, positions, r, theta, beta, growth_energy=None):
+        """
+        Propose a torsion from the adaptive torsion grid, see _adaptive_torsion_grid_unitless().
+
+        Returns
+        -------
+        phi : float
+            The proposed torsion, in radians
+        logp : float
+            The log probability density of the proposal
+        """
+        bin_edges, logp_bins = self._adaptive_torsion_grid_unitless(growth_context, torsion, positions, r, theta, beta, growth_energy=growth_energy)
+        bin_index = get_random_state().choice(range(len(logp_bins)), p=np.exp(logp_bins))
+        phi = get_random_state().uniform(bin_edges[bin_index], bin_edges[bin_index+1])
+        logp = logp_bins[bin_index] - np.log(bin_edges[bin_index+1] - bin_edges[bin_index])
+        return phi, logp
+
+    def _torsion_logp_adaptive_unitless(self, growth_context, torsion, positions, r, theta, phi, beta, growth_energy=None):
+        """
+        Calculate the log probability density of a torsion on the adaptive torsion grid, see _adaptive_torsion_grid_unitless().
+        """
+        bin_edges, logp_bins = self._adaptive_torsion_grid_unitless(growth_context, torsion, positions, r, theta, beta, growth_energy=growth_energy)
+        phi = (phi + np.pi) % (2*np.pi) - np.pi
+        bin_index = min(max(np.searchsorted(bin_edges, phi, side='right') - 1, 0), len(logp_bins) - 1)
+        return logp_bins[bin_index] - np.log(bin_edges[bin_index+1] - bin_edges[bin_index])
+
 class PredAtomTopologyIndex(oechem.OEUnaryAtomPred):
 
     def __init__(self, topology_index):
@@ -897,364 +1625,553 @@ class PredAtomTopologyIndex(oechem.OEUnaryAtomPred):
         return False
 
 
-class BootstrapParticleFilter(object):
-    """
-    Implements a Bootstrap Particle Filter (BPF)
-    to sample from the appropriate degrees of freedom.
-    Designed for use with the dimension-matching scheme
-    of Perses.
+class GeometryTermIndex(object):
     """
+    Index of the bonds, angles and constraints needed to place atoms, so that each lookup is O(1)
+    instead of a scan over the bonds of the atoms or over all constraints of the system.
 
-    def __init__(self, growth_context, atom_torsions, initial_positions, beta, n_particles=18, resample_frequency=10):
-        """
+    Bonds and constraints are keyed by sorted atom index pairs, and angles by (min(i,k), j, max(i,k))
+    so that the central atom j stays in the middle.
 
-        Parameters
-        ----------
-        growth_context : simtk.openmm.Context object
-            Context containing appropriate "growth system"
-        atom_torsions : dict
-            parmed.Atom : parmed.Dihedral dict that specifies
-            what torsion to use to propose each atom
-        initial_positions : np.ndarray [n,3]
-            The positions of existing atoms.
-        beta : simtk.unit.Quantity
-            The inverse temperature, with units
-        n_particles : int, optional
-            The number of particles in the BPF (note that this
-            is NOT the number of atoms). Default 18.
-        resample_frequency : int, optional
-            How often to resample particles. default 10
-        """
-
-        raise NotImplementedError("The implementation of this GeometryEngine is not complete")
-        self._system = growth_context.getSystem()
-        self._beta = beta
-        self._growth_stage = 0
-        self._growth_context = growth_context
-        self._atom_torsions = atom_torsions
-        self._n_particles = n_particles
-        self._resample_frequency = resample_frequency
-        self._n_new_atoms = len(self._atom_torsions)
-        self._initial_positions = initial_positions
-        self._new_indices = [atom.idx for atom in self._atom_torsions.keys()]
-        #create a matrix for log weights (n_particles, n_stages)
-        self._Wij = np.zeros([self._n_particles, self._n_new_atoms])
-        #create an array for positions--only store new positions to avoid
-        #consuming way too much memory
-        self._new_positions = np.zeros([self._n_particles, self._n_new_atoms, 3])
-        self._generate_configurations()
+    Parameters
+    ----------
+    bonds : iterable of parmed.Bond or GeometryBond
+        The bonds to index
+    angles : iterable of parmed.Angle or GeometryAngle
+        The angles to index
+    system : simtk.openmm.System, optional, default=None
+        If specified, the constraints of this system are indexed
+    """
 
-    def _internal_to_cartesian(self, bond_position, angle_position, torsion_position, r, theta, phi):
-        """
-        Calculate the cartesian coordinates given the internal, as well as abs(detJ)
-        """
-        from perses.rjmc import coordinate_numba
-        r = r.value_in_unit(units.nanometers)
-        theta = theta.value_in_unit(units.radians)
-        phi = phi.value_in_unit(units.radians)
-        bond_position = bond_position.astype(np.float64)
-        angle_position = angle_position.astype(np.float64)
-        torsion_position = torsion_position.astype(np.float64)
-        xyz = coordinate_numba.internal_to_cartesian(bond_position, angle_position, torsion_position, np.array([r, theta, phi], dtype=np.float64))
-        return xyz, r**2*np.sin(theta)
+    def __init__(self, bonds, angles, system=None):
+        self._bonds = {self._bond_key(bond.atom1.idx, bond.atom2.idx) : bond for bond in bonds}
+        self._angles = {self._angle_key(angle.atom1.idx, angle.atom2.idx, angle.atom3.idx) : angle for angle in angles}
+        self._constraints = dict()
+        if system is not None:
+            for constraint_index in range(system.getNumConstraints()):
+                particle_index_1, particle_index_2, distance = system.getConstraintParameters(constraint_index)
+                self._constraints[self._bond_key(particle_index_1, particle_index_2)] = distance
 
-    def _get_bond_constraint(self, atom1, atom2, system):
+    @classmethod
+    def from_atoms(cls, atoms, system=None):
         """
-        Get the constraint parameters corresponding to the bond
-        between the given atoms
+        Index the bonds and angles involving the given atoms, and the constraints of the system
 
         Parameters
         ----------
-        atom1 : parmed.Atom object
-           the first atom of the constrained bond
-        atom2 : parmed.Atom object
-           the second atom of the constrained bond
-        system : openmm.System object
-           The system containing the constraint
+        atoms : iterable of parmed.Atom
+            The atoms whose bonds and angles will be looked up, usually the atoms being proposed
+        system : simtk.openmm.System, optional, default=None
+            If specified, the constraints of this system are indexed
 
         Returns
         -------
-        constraint : float, quantity nm
-            the parameters of the bond constraint
+        term_index : GeometryTermIndex
+            The index
         """
-        atom_indices = {atom1.idx, atom2.idx}
-        n_constraints = system.getNumConstraints()
-        constraint = None
-        for i in range(n_constraints):
-            constraint_parameters = system.getConstraintParameters(i)
-            constraint_atoms = set(constraint_parameters[:2])
-            if len(constraint_atoms.intersection(atom_indices))==2:
-                constraint = constraint_parameters[2]
-        return constraint
+        bonds = set()
+        angles = set()
+        for atom in atoms:
+            bonds.update(atom.bonds)
+            angles.update(atom.angles)
+        return cls(bonds, angles, system=system)
 
-    def _log_unnormalized_target(self, new_positions):
+    @classmethod
+    def from_view(cls, topology_view, atom_indices, system=None):
         """
-        Given a set of new positions (not all positions!) and a growth
-        stage, return the log unnormalized probability.
+        Index the bonds and angles involving the given atoms in a topology view, and the constraints of the system
 
         Parameters
         ----------
-        new_positions :  np.array
-            Array containing m 3D coordinates of new atoms
+        topology_view : perses.rjmc.topology_view.GeometryTopologyView
+            Array-backed view of the topology and system
+        atom_indices : list of int
+            The atoms whose bonds and angles will be indexed
+        system : simtk.openmm.System, optional, default=None
+            If specified, the constraints of this system are indexed
 
         Returns
         -------
-        log_unnormalized_probability : float
-            The unnormalized probability of this configuration
+        term_index : GeometryTermIndex
+            The index
         """
-        positions = copy.deepcopy(self._initial_positions)
-        positions[self._new_indices] = new_positions
-        self._growth_context.setParameter('growth_stage', self._growth_stage)
-        self._growth_context.setPositions(positions)
-        energy = self._growth_context.getState(getEnergy=True).getPotentialEnergy()
-        return -self._beta*energy
+        return cls(topology_view.get_bonds(atom_indices), topology_view.get_angles(atom_indices), system=system)
 
-    def _get_relevant_angle(self, atom1, atom2, atom3):
-        """
-        Get the angle containing the 3 given atoms
-        """
-        atom1_angles = set(atom1.angles)
-        atom2_angles = set(atom2.angles)
-        atom3_angles = set(atom3.angles)
-        relevant_angle_set = atom1_angles.intersection(atom2_angles, atom3_angles)
-        relevant_angle = relevant_angle_set.pop()
-        if type(relevant_angle.type.k) != units.Quantity:
-            relevant_angle_with_units = self._add_angle_units(relevant_angle)
-        else:
-            relevant_angle_with_units = relevant_angle
-        return relevant_angle_with_units
+    @staticmethod
+    def _bond_key(atom1_index, atom2_index):
+        return (atom1_index, atom2_index) if atom1_index < atom2_index else (atom2_index, atom1_index)
 
-    def _add_bond_units(self, bond):
-        """
-        Add the correct units to a harmonic bond
+    @staticmethod
+    def _angle_key(atom1_index, atom2_index, atom3_index):
+        return (atom1_index, atom2_index, atom3_index) if atom1_index < atom3_index else (atom3_index, atom2_index, atom1_index)
 
-        Arguments
-        ---------
-        bond : parmed bond object
-            The bond to get units
+    @property
+    def bonds(self):
+        """
+        The indexed bonds
+        """
+        return list(self._bonds.values())
 
-        Returns
-        -------
+    def get_bond(self, atom1_index, atom2_index):
+        """
+        Get the bond between two atoms, or None if there is none
+        """
+        return self._bonds.get(self._bond_key(atom1_index, atom2_index))
 
+    def get_angle(self, atom1_index, atom2_index, atom3_index):
         """
-        if type(bond.type.k)==units.Quantity:
-            return bond
-        bond.type.req = units.Quantity(bond.type.req, unit=units.angstrom)
-        bond.type.k = units.Quantity(2.0*bond.type.k, unit=units.kilocalorie_per_mole/units.angstrom**2)
-        return bond
+        Get the angle atom1-atom2-atom3 centered on atom2, or None if there is none
+        """
+        return self._angles.get(self._angle_key(atom1_index, atom2_index, atom3_index))
 
-    def _add_angle_units(self, angle):
+    def get_constraint(self, atom1_index, atom2_index):
         """
-        Add the correct units to a harmonic angle
+        Get the distance of the constraint between two atoms, or None if there is none
+        """
+        return self._constraints.get(self._bond_key(atom1_index, atom2_index))
 
-        Arguments
-        ----------
-        angle : parmed angle object
-             the angle to get unit-ed
 
-        Returns
-        -------
-        angle_with_units : parmed angle
-            The angle, but with units on its parameters
-        """
-        if type(angle.type.k)==units.Quantity:
-            return angle
-        angle.type.theteq = units.Quantity(angle.type.theteq, unit=units.degree)
-        angle.type.k = units.Quantity(2.0*angle.type.k, unit=units.kilocalorie_per_mole/units.radian**2)
-        return angle
+class BootstrapParticleFilter(FFAllAngleGeometryEngine):
+    """
+    Implements a Bootstrap Particle Filter (BPF), a sequential Monte Carlo (SMC) geometry engine
+    that samples the degrees of freedom of the new atoms with a population of particles.
+    Designed for use with the dimension-matching scheme of Perses.
+
+    The new atoms are grown in the same proposal order and with the same growth system as
+    FFAllAngleGeometryEngine. At each growth stage, every particle places the next atom with a
+    bond length and angle drawn from their harmonic distributions and a uniform torsion, and is
+    reweighted by the Boltzmann factor of the growth-system terms that become active. The positions
+    of the new atoms of all particles are carried as a single [n_particles, n_new_atoms, 3] array,
+    and the energies of all particles are evaluated in one batched call to GrowthSystemEnergy.
+    Particles are resampled with systematic resampling when the effective sample size falls below
+    resampling_threshold*n_particles.
+
+    The forward proposal returns one particle chosen according to the final weights, and the log
+    probability log pi(x_new) - log Z_hat, where pi is the unnormalized growth target and Z_hat the
+    SMC estimate of its normalizing constant. The reverse log probability is computed in the same way
+    with a conditional SMC in which the first particle is fixed to the old positions. With a single
+    particle, this reduces to the log probability of the bootstrap proposal itself.
 
-    def _get_relevant_bond(self, atom1, atom2):
-        """
-        utility function to get the bond connecting atoms 1 and 2.
-        Returns either a bond object or None
-        (since there is no constraint class)
+    Parameters
+    ----------
+    n_particles : int, optional, default=32
+        The number of particles in the BPF (note that this is NOT the number of atoms)
+    resampling_threshold : float, optional, default=0.5
+        Particles are resampled when the effective sample size is below this fraction of n_particles
+    n_workers : int, optional, default=1
+        Number of threads among which the particle energies are split at each growth stage
+    use_sterics : bool, optional, default=False
+        If True, sterics will be included in the growth target
+    growth_system_cache_size : int, optional, default=16
+        Number of growth systems to keep for reuse by later proposals
+    growth_system_cache_memory : float, optional, default=1024
+        Maximum estimated memory of the cached growth systems, in megabytes
+    use_sterics_neighbor_list : bool, optional, default=True
+        If True (and use_sterics is True), the sterics of the growing atoms only include their spatial neighbors
+    """
 
-        Arguments
-        ---------
-        atom1 : parmed atom object
-             One of the atoms in the bond
-        atom2 : parmed.atom object
-             The other atom in the bond
+    def __init__(self, metadata=None, n_particles=32, resampling_threshold=0.5, n_workers=1, use_sterics=False, verbose=True,
+                 growth_system_cache_size=16, growth_system_cache_memory=1024, use_sterics_neighbor_list=True):
+        super(BootstrapParticleFilter, self).__init__(metadata=metadata, use_sterics=use_sterics, verbose=verbose, use_vectorized_energies=True,
+                                                      growth_system_cache_size=growth_system_cache_size, growth_system_cache_memory=growth_system_cache_memory,
+                                                      use_sterics_neighbor_list=use_sterics_neighbor_list)
+        if n_particles < 1:
+            raise ValueError("n_particles must be at least 1")
+        self.n_particles = n_particles
+        self.resampling_threshold = resampling_threshold
+        self.n_workers = n_workers
 
-        Returns
-        -------
-        relevant_bond_with_units : parmed.Bond
-            Bond connecting the two atoms, if there is one. None if constrained or
-            no bond.
+    def propose_and_logp_reverse(self, top_proposal, current_positions, beta):
         """
-        bonds_1 = set(atom1.bonds)
-        bonds_2 = set(atom2.bonds)
-        relevant_bond_set = bonds_1.intersection(bonds_2)
-        relevant_bond = relevant_bond_set.pop()
-        if relevant_bond.type is None:
-            return None
-        relevant_bond_with_units = self._add_bond_units(relevant_bond)
-        return relevant_bond_with_units
+        Make a geometry proposal and calculate the logp of the reverse proposal, one after the other.
 
-    def _bond_logq(self, r, bond):
+        Both directions draw random numbers, so they are not run concurrently as in FFAllAngleGeometryEngine.
         """
-        Calculate the log-probability of a given bond at a given inverse temperature
+        return GeometryEngine.propose_and_logp_reverse(self, top_proposal, current_positions, beta)
 
-        Arguments
-        ---------
-        r : float
-            bond length, in nanometers
-        r0 : float
-            equilibrium bond length, in nanometers
-        k_eq : float
-            Spring constant of bond
-        beta : simtk.unit.Quantity
-            1/kT or inverse temperature
+    def _logp_propose(self, top_proposal, old_positions, beta, new_positions=None, direction='forward', proposal_order=None):
         """
-        k_eq = bond.type.k
-        r0 = bond.type.req
-        logq = -self._beta*0.5*k_eq*(r-r0)**2
-        return logq
-
-    def _angle_logq(self, theta, angle):
+        Run the particle filter to make a proposal (forward) or a conditional particle filter to calculate the logp
+        of the old positions (reverse). The arguments and return values are the same as for FFAllAngleGeometryEngine.
         """
-        Calculate the log-probability of a given bond at a given inverse temperature
+        from perses.rjmc import coordinate_numba
+        initial_time = time.time()
+        if direction not in ['forward', 'reverse']:
+            raise ValueError("Parameter 'direction' must be forward or reverse")
+        if proposal_order is None:
+            proposal_order = ProposalOrderTools(top_proposal).determine_proposal_order(direction=direction)
+        atom_proposal_order, logp_choice = proposal_order
+        profile_record = GeometryProfiler.new_record(direction)
+        profile_record['proposal_order_time'] = time.time() - initial_time
+        profile_record['n_atoms'] = len(atom_proposal_order)
+        self._profile_state.record = profile_record
+        if direction == 'forward':
+            topology_view = top_proposal.new_topology_view
+            atoms_with_positions = topology_view.atoms(top_proposal.new_to_old_atom_map.keys())
+            new_positions = self._copy_positions(atoms_with_positions, top_proposal, old_positions)
+            reference_system, reference_topology = top_proposal.new_system, top_proposal.new_topology
+            chemical_state_key = top_proposal.new_chemical_state_key
+        else:
+            topology_view = top_proposal.old_topology_view
+            atoms_with_positions = topology_view.atoms(top_proposal.old_to_new_atom_map.keys())
+            reference_system, reference_topology = top_proposal.old_system, top_proposal.old_topology
+            chemical_state_key = top_proposal.old_chemical_state_key
+
+        beta_unitless = beta.value_in_unit(units.mole/units.kilojoule)
+        old_positions_unitless = np.array(old_positions.value_in_unit(units.nanometers), dtype=np.float64)
+        if direction == 'forward':
+            new_positions_unitless = np.array(new_positions.value_in_unit(units.nanometers), dtype=np.float64)
+            base_positions = new_positions_unitless
+        else:
+            base_positions = old_positions_unitless
+
+        # The constraints are needed in both directions, since the other particles of the reverse filter propose bond lengths
+        growth_indices = [atom.idx for atom in atom_proposal_order.keys()]
+        term_index = GeometryTermIndex.from_view(topology_view, growth_indices, system=reference_system)
+
+        system_init = time.time()
+        use_sterics_neighbor_list = self.use_sterics and self.use_sterics_neighbor_list
+        growth_system_entry = self._checkout_growth_system(self.growth_system_cache, chemical_state_key, reference_system, reference_topology, atom_proposal_order,
+                                                           'growth_stage', use_sterics_neighbor_list, topology_view, atoms_with_positions, base_positions, term_index, beta_unitless)
+        growth_system_key = growth_system_entry.key
+        if growth_system_entry.growth_energy is None:
+            growth_system_entry.growth_energy = GrowthSystemEnergy(growth_system_entry.growth_system)
+        growth_energy = growth_system_entry.growth_energy
+        growth_energy.reset(base_positions)
+        profile_record['system_generation_time'] = time.time() - system_init
+
+        n_particles = self.n_particles
+        n_new_atoms = len(growth_indices)
+        new_atom_slots = {atom_index : slot for slot, atom_index in enumerate(growth_indices)}
+        particle_positions = np.zeros([n_particles, n_new_atoms, 3])
+        log_target = np.zeros(n_particles)
+        log_weights = np.full(n_particles, -np.log(n_particles))
+        log_normalizing_constant = 0.0
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.n_workers) if self.n_workers > 1 else None
+        try:
+            for growth_stage, (atom, torsion) in enumerate(atom_proposal_order.items(), 1):
+                growth_energy.set_growth_stage(growth_stage)
+                if atom != torsion.atom1:
+                    raise Exception('atom != torsion.atom1')
+                bond_atom = torsion.atom2
+                angle_atom = torsion.atom3
+                torsion_atom = torsion.atom4
+
+                bond = self._get_relevant_bond(atom, bond_atom, term_index)
+                if bond is not None:
+                    r0, bond_k = self._get_bond_parameters(bond)
+                    sigma_r = np.sqrt(1.0/(beta_unitless*bond_k))
+                    r = sigma_r*get_random_state().randn(n_particles) + r0
+                else:
+                    constraint = self._get_bond_constraint(atom, bond_atom, term_index)
+                    if constraint is None:
+                        raise ValueError("Structure contains a topological bond [%s - %s] with no constraint or bond information." % (str(atom), str(bond_atom)))
+                    r = np.full(n_particles, constraint.value_in_unit(units.nanometers))
+                angle = self._get_relevant_angle(atom, bond_atom, angle_atom, term_index)
+                theta0, angle_k = self._get_angle_parameters(angle)
+                sigma_theta = np.sqrt(1.0/(beta_unitless*angle_k))
+                theta = sigma_theta*get_random_state().randn(n_particles) + theta0
+                phi = get_random_state().uniform(-np.pi, np.pi, n_particles)
+
+                if direction == 'reverse':
+                    # The first particle follows the old positions
+                    r_old, theta_old, phi_old = coordinate_numba.cartesian_to_internal(old_positions_unitless[atom.idx], old_positions_unitless[bond_atom.idx], old_positions_unitless[angle_atom.idx], old_positions_unitless[torsion_atom.idx])
+                    r[0], theta[0], phi[0] = r_old, theta_old, phi_old
+
+                # The bond length density is normalized with sigma_r in angstroms, as in FFAllAngleGeometryEngine
+                logp_r = -0.5*beta_unitless*bond_k*(r-r0)**2 - np.log(np.sqrt(2*np.pi)*sigma_r*10.0) if bond is not None else np.zeros(n_particles)
+                logp_theta = -0.5*beta_unitless*angle_k*(theta-theta0)**2 - np.log(np.sqrt(2*np.pi)*sigma_theta)
+                logp_phi = -np.log(2*np.pi)
+
+                # Place the atom in all particles at once
+                placement_init = time.time()
+                bond_positions = self._particle_atom_positions(bond_atom.idx, base_positions, particle_positions, new_atom_slots)
+                frames = coordinate_numba.local_frames(bond_positions, self._particle_atom_positions(angle_atom.idx, base_positions, particle_positions, new_atom_slots), self._particle_atom_positions(torsion_atom.idx, base_positions, particle_positions, new_atom_slots))
+                xyzs, detJ = coordinate_numba.internal_to_cartesian_batch(bond_positions, frames, np.stack([r, theta, phi], axis=1))
+                if direction == 'reverse':
+                    xyzs[0] = old_positions_unitless[atom.idx]
+                particle_positions[:, new_atom_slots[atom.idx]] = xyzs
+                log_proposal = logp_r + logp_theta + logp_phi + np.log(detJ)
+                self._profile('torsion_scan_time', time.time() - placement_init)
+
+                # Reweight by the growth-system terms that become active at this stage
+                energy_computation_init = time.time()
+                log_target_increment = -beta_unitless*self._compute_particle_energies(growth_energy, atom.idx, base_positions, particle_positions, growth_indices, executor)
+                self._profile('energy_time', time.time() - energy_computation_init)
+                self._profile('n_energy_calls', 1)
+                self._profile('n_energy_evaluations', n_particles)
+                log_target += log_target_increment
+                log_weights += log_target_increment - log_proposal
+                log_weights_sum = self._log_sum_exp(log_weights)
+                if not np.isfinite(log_weights_sum):
+                    raise Exception("All particles have zero weight after placing atom %s" % str(atom))
+                log_normalizing_constant += log_weights_sum
+                log_weights -= log_weights_sum
+
+                effective_sample_size = 1.0/np.sum(np.exp(2*log_weights))
+                if (growth_stage < n_new_atoms) and (effective_sample_size < self.resampling_threshold*n_particles):
+                    ancestors = self._systematic_resample(np.exp(log_weights), conditional=(direction == 'reverse'))
+                    particle_positions = particle_positions[ancestors]
+                    log_target = log_target[ancestors]
+                    log_weights = np.full(n_particles, -np.log(n_particles))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if direction == 'forward':
+            weights = np.exp(log_weights)
+            particle_index = get_random_state().choice(n_particles, p=weights/np.sum(weights))
+            new_positions_unitless[growth_indices] = particle_positions[particle_index]
+            new_positions = units.Quantity(new_positions_unitless, unit=units.nanometers)
+        else:
+            particle_index = 0
+        logp_proposal = logp_choice + log_target[particle_index] - log_normalizing_constant
+        self.growth_system_cache.put(growth_system_key, growth_system_entry)
+        profile_record['total_time'] = time.time() - initial_time
+        self._profile_state.record = None
+        if self.profiler is not None:
+            self.profiler.add_record(profile_record)
+        return logp_proposal, new_positions
 
-        Arguments
-        ---------
-        theta : float
-            bond angle, in randians
-        angle : parmed angle object
-            Bond angle object containing parameters
-        beta : simtk.unit.Quantity
-            1/kT or inverse temperature
+    @staticmethod
+    def _particle_atom_positions(atom_index, base_positions, particle_positions, new_atom_slots):
         """
-        k_eq = angle.type.k
-        theta0 = angle.type.theteq
-        logq = -self._beta*k_eq*0.5*(theta-theta0)**2
-        return logq
+        Get the positions of an atom in all particles, [n_particles, 3], from the particles if it is a new atom
+        """
+        if atom_index in new_atom_slots:
+            return particle_positions[:, new_atom_slots[atom_index]]
+        return np.broadcast_to(base_positions[atom_index], (particle_positions.shape[0], 3))
 
-    def _propose_bond(self, bond):
+    def _compute_particle_energies(self, growth_energy, atom_index, base_positions, particle_positions, growth_indices, executor=None):
         """
-        Bond length proposal
+        Compute the energy of the active terms of atom_index in each particle, split among threads if an executor is given.
+
+        Returns
+        -------
+        energies : np.ndarray [n_particles] of float, in kJ/mol
         """
-        r0 = bond.type.req
-        k = bond.type.k
-        sigma_r = units.sqrt(1.0/(self._beta*k))
-        r = sigma_r*np.random.randn() + r0
-        return r
+        # The environment is shared by all particles, so only the new atoms of each particle are passed, as moving atoms
+        atom_slot = list(growth_indices).index(atom_index)
+        def compute_energies(particle_indices):
+            moving_positions = {other_index : particle_positions[particle_indices, slot] for slot, other_index in enumerate(growth_indices) if slot != atom_slot}
+            return growth_energy.compute_atom_energies(atom_index, particle_positions[particle_indices, atom_slot], base_positions, moving_positions=moving_positions)
+
+        n_particles = particle_positions.shape[0]
+        if executor is None:
+            return compute_energies(np.arange(n_particles))
+        chunks = np.array_split(np.arange(n_particles), min(self.n_workers, n_particles))
+        return np.concatenate(list(executor.map(compute_energies, chunks)))
 
-    def _propose_angle(self, angle):
+    @staticmethod
+    def _log_sum_exp(log_values):
         """
-        Bond angle proposal
+        Compute log(sum(exp(log_values))) without overflow
         """
-        theta0 = angle.type.theteq
-        k = angle.type.k
-        sigma_theta = units.sqrt(1.0/(self._beta*k))
-        theta = sigma_theta*np.random.randn() + theta0
-        return theta
+        max_log_value = np.max(log_values)
+        if not np.isfinite(max_log_value):
+            return max_log_value
+        return max_log_value + np.log(np.sum(np.exp(log_values - max_log_value)))
 
-    def _propose_atom(self, atom, torsion, new_positions):
+    @staticmethod
+    def _systematic_resample(weights, conditional=False):
         """
-        Propose a set of internal coordinates (r, theta, phi) and transform
-        to cartesian coordinates (with jacobian correction).
-        for the given atom. R and theta are drawn from their respective
-        equilibrium distributions, whereas phi is simply a uniform sample.
+        Draw the ancestors of the particles with systematic resampling.
 
         Parameters
         ----------
-        atom : parmed.Atom
-            atom that will have its position proposed
-        torsion : parmed.Dihedral
-            torsion that contains relevant information for atom
-        new_positions : [m, 3] np.array
-            array of just the new positions (not existing atoms)
+        weights : np.ndarray [n_particles] of float
+            The normalized weights of the particles
+        conditional : bool, optional, default=False
+            If True, the first particle is kept as its own ancestor, and the other ancestors are drawn
+            from their distribution given that the first particle is one of the ancestors (conditional SMC)
+
         Returns
         -------
-        xyz : [1,3] np.array of float
-            The proposed cartesian coordinates
-        logp : float
-            The log probability with jacobian correction
-        """
-        positions = copy.deepcopy(self._initial_positions)
-        positions[self._new_indices] = new_positions
-        bond_atom = torsion.atom2
-        angle_atom = torsion.atom3
-        torsion_atom = torsion.atom4
-
-        if atom != torsion.atom1:
-            raise Exception('atom != torsion.atom1')
+        ancestors : np.ndarray [n_particles] of int
+            The index of the ancestor of each particle
+        """
+        n_particles = len(weights)
+        cumulative_weights = np.cumsum(weights)
+        cumulative_weights /= cumulative_weights[-1]
+        if conditional:
+            # The offset of the systematic grid is drawn such that one of the grid points falls in the first particle
+            grid_position = get_random_state().uniform(0.0, n_particles*weights[0])
+            reference_slot = min(int(grid_position), n_particles-1)
+            offset = grid_position - reference_slot
+        else:
+            offset = get_random_state().uniform()
+        ancestors = np.searchsorted(cumulative_weights, (np.arange(n_particles) + offset)/n_particles, side='right')
+        ancestors = np.minimum(ancestors, n_particles-1)
+        if conditional:
+            ancestors[reference_slot] = ancestors[0]
+            ancestors[0] = 0
+        return ancestors
 
-        bond = self._get_relevant_bond(atom, bond_atom)
 
-        if bond is not None:
-            r = self._propose_bond(bond)
-            bond_k = bond.type.k
-            sigma_r = units.sqrt(1/(self._beta*bond_k))
-            logZ_r = np.log((np.sqrt(2*np.pi)*(sigma_r/units.angstroms))) # CHECK DOMAIN AND UNITS
-            logp_r = self._bond_logq(r, bond) - logZ_r
-        else:
-            constraint = self._get_bond_constraint(atom, bond_atom, self._system)
-            r = constraint #set bond length to exactly constraint
-            logp_r = 0.0
+class ConformerLibrary(object):
+    """
+    Library of reference conformers of small molecules generated with Omega, keyed by canonical isomeric SMILES.
 
-        #propose an angle and calculate its probability
-        angle = self._get_relevant_angle(atom, bond_atom, angle_atom)
-        theta = self._propose_angle(angle)
-        angle_k = angle.type.k
-        sigma_theta = units.sqrt(1/(self._beta*angle_k))
-        logZ_theta = np.log((np.sqrt(2*np.pi)*(sigma_theta/units.radians))) # CHECK DOMAIN AND UNITS
-        logp_theta = self._angle_logq(theta, angle) - logZ_theta
+    The conformers of each molecule are generated once, kept in memory and, if a cache directory is given,
+    stored in an OEB file named after the SHA1 hash of the SMILES, so that other processes and later runs
+    can load them instead of running Omega again.
 
-        #propose a torsion angle uniformly (this can be dramatically improved)
-        phi = np.random.uniform(-np.pi, np.pi)
-        logp_phi = -np.log(2*np.pi)
+    Parameters
+    ----------
+    cache_directory : str, optional, default=None
+        Directory of the persistent conformer cache; if None, conformers are only kept in memory
+    n_conformers : int, optional, default=10
+        Maximum number of conformers generated for each molecule
+    """
+    def __init__(self, cache_directory=None, n_conformers=10):
+        self._cache_directory = cache_directory
+        self._n_conformers = n_conformers
+        self._molecules = dict()
+        self._lock = threading.Lock()
+        self._generation_locks = dict() # per-SMILES locks, so that the conformers of a molecule are only generated once
+        if cache_directory is not None:
+            import os
+            if not os.path.exists(cache_directory):
+                os.makedirs(cache_directory)
 
-        #get the new cartesian coordinates and detJ:
-        new_xyz, detJ = self._internal_to_cartesian(positions[bond_atom.idx], positions[angle_atom.idx], positions[torsion_atom.idx], r, theta, phi)
-        #accumulate logp
-        logp_proposal = logp_r + logp_theta + logp_phi + np.log(np.abs(detJ))
+    @staticmethod
+    def canonical_smiles(oemol):
+        """
+        Get the canonical isomeric SMILES of a molecule, as used by SmallMoleculeSetProposalEngine for chemical state keys
+        """
+        from perses.rjmc.topology_proposal import OESMILES_OPTIONS
+        return oechem.OECreateSmiString(oemol, OESMILES_OPTIONS)
 
-        return new_xyz, logp_proposal
+    def _cache_filename(self, smiles):
+        import os
+        import hashlib
+        return os.path.join(self._cache_directory, '%s-%d.oeb' % (hashlib.sha1(smiles.encode()).hexdigest(), self._n_conformers))
 
-    def _resample(self):
+    def _generate_conformers(self, smiles):
         """
-        Resample from the current set of weights and positions.
+        Generate the conformers of a molecule with Omega
         """
-        particle_indices = range(self._n_particles)
-        new_indices = np.random.choice(particle_indices, size=self._n_particles, p=self._Wij[:, self._growth_stage-1])
-        for particle_index in particle_indices:
-            self._new_positions[particle_index, :, :] = self._new_positions[new_indices[particle_index], :, :]
-        self._Wij[:, self._growth_stage-1] = -np.log(self._n_particles) #set particle weights to be equal
+        oemol = oechem.OEMol()
+        oechem.OESmilesToMol(oemol, smiles)
+        oechem.OEAddExplicitHydrogens(oemol)
+        oemol.SetTitle(smiles)
+        omega = oeomega.OEOmega()
+        omega.SetMaxConfs(self._n_conformers)
+        omega.SetStrictStereo(False)
+        if not omega(oemol):
+            raise Exception("Omega failed to generate conformers for %s" % smiles)
+        return oemol
 
-    def _generate_configurations(self):
+    def get_molecule(self, smiles):
         """
-        Generate the ensemble of configurations of the new atoms, approximately
-        from p(x_new | x_common).
+        Get the multi-conformer molecule for a SMILES, generating and caching its conformers if needed.
+
+        Parameters
+        ----------
+        smiles : str
+            Canonical isomeric SMILES of the molecule
+
+        Returns
+        -------
+        oemol : openeye.oechem.OEMol
+            The molecule with its conformers
+        """
+        with self._lock:
+            if smiles in self._molecules:
+                return self._molecules[smiles]
+            generation_lock = self._generation_locks.setdefault(smiles, threading.Lock())
+        # Omega runs outside of the library lock, but only one thread loads or generates each molecule
+        with generation_lock:
+            with self._lock:
+                if smiles in self._molecules:
+                    return self._molecules[smiles]
+            import os
+            oemol = None
+            if self._cache_directory is not None and os.path.exists(self._cache_filename(smiles)):
+                oemol = oechem.OEMol()
+                ifs = oechem.oemolistream(self._cache_filename(smiles))
+                oechem.OEReadMolecule(ifs, oemol)
+                ifs.close()
+            if oemol is None or oemol.NumConfs() == 0:
+                oemol = self._generate_conformers(smiles)
+                if self._cache_directory is not None:
+                    def write_conformers(filename):
+                        ofs = oechem.oemolostream(filename)
+                        oechem.OEWriteMolecule(ofs, oemol)
+                        ofs.close()
+                    write_cache_file(self._cache_filename(smiles), write_conformers, suffix='.oeb')
+            with self._lock:
+                self._molecules[smiles] = oemol
+        return oemol
+
+    def get_conformers(self, oemol):
         """
-        for i, atom_torsion in enumerate(self._atom_torsions.items()):
-            self._growth_stage = i+1
-            for particle_index in range(self._n_particles):
-                proposed_xyz, logp_proposal = self._propose_atom(atom_torsion[0], atom_torsion[1])
-                self._new_positions[particle_index, i, :] = proposed_xyz
-                unnormalized_log_target = self._log_unnormalized_target(self._new_positions[particle_index, :,:])
-                if i > 0:
-                    self._Wij = [particle_index, i] = (unnormalized_log_target - logp_proposal) + self._Wij[particle_index, i-1]
-                else:
-                    self._Wij = [particle_index, i] = unnormalized_log_target - logp_proposal
-            sum_log_weights = np.sum(np.exp(self._Wij[:,i]))
-            self._Wij -= np.log(sum_log_weights)
-            if i % self._resample_frequency == 0 and i != 0:
-                self._resample()
+        Get the reference conformers of a molecule, in the atom order of the given molecule.
+
+        Parameters
+        ----------
+        oemol : openeye.oechem.OEMol
+            The molecule, with explicit hydrogens
+
+        Returns
+        -------
+        conformers : np.ndarray [n_conformers, n_atoms, 3] of float, in nm
+            The positions of the atoms of oemol in each reference conformer
+        """
+        library_oemol = self.get_molecule(self.canonical_smiles(oemol))
+        # Match the atoms by element and connectivity, since bond orders may be perceived differently
+        substructure_search = oechem.OESubSearch(library_oemol, oechem.OEExprOpts_AtomicNumber, 0)
+        matches = substructure_search.Match(oemol, True)
+        match = None
+        for match in matches:
+            break
+        if match is None or library_oemol.NumAtoms() != oemol.NumAtoms():
+            raise Exception("The conformer library molecule %s does not match the molecule" % library_oemol.GetTitle())
+        library_to_target = {matched_atoms.pattern.GetIdx() : matched_atoms.target.GetIdx() for matched_atoms in match.GetAtoms()}
+        order = np.array([library_to_target[index] for index in range(library_oemol.NumAtoms())], dtype=np.int64)
+
+        conformers = np.zeros([library_oemol.NumConfs(), oemol.NumAtoms(), 3])
+        for conformer_index, conformer in enumerate(library_oemol.GetConfs()):
+            coordinates = conformer.GetCoords()
+            positions = np.array([coordinates[index] for index in range(library_oemol.NumAtoms())])
+            conformers[conformer_index, order] = positions / 10.0 # angstroms to nm
+        return conformers
 
 
 class OmegaGeometryEngine(GeometryEngine):
     """
     This class proposes new small molecule geometries based on a set of precomputed
     omega geometries.
+
+    The reference conformers of each molecule are taken from a ConformerLibrary. To propose the unique atoms
+    of a molecule, a conformer is chosen uniformly, aligned on the positioned (mapped) atoms of the molecule
+    close to the unique atoms, and the unique atoms are placed at their aligned conformer positions plus
+    isotropic Gaussian noise. The proposal log-density is that of the mixture over all conformers, in nm**-3
+    per atom, which only depends on the positioned atoms, so it is exact in both directions.
+
+    Parameters
+    ----------
+    n_omega_references : int, optional, default=10
+        Maximum number of reference conformers of each molecule
+    proposal_sigma : simtk.unit.Quantity with units of length, optional, default=0.1 angstroms
+        Standard deviation of the Gaussian noise added to each coordinate of the proposed atoms
+    metadata : dict, optional
+        GeometryEngine-related metadata
+    conformer_cache_directory : str, optional, default=None
+        Directory of the persistent conformer library; if None, conformers are only cached in memory
+    alignment_depth : int, optional, default=3
+        The conformers are aligned on the positioned atoms within this many bonds of a unique atom,
+        or on all positioned atoms of the molecule if there are fewer than three such atoms
     """
 
-    def __init__(self, n_omega_references=1, proposal_sigma=1.0, metadata=None):
+    def __init__(self, n_omega_references=10, proposal_sigma=0.1*units.angstroms, metadata=None, conformer_cache_directory=None, alignment_depth=3):
         self._n_omega_references = n_omega_references
-        self._proposal_sigma = 1.0
-        self._reference_oemols = {}
+        self._proposal_sigma = proposal_sigma.value_in_unit(units.nanometers)
         self._metadata = metadata
-        raise NotImplementedError("This GeometryEngine is not currently supported.")
+        self._alignment_depth = alignment_depth
+        self.conformer_library = ConformerLibrary(cache_directory=conformer_cache_directory, n_conformers=n_omega_references)
+        self._reference_conformers = dict()
 
     def propose(self, top_proposal, current_positions, beta):
         """
@@ -1276,24 +2193,234 @@ class OmegaGeometryEngine(GeometryEngine):
         logp_propose : float
             The log-probability of the proposal
         """
-        pass
+        current_positions = np.asarray(current_positions.value_in_unit(units.nanometers))
+        new_positions = np.zeros([top_proposal.n_atoms_new, 3])
+        mapped_indices = np.array(list(top_proposal.new_to_old_atom_map.keys()), dtype=np.int64)
+        new_positions[mapped_indices] = current_positions[[top_proposal.new_to_old_atom_map[index] for index in mapped_indices]]
+        if not top_proposal.unique_new_atoms:
+            return units.Quantity(new_positions, unit=units.nanometers), 0.0
+
+        unique_indices, means = self._unique_atom_means(top_proposal.new_topology, top_proposal.new_topology_view, top_proposal.new_chemical_state_key, top_proposal.unique_new_atoms, new_positions)
+        conformer_index = get_random_state().randint(len(means))
+        new_positions[unique_indices] = means[conformer_index] + self._proposal_sigma*get_random_state().randn(len(unique_indices), 3)
+        logp_proposal = self._mixture_logp(means, new_positions[unique_indices])
+        return units.Quantity(new_positions, unit=units.nanometers), logp_proposal
 
     def logp_reverse(self, top_proposal, new_coordinates, old_coordinates, beta):
         """
+        Calculate the log-probability of proposing the old positions of the unique old atoms.
 
         Parameters
         ----------
-        top_proposal
-        new_coordinates
-        old_coordinates
-        beta
+        top_proposal : TopologyProposal object
+            TopologyProposal object generated by the proposal engine
+        new_coordinates : [n, 3] np.ndarray
+            The coordinates of the system after the proposal
+        old_coordinates : [n, 3] np.ndarray
+            The coordinates of the system before the proposal
+        beta : float
+            inverse temperature
 
         Returns
         -------
+        logp : float
+            The log probability of the proposal for the given transformation
+        """
+        if not top_proposal.unique_old_atoms:
+            return 0.0
+        old_positions = np.asarray(old_coordinates.value_in_unit(units.nanometers))
+        unique_indices, means = self._unique_atom_means(top_proposal.old_topology, top_proposal.old_topology_view, top_proposal.old_chemical_state_key, top_proposal.unique_old_atoms, old_positions)
+        return self._mixture_logp(means, old_positions[unique_indices])
 
+    def _mixture_logp(self, means, positions):
         """
-        pass
+        Log-density of positions under the equally weighted mixture of isotropic Gaussians centered on means.
 
+        Parameters
+        ----------
+        means : np.ndarray [n_conformers, n_unique_atoms, 3] of float, in nm
+            The aligned conformer positions of the unique atoms
+        positions : np.ndarray [n_unique_atoms, 3] of float, in nm
+            The positions of the unique atoms
+
+        Returns
+        -------
+        logp : float
+            The log-density, in log(nm**-3) per atom
+        """
+        sigma = self._proposal_sigma
+        log_gaussians = -np.sum((positions[np.newaxis, :, :] - means)**2, axis=(1, 2))/(2*sigma**2)
+        max_log_gaussian = np.max(log_gaussians)
+        log_mixture = max_log_gaussian + np.log(np.sum(np.exp(log_gaussians - max_log_gaussian))) - np.log(len(means))
+        return log_mixture - 1.5*positions.size/3*np.log(2*np.pi*sigma**2)
+
+    def _unique_atom_means(self, topology, topology_view, chemical_state_key, unique_atoms, positions):
+        """
+        Align the reference conformers of the molecule containing the unique atoms on its positioned atoms.
+
+        Returns
+        -------
+        unique_indices : np.ndarray [n_unique_atoms] of int
+            The indices of the unique atoms in the topology
+        means : np.ndarray [n_conformers, n_unique_atoms, 3] of float, in nm
+            The positions of the unique atoms in each aligned conformer
+        """
+        residue_atom_indices, conformers = self._get_reference_conformers(topology, chemical_state_key, unique_atoms)
+        unique_indices = np.array(sorted(unique_atoms), dtype=np.int64)
+        residue_slots = {atom_index : slot for slot, atom_index in enumerate(residue_atom_indices)}
+        alignment_indices = self._get_alignment_atoms(topology_view, residue_atom_indices, unique_indices)
+        alignment_slots = [residue_slots[atom_index] for atom_index in alignment_indices]
+        unique_slots = [residue_slots[atom_index] for atom_index in unique_indices]
+        aligned = self._align_conformers(conformers, alignment_slots, positions[alignment_indices])
+        return unique_indices, aligned[:, unique_slots]
+
+    def _get_reference_conformers(self, topology, chemical_state_key, unique_atoms):
+        """
+        Get the conformers of the residue containing the unique atoms, in the atom order of the residue.
+
+        Returns
+        -------
+        residue_atom_indices : np.ndarray [n_residue_atoms] of int
+            The topology indices of the atoms of the residue
+        conformers : np.ndarray [n_conformers, n_residue_atoms, 3] of float, in nm
+            The positions of the atoms of the residue in each reference conformer
+        """
+        unique_atoms = set(unique_atoms)
+        residues = [residue for residue in topology.residues() if any(atom.index in unique_atoms for atom in residue.atoms())]
+        if len(residues) != 1:
+            raise Exception("OmegaGeometryEngine requires all unique atoms to be in one small molecule residue, found %d residues" % len(residues))
+        residue = residues[0]
+        residue_atom_indices = np.array([atom.index for atom in residue.atoms()], dtype=np.int64)
+        key = (chemical_state_key, residue_atom_indices[0], len(residue_atom_indices))
+        if key not in self._reference_conformers:
+            from openmoltools.forcefield_generators import generateOEMolFromTopologyResidue
+            oemol = generateOEMolFromTopologyResidue(residue, geometry=False)
+            self._reference_conformers[key] = self.conformer_library.get_conformers(oemol)
+        return residue_atom_indices, self._reference_conformers[key]
+
+    def _get_alignment_atoms(self, topology_view, residue_atom_indices, unique_indices):
+        """
+        Select the positioned atoms of the residue within alignment_depth bonds of a unique atom.
+        """
+        indptr, indices = topology_view.bond_graph
+        positioned = set(residue_atom_indices) - set(unique_indices)
+        visited = set(unique_indices)
+        frontier = set(unique_indices)
+        for depth in range(self._alignment_depth):
+            frontier = {int(neighbor) for atom_index in frontier for neighbor in indices[indptr[atom_index]:indptr[atom_index+1]]} - visited
+            visited |= frontier
+        alignment_atoms = sorted(visited & positioned)
+        if len(alignment_atoms) < 3:
+            alignment_atoms = sorted(positioned)
+        if len(alignment_atoms) < 3:
+            raise Exception("OmegaGeometryEngine requires at least three positioned atoms in the molecule to align the conformers")
+        return np.array(alignment_atoms, dtype=np.int64)
+
+    @staticmethod
+    def _align_conformers(conformers, alignment_slots, target_positions):
+        """
+        Superimpose all conformers on the target positions of the alignment atoms (Kabsch algorithm, without reflections).
+
+        Parameters
+        ----------
+        conformers : np.ndarray [n_conformers, n_atoms, 3] of float
+            The conformers
+        alignment_slots : list of int
+            The indices in the conformers of the atoms to align
+        target_positions : np.ndarray [n_alignment_atoms, 3] of float
+            The positions onto which the alignment atoms are superimposed
+
+        Returns
+        -------
+        aligned : np.ndarray [n_conformers, n_atoms, 3] of float
+            The aligned conformers
+        """
+        reference = conformers[:, alignment_slots]
+        reference_center = np.mean(reference, axis=1)
+        target_center = np.mean(target_positions, axis=0)
+        covariance = np.einsum('kmi,mj->kij', reference - reference_center[:, np.newaxis, :], target_positions - target_center)
+        u, s, vt = np.linalg.svd(covariance)
+        reflection = np.sign(np.linalg.det(np.matmul(u, vt)))
+        u[:, :, 2] *= reflection[:, np.newaxis]
+        rotations = np.matmul(u, vt)
+        return np.matmul(conformers - reference_center[:, np.newaxis, :], rotations) + target_center
+
+
+class NeighborCellList(object):
+    """
+    Cell list of particle positions, for finding all particles within a distance of a set of points
+    without computing all pairwise distances.
+
+    Parameters
+    ----------
+    positions : np.ndarray [n, 3] of float
+        Positions of the particles, in nm
+    cell_size : float
+        Minimum edge length of the cells, in nm; usually the largest query distance
+    box_lengths : np.ndarray [3] of float, optional, default=None
+        Edge lengths of a rectangular periodic box, in nm. If None, the positions are not periodic.
+    particle_indices : np.ndarray [n] of int, optional, default=None
+        The particle index of each position. If None, the position indices are used.
+    """
+
+    def __init__(self, positions, cell_size, box_lengths=None, particle_indices=None):
+        positions = np.asarray(positions, dtype=np.float64).reshape([-1, 3])
+        self._particle_indices = np.arange(len(positions)) if particle_indices is None else np.asarray(particle_indices, dtype=np.int64)
+        self._box_lengths = None if box_lengths is None else np.asarray(box_lengths, dtype=np.float64)
+        if self._box_lengths is not None:
+            self._origin = np.zeros(3)
+            positions = positions - np.floor(positions / self._box_lengths) * self._box_lengths
+            self._n_cells = np.maximum(np.floor(self._box_lengths / cell_size).astype(np.int64), 1)
+            self._cell_lengths = self._box_lengths / self._n_cells
+        else:
+            self._origin = positions.min(axis=0) if len(positions) > 0 else np.zeros(3)
+            positions = positions - self._origin
+            extent = positions.max(axis=0) if len(positions) > 0 else np.zeros(3)
+            self._n_cells = np.floor(extent / cell_size).astype(np.int64) + 1
+            self._cell_lengths = np.full(3, float(cell_size))
+        self._positions = positions
+        cells = np.minimum(np.floor(positions / self._cell_lengths).astype(np.int64), self._n_cells - 1)
+        cell_ids = np.ravel_multi_index(cells.T, self._n_cells)
+        self._order = np.argsort(cell_ids, kind='mergesort')
+        self._cell_starts = np.searchsorted(cell_ids[self._order], np.arange(np.prod(self._n_cells) + 1))
+
+    def query(self, points, radius):
+        """
+        Find the particles within a distance of any of the points.
+
+        Parameters
+        ----------
+        points : np.ndarray [m, 3] of float
+            The query points, in nm
+        radius : float
+            The distance, in nm
+
+        Returns
+        -------
+        particle_indices : np.ndarray of int
+            The sorted indices of the particles within radius of any point
+        """
+        points = np.asarray(points, dtype=np.float64).reshape([-1, 3]) - self._origin
+        span = np.ceil(radius / self._cell_lengths).astype(np.int64)
+        offsets = np.stack(np.meshgrid(*[np.arange(-n, n+1) for n in span], indexing='ij'), axis=-1).reshape([-1, 3])
+        selected = np.zeros(len(self._positions), dtype=bool)
+        for point in points:
+            if self._box_lengths is not None:
+                point = point - np.floor(point / self._box_lengths) * self._box_lengths
+            cells = np.floor(point / self._cell_lengths).astype(np.int64) + offsets
+            if self._box_lengths is not None:
+                cells = np.unique(cells % self._n_cells, axis=0)
+            else:
+                cells = cells[np.all((cells >= 0) & (cells < self._n_cells), axis=1)]
+            if len(cells) == 0:
+                continue
+            cell_ids = np.ravel_multi_index(cells.T, self._n_cells)
+            candidates = np.concatenate([self._order[self._cell_starts[cell_id]:self._cell_starts[cell_id+1]] for cell_id in cell_ids])
+            displacements = self._positions[candidates] - point
+            if self._box_lengths is not None:
+                displacements -= np.round(displacements / self._box_lengths) * self._box_lengths
+            selected[candidates[np.sum(displacements**2, axis=1) <= radius**2]] = True
+        return np.sort(self._particle_indices[selected])
 
 class GeometrySystemGenerator(object):
     """
@@ -1304,8 +2431,9 @@ class GeometrySystemGenerator(object):
     _HarmonicBondForceEnergy = "select(step({}+0.1 - growth_idx), (K/2)*(r-r0)^2, 0);"
     _HarmonicAngleForceEnergy = "select(step({}+0.1 - growth_idx), (K/2)*(theta-theta0)^2, 0);"
     _PeriodicTorsionForceEnergy = "select(step({}+0.1 - growth_idx), k*(1+cos(periodicity*theta-phase)), 0);"
+    sterics_cutoff_distance = 9.0 * units.angstroms # cutoff for sterics
 
-    def __init__(self, reference_system, growth_indices, parameter_name, add_extra_torsions=True, add_extra_angles=True, reference_topology=None, use_sterics=False, force_names=None, force_parameters=None, verbose=True):
+    def __init__(self, reference_system, growth_indices, parameter_name, add_extra_torsions=True, add_extra_angles=True, reference_topology=None, use_sterics=False, force_names=None, force_parameters=None, verbose=True, sterics_neighbor_indices=None):
         """
         Parameters
         ----------
@@ -1323,6 +2451,9 @@ class GeometrySystemGenerator(object):
             Options for the forces (e.g., NonbondedMethod : 'CutffNonPeriodic')
         verbose : bool, optional, default=False
             If True, will print verbose output.
+        sterics_neighbor_indices : iterable of int, optional, default=None
+            If specified (and use_sterics is True), the sterics of the growing atoms are only computed with
+            these other particles, usually the spatial neighbors from NeighborCellList, instead of all other particles.
 
         """
         self._logger = logging.getLogger("geometry")
@@ -1348,8 +2479,6 @@ class GeometrySystemGenerator(object):
         self._nonbondedExceptionEnergy += "U_exception = ONE_4PI_EPS0*chargeprod/r + 4*epsilon*x*(x-1.0); x = (sigma/r)^6;"
         self._nonbondedExceptionEnergy += "ONE_4PI_EPS0 = %f;" % ONE_4PI_EPS0
 
-        self.sterics_cutoff_distance = 9.0 * units.angstroms # cutoff for sterics
-
         self.verbose = verbose
 
         # Get list of particle indices for new and old atoms.
@@ -1447,10 +2576,12 @@ class GeometrySystemGenerator(object):
             growth_system.addForce(modified_sterics_force)
             # Translate nonbonded method to cutoff methods.
             reference_nonbonded_force = reference_forces['NonbondedForce']
-            if reference_nonbonded_force in [openmm.NonbondedForce.NoCutoff, openmm.NonbondedForce.CutoffNonPeriodic]:
+            reference_nonbonded_method = reference_nonbonded_force.getNonbondedMethod()
+            if reference_nonbonded_method in [openmm.NonbondedForce.NoCutoff, openmm.NonbondedForce.CutoffNonPeriodic]:
                 modified_sterics_force.setNonbondedMethod(openmm.CustomNonbondedForce.CutoffNonPeriodic)
-            elif reference_nonbonded_force in [openmm.NonbondedForce.CutoffPeriodic, openmm.NonbondedForce.PME, openmm.NonbondedForce.Ewald]:
+            elif reference_nonbonded_method in [openmm.NonbondedForce.CutoffPeriodic, openmm.NonbondedForce.PME, openmm.NonbondedForce.Ewald]:
                 modified_sterics_force.setNonbondedMethod(openmm.CustomNonbondedForce.CutoffPeriodic)
+                growth_system.setDefaultPeriodicBoxVectors(*reference_system.getDefaultPeriodicBoxVectors())
             modified_sterics_force.setCutoffDistance(self.sterics_cutoff_distance)
             # Add particle parameters.
             for particle_index in range(reference_nonbonded_force.getNumParticles()):
@@ -1464,9 +2595,14 @@ class GeometrySystemGenerator(object):
             for exception_index in range(reference_nonbonded_force.getNumExceptions()):
                 [particle_index_1, particle_index_2, chargeprod, sigma, epsilon] = reference_nonbonded_force.getExceptionParameters(exception_index)
                 modified_sterics_force.addExclusion(particle_index_1, particle_index_2)
-            # Only compute interactions of new particles with all other particles
+            # Only compute interactions of new particles with all other particles, or with their neighbors if specified;
+            # interactions between other particles never change during growth and are excluded
             # TODO: Allow inteactions to be resticted to only the residue being grown.
-            modified_sterics_force.addInteractionGroup(set(new_particle_indices), set(old_particle_indices))
+            if sterics_neighbor_indices is None:
+                environment_particle_indices = set(old_particle_indices)
+            else:
+                environment_particle_indices = set(int(index) for index in sterics_neighbor_indices) - set(new_particle_indices)
+            modified_sterics_force.addInteractionGroup(set(new_particle_indices), environment_particle_indices)
             modified_sterics_force.addInteractionGroup(set(new_particle_indices), set(new_particle_indices))
 
         # Add extra ring-closing torsions, if requested.
@@ -1482,6 +2618,102 @@ class GeometrySystemGenerator(object):
         # Store growth system
         self._growth_parameter_name = parameter_name
         self._growth_system = growth_system
+        self._growth_order = new_particle_indices
+
+    @property
+    def growth_order(self):
+        """
+        The indices of the growing atoms, in the order in which they are grown
+        """
+        return self._growth_order
+
+    def set_growth_order(self, growth_indices, context=None):
+        """
+        Change the order in which the atoms are grown, by updating the growth indices of the terms of the growing atoms.
+
+        The atoms must be those the growth system was created with, so that the growth system has the
+        same terms and only their growth indices change. Environment particles keep a growth index of 0, so only
+        the terms of the growing atoms (see _growth_term_tables) are rewritten. If a context is given, the forces
+        whose terms changed are updated in it with updateParametersInContext, so that it can be reused instead
+        of creating a new one.
+
+        Parameters
+        ----------
+        growth_indices : list of atom
+            The order in which the atoms will be proposed
+        context : simtk.openmm.Context, optional, default=None
+            A Context of the growth system to update
+        """
+        new_particle_indices = [atom.idx for atom in growth_indices]
+        if sorted(new_particle_indices) != sorted(self._growth_order):
+            raise ValueError("The growth order must contain the same atoms as the growth system.")
+        growth_order = np.zeros(self._growth_system.getNumParticles(), dtype=np.int64)
+        growth_order[new_particle_indices] = np.arange(1, len(new_particle_indices)+1)
+        for force_index, term_type, term_indices, term_particles, term_growth_indices in self._growth_term_tables():
+            new_term_growth_indices = np.max(growth_order[term_particles], axis=1)
+            changed_terms = np.nonzero(new_term_growth_indices != term_growth_indices)[0]
+            if len(changed_terms) == 0:
+                continue
+            force = self._growth_system.getForce(force_index)
+            if term_type == 'particle':
+                get_parameters, set_parameters = force.getParticleParameters, force.setParticleParameters
+            else:
+                get_parameters, set_parameters = getattr(force, 'get%sParameters' % term_type), getattr(force, 'set%sParameters' % term_type)
+            for changed_term in changed_terms:
+                term_index = int(term_indices[changed_term])
+                term = get_parameters(term_index)
+                # The growth index of a term is the last of its parameters
+                if term_type == 'particle':
+                    parameters = list(term)
+                    parameters[-1] = float(new_term_growth_indices[changed_term])
+                    set_parameters(term_index, parameters)
+                else:
+                    n_particles = term_particles.shape[1]
+                    parameters = list(term[n_particles])
+                    parameters[-1] = float(new_term_growth_indices[changed_term])
+                    set_parameters(term_index, *(list(term[:n_particles]) + [parameters]))
+            term_growth_indices[changed_terms] = new_term_growth_indices[changed_terms]
+            if context is not None:
+                force.updateParametersInContext(context)
+        self._growth_order = new_particle_indices
+
+    def _growth_term_tables(self):
+        """
+        Index the terms of the growing atoms in the growth system, the first time the growth order is changed.
+
+        Returns
+        -------
+        growth_term_tables : list of (int, str, np.ndarray [n_terms] of int, np.ndarray [n_terms, n_atoms] of int, np.ndarray [n_terms] of int)
+            For each force, the force index, the term type ('Bond', 'Angle', 'Torsion' or 'particle'), the indices of
+            the terms containing growing atoms, their atoms, and their current growth indices (updated in place)
+        """
+        if getattr(self, '_growth_term_tables_cache', None) is not None:
+            return self._growth_term_tables_cache
+        growth_term_tables = list()
+        for force_index, force in enumerate(self._growth_system.getForces()):
+            if isinstance(force, openmm.CustomNonbondedForce):
+                # Only the growing atoms have a nonzero growth index
+                term_indices = np.array(self._growth_order, dtype=np.int64)
+                term_particles = term_indices[:, np.newaxis]
+                term_growth_indices = np.array([force.getParticleParameters(int(particle_index))[-1] for particle_index in term_indices], dtype=np.int64)
+                growth_term_tables.append((force_index, 'particle', term_indices, term_particles, term_growth_indices))
+                continue
+            if isinstance(force, openmm.CustomBondForce):
+                term_type, n_terms, n_particles = 'Bond', force.getNumBonds(), 2
+            elif isinstance(force, openmm.CustomAngleForce):
+                term_type, n_terms, n_particles = 'Angle', force.getNumAngles(), 3
+            elif isinstance(force, openmm.CustomTorsionForce):
+                term_type, n_terms, n_particles = 'Torsion', force.getNumTorsions(), 4
+            else:
+                continue
+            # The valence forces of the growth system only contain terms of the growing atoms
+            terms = [getattr(force, 'get%sParameters' % term_type)(term_index) for term_index in range(n_terms)]
+            term_indices = np.arange(n_terms, dtype=np.int64)
+            term_particles = np.array([term[:n_particles] for term in terms], dtype=np.int64).reshape([n_terms, n_particles])
+            term_growth_indices = np.array([term[n_particles][-1] for term in terms], dtype=np.int64)
+            growth_term_tables.append((force_index, term_type, term_indices, term_particles, term_growth_indices))
+        self._growth_term_tables_cache = growth_term_tables
+        return growth_term_tables
 
     def set_growth_parameter_index(self, growth_parameter_index, context=None):
         """
@@ -1713,8 +2945,21 @@ class GeometrySystemGenerator(object):
 class GeometrySystemGeneratorFast(GeometrySystemGenerator):
     """
     Use updateParametersInContext to make energy evaluation fast.
+
+    The growth index of every force term is precomputed, so that set_growth_parameter_index
+    only modifies the terms that switch on or off between the current and the new growth index,
+    and only pushes the forces that changed to the Context.
     """
 
+    # Method used to set the parameters of each type of term, the parameters that are scaled when the term is off, and the scale
+    _term_setters = {
+        'bond' : ('setBondParameters', [3], 0.0),
+        'angle' : ('setAngleParameters', [4], 0.0),
+        'torsion' : ('setTorsionParameters', [6], 0.0),
+        'particle' : ('setParticleParameters', [0, 2], 0.0),
+        'exception' : ('setExceptionParameters', [2, 4], 1.0e-6), # WORKAROUND // TODO: Change to zero when OpenMM issue is fixed
+    }
+
     def __init__(self, reference_system, growth_indices, parameter_name, add_extra_torsions=True, add_extra_angles=True, reference_topology=None, use_sterics=True, force_names=None, force_parameters=None, verbose=True):
         """
         Parameters
@@ -1768,6 +3013,10 @@ class GeometrySystemGeneratorFast(GeometrySystemGenerator):
         #Extract the forces from the system to use for adding auxiliary angles and torsions
         reference_forces = {reference_system.getForce(index).__class__.__name__ : reference_system.getForce(index) for index in range(reference_system.getNumForces())}
 
+        # Precompute the growth index and reference parameters of every force term
+        self._growth_index_tables = self._compute_growth_index_tables()
+        self._forces_to_update = set() # indices of forces modified since the Context was last updated
+
         # Ensure 'canonical form' of System has all parameters turned on, or else we'll run into nonbonded exceptions
         self.current_growth_index = -1
         self.set_growth_parameter_index(len(self._growth_indices))
@@ -1781,55 +3030,719 @@ class GeometrySystemGeneratorFast(GeometrySystemGenerator):
             if reference_topology==None:
                 raise ValueError("Need to specify topology in order to add extra angles")
             self._determine_extra_angles(reference_forces['HarmonicAngleForce'], reference_topology, growth_indices)
-        # TODO: Precompute growth indices for force terms for speed
 
-    def set_growth_parameter_index(self, growth_index, context=None):
-        """
-        Set the growth parameter index
+    def _compute_growth_index_tables(self):
         """
-        self.current_growth_index = growth_index
-        for (growth_force, reference_force) in zip(self._growth_system.getForces(), self._reference_system.getForces()):
-            force_name = growth_force.__class__.__name__
+        Compute the growth index of every term of the forces of the reference system.
+
+        Returns
+        -------
+        growth_index_tables : list of list of (str, np.ndarray of int, list)
+            For each force, a list of (term type, growth index of each term, reference parameters of each term)
+        """
+        growth_order = np.zeros(self._reference_system.getNumParticles(), dtype=np.int64)
+        growth_order[self._new_particle_indices] = np.arange(1, len(self._new_particle_indices)+1)
+
+        def term_growth_indices(parameters, n_particles):
+            if len(parameters) == 0:
+                return np.zeros(0, dtype=np.int64)
+            particle_indices = np.array([term_parameters[:n_particles] for term_parameters in parameters], dtype=np.int64)
+            return np.max(growth_order[particle_indices], axis=1)
+
+        growth_index_tables = list()
+        for reference_force in self._reference_system.getForces():
+            force_name = reference_force.__class__.__name__
+            force_tables = list()
             if (force_name == 'HarmonicBondForce'):
-                for bond in range(reference_force.getNumBonds()):
-                    parameters = reference_force.getBondParameters(bond)
-                    this_growth_index = self._calculate_growth_idx(parameters[:2], self._growth_indices)
-                    if (growth_index < this_growth_index):
-                        parameters[3] *= 0.0
-                    growth_force.setBondParameters(bond, *parameters)
+                parameters = [reference_force.getBondParameters(bond) for bond in range(reference_force.getNumBonds())]
+                force_tables.append(('bond', term_growth_indices(parameters, 2), parameters))
             elif (force_name == 'HarmonicAngleForce'):
-                for angle in range(reference_force.getNumAngles()):
-                    parameters = reference_force.getAngleParameters(angle)
-                    this_growth_index = self._calculate_growth_idx(parameters[:3], self._growth_indices)
-                    if (growth_index < this_growth_index):
-                        parameters[4] *= 0.0
-                    growth_force.setAngleParameters(angle, *parameters)
+                parameters = [reference_force.getAngleParameters(angle) for angle in range(reference_force.getNumAngles())]
+                force_tables.append(('angle', term_growth_indices(parameters, 3), parameters))
             elif (force_name == 'PeriodicTorsionForce'):
-                for torsion in range(reference_force.getNumTorsions()):
-                    parameters = reference_force.getTorsionParameters(torsion)
-                    this_growth_index = self._calculate_growth_idx(parameters[:4], self._growth_indices)
-                    if (growth_index < this_growth_index):
-                        parameters[6] *= 0.0
-                    growth_force.setTorsionParameters(torsion, *parameters)
+                parameters = [reference_force.getTorsionParameters(torsion) for torsion in range(reference_force.getNumTorsions())]
+                force_tables.append(('torsion', term_growth_indices(parameters, 4), parameters))
             elif (force_name == 'NonbondedForce'):
-                for particle_index in range(reference_force.getNumParticles()):
-                    parameters = reference_force.getParticleParameters(particle_index)
-                    this_growth_index = self._calculate_growth_idx([particle_index], self._growth_indices)
-                    if (growth_index < this_growth_index):
-                        parameters[0] *= 0.0
-                        parameters[2] *= 0.0
-                    growth_force.setParticleParameters(particle_index, *parameters)
-                for exception_index in range(reference_force.getNumExceptions()):
-                    parameters = reference_force.getExceptionParameters(exception_index)
-                    this_growth_index = self._calculate_growth_idx(parameters[:2], self._growth_indices)
-                    if (growth_index < this_growth_index):
-                        parameters[2] *= 1.0e-6 # WORKAROUND // TODO: Change to zero when OpenMM issue is fixed
-                        parameters[4] *= 1.0e-6 # WORKAROUND // TODO: Change to zero when OpenMM issue is fixed
-                    growth_force.setExceptionParameters(exception_index, *parameters)
-
-            # Update parameters in context
-            if context is not None:
-                growth_force.updateParametersInContext(context)
+                parameters = [reference_force.getParticleParameters(particle_index) for particle_index in range(reference_force.getNumParticles())]
+                force_tables.append(('particle', growth_order.copy(), parameters))
+                parameters = [reference_force.getExceptionParameters(exception_index) for exception_index in range(reference_force.getNumExceptions())]
+                force_tables.append(('exception', term_growth_indices(parameters, 2), parameters))
+            growth_index_tables.append(force_tables)
+        return growth_index_tables
+
+    def set_growth_parameter_index(self, growth_index, context=None):
+        """
+        Set the growth parameter index
+
+        Only the terms whose growth index lies between the current and the new growth index are modified.
+        If a context is given, the forces modified since the last call with a context are updated in it.
+        """
+        low_growth_index, high_growth_index = sorted([self.current_growth_index, growth_index])
+        self.current_growth_index = growth_index
+        for force_index, (growth_force, force_tables) in enumerate(zip(self._growth_system.getForces(), self._growth_index_tables)):
+            for (term_type, term_growth_indices, reference_parameters) in force_tables:
+                setter_name, scaled_parameters, scale = self._term_setters[term_type]
+                set_parameters = getattr(growth_force, setter_name)
+                changed_terms = np.nonzero((term_growth_indices > low_growth_index) & (term_growth_indices <= high_growth_index))[0]
+                for term_index in changed_terms:
+                    parameters = list(reference_parameters[term_index])
+                    if (growth_index < term_growth_indices[term_index]):
+                        for parameter_index in scaled_parameters:
+                            parameters[parameter_index] *= scale
+                    set_parameters(int(term_index), *parameters)
+                if len(changed_terms) > 0:
+                    self._forces_to_update.add(force_index)
+
+        # Update parameters in context
+        if context is not None:
+            for force_index in sorted(self._forces_to_update):
+                self._growth_system.getForce(force_index).updateParametersInContext(context)
+            self._forces_to_update.clear()
+
+    @property
+    def growth_order(self):
+        return list(self._new_particle_indices)
+
+    def set_growth_order(self, growth_indices, context=None):
+        """
+        Change the order in which the atoms are grown, by updating the precomputed growth indices of the terms
+        of the growing atoms.
+
+        Terms whose growth index moves across the current growth index are switched on or off, and if a context
+        is given, the forces modified since the last call with a context are updated in it.
+
+        Parameters
+        ----------
+        growth_indices : list of atom
+            The order in which the atoms will be proposed
+        context : simtk.openmm.Context, optional, default=None
+            A Context of the growth system to update
+        """
+        new_particle_indices = [atom.idx for atom in growth_indices]
+        if sorted(new_particle_indices) != sorted(self._new_particle_indices):
+            raise ValueError("The growth order must contain the same atoms as the growth system.")
+        growth_order = np.zeros(self._reference_system.getNumParticles(), dtype=np.int64)
+        growth_order[new_particle_indices] = np.arange(1, len(new_particle_indices)+1)
+        n_term_particles = {'bond' : 2, 'angle' : 3, 'torsion' : 4, 'exception' : 2}
+        for force_index, (growth_force, force_tables) in enumerate(zip(self._growth_system.getForces(), self._growth_index_tables)):
+            for (term_type, term_growth_indices, reference_parameters) in force_tables:
+                # Environment terms keep a growth index of 0
+                grown_terms = np.nonzero(term_growth_indices > 0)[0]
+                if len(grown_terms) == 0:
+                    continue
+                if term_type == 'particle':
+                    new_term_growth_indices = growth_order[grown_terms]
+                else:
+                    n_particles = n_term_particles[term_type]
+                    particle_indices = np.array([reference_parameters[term_index][:n_particles] for term_index in grown_terms], dtype=np.int64)
+                    new_term_growth_indices = np.max(growth_order[particle_indices], axis=1)
+                was_on = (term_growth_indices[grown_terms] <= self.current_growth_index)
+                is_on = (new_term_growth_indices <= self.current_growth_index)
+                term_growth_indices[grown_terms] = new_term_growth_indices
+                setter_name, scaled_parameters, scale = self._term_setters[term_type]
+                set_parameters = getattr(growth_force, setter_name)
+                switched_terms = grown_terms[was_on != is_on]
+                for term_index in switched_terms:
+                    parameters = list(reference_parameters[term_index])
+                    if (self.current_growth_index < term_growth_indices[term_index]):
+                        for parameter_index in scaled_parameters:
+                            parameters[parameter_index] *= scale
+                    set_parameters(int(term_index), *parameters)
+                if len(switched_terms) > 0:
+                    self._forces_to_update.add(force_index)
+        self._new_particle_indices = new_particle_indices
+        self._growth_indices = list(growth_indices)
+
+        # Update parameters in context
+        if context is not None:
+            for force_index in sorted(self._forces_to_update):
+                self._growth_system.getForce(force_index).updateParametersInContext(context)
+            self._forces_to_update.clear()
+
+class GrowthSystemCacheEntry(object):
+    """
+    The objects needed to compute growth energies for one proposal order, held by GrowthSystemCache.
+
+    Parameters
+    ----------
+    growth_system_generator : GeometrySystemGenerator
+        The generator of the growth system
+    growth_system : simtk.openmm.System
+        The growth system
+    sterics_neighbor_indices : np.ndarray of int, optional, default=None
+        The particles the growing atoms have sterics with, if restricted to their neighbors
+    """
+
+    # Rough memory footprint used for the cache memory limit, including the copies held by a Context
+    _BYTES_PER_PARTICLE = 512
+    _BYTES_PER_TERM = 128
+
+    def __init__(self, growth_system_generator, growth_system, sterics_neighbor_indices=None):
+        self.growth_system_generator = growth_system_generator
+        self.growth_system = growth_system
+        self.sterics_neighbor_indices = sterics_neighbor_indices
+        self.key = None
+        self.context = None
+        self.integrator = None
+        self.growth_energy = None
+        n_terms = 0
+        for force_index in range(growth_system.getNumForces()):
+            force = growth_system.getForce(force_index)
+            for method_name in ['getNumBonds', 'getNumAngles', 'getNumTorsions', 'getNumParticles', 'getNumExclusions']:
+                if hasattr(force, method_name):
+                    n_terms += getattr(force, method_name)()
+        self.memory = growth_system.getNumParticles()*self._BYTES_PER_PARTICLE + n_terms*self._BYTES_PER_TERM
+
+    def contains_sterics_neighbors(self, sterics_neighbor_indices):
+        """
+        Whether the growing atoms have sterics with all the given particles in this growth system.
+
+        Parameters
+        ----------
+        sterics_neighbor_indices : np.ndarray of int or None
+            The sterics neighbors of the growing atoms, or None for all particles
+
+        Returns
+        -------
+        contains_neighbors : bool
+            True if the growth system has sterics with all particles, or with a superset of the given ones
+        """
+        if self.sterics_neighbor_indices is None:
+            return True
+        if sterics_neighbor_indices is None:
+            return False
+        return bool(np.all(np.isin(sterics_neighbor_indices, self.sterics_neighbor_indices)))
+
+class GrowthSystemCache(object):
+    """
+    Least-recently-used cache of growth systems and their Contexts, so that proposals that are
+    repeated with the same chemical state and proposal order do not have to rebuild them.
+
+    Entries are checked out with get() and returned with put() once the proposal is done, so an
+    entry is never used by two proposals at the same time.
+
+    Parameters
+    ----------
+    max_size : int, optional, default=16
+        Maximum number of cached entries. If 0, nothing is cached.
+    max_memory : float, optional, default=1024
+        Maximum estimated memory of the cached entries, in megabytes
+
+    Properties
+    ----------
+    n_hits : int
+        Number of times a cached entry was found
+    n_misses : int
+        Number of times no cached entry was found
+    n_evictions : int
+        Number of entries evicted to respect max_size or max_memory
+    """
+
+    def __init__(self, max_size=16, max_memory=1024):
+        self.max_size = max_size
+        self.max_memory = max_memory
+        self._entries = collections.OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+        self._logger = logging.getLogger("geometry")
+
+    @staticmethod
+    def make_key(chemical_state_key, reference_system, growth_indices, use_sterics, sterics_neighbor_list=False):
+        """
+        Make the cache key of a growth system.
+
+        The chemical state key does not distinguish between environments, so the number of
+        particles and the forces of the reference system are also part of the key.
+
+        Parameters
+        ----------
+        chemical_state_key : str
+            The chemical state key of the system being grown
+        reference_system : simtk.openmm.System
+            The system being grown
+        growth_indices : list of int
+            The indices of the atoms in proposal order
+        use_sterics : bool
+            Whether the growth system includes sterics
+        sterics_neighbor_list : bool, optional, default=False
+            Whether the sterics of the growing atoms are restricted to their neighbors; the neighbor set itself
+            changes between proposals, so it is checked with GrowthSystemCacheEntry.contains_sterics_neighbors
+
+        Returns
+        -------
+        key : tuple
+            The cache key
+        """
+        forces = []
+        for force_index in range(reference_system.getNumForces()):
+            force = reference_system.getForce(force_index)
+            nonbonded_method = force.getNonbondedMethod() if hasattr(force, 'getNonbondedMethod') else None
+            forces.append((force.__class__.__name__, nonbonded_method))
+        return (chemical_state_key, reference_system.getNumParticles(), tuple(forces), tuple(growth_indices), use_sterics, sterics_neighbor_list)
+
+    def get(self, key):
+        """
+        Check out the cached entry for key, removing it from the cache.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+
+        Returns
+        -------
+        entry : GrowthSystemCacheEntry or None
+            The cached entry, or None if there is none
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.n_misses += 1
+            else:
+                self._memory -= entry.memory
+                self.n_hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Return an entry to the cache, evicting the least recently used entries if needed.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+        entry : GrowthSystemCacheEntry
+            The entry to cache
+        """
+        if (self.max_size <= 0) or (entry.memory > self.max_memory*1024**2):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._memory -= self._entries.pop(key).memory
+            self._entries[key] = entry
+            self._memory += entry.memory
+            while (len(self._entries) > self.max_size) or (self._memory > self.max_memory*1024**2):
+                _, evicted_entry = self._entries.popitem(last=False)
+                self._memory -= evicted_entry.memory
+                self.n_evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._memory = 0
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups that found a cached entry
+        """
+        n_lookups = self.n_hits + self.n_misses
+        if n_lookups == 0:
+            return 0.0
+        return float(self.n_hits) / n_lookups
+
+    @property
+    def statistics(self):
+        """
+        Dict of cache statistics
+        """
+        return {'n_entries' : len(self._entries), 'memory' : self._memory / 1024.0**2, 'n_hits' : self.n_hits,
+                'n_misses' : self.n_misses, 'n_evictions' : self.n_evictions, 'hit_rate' : self.hit_rate}
+
+class GrowthContextPool(GrowthSystemCache):
+    """
+    Pool of growth systems and their Contexts that are reused for any proposal order of the same atoms.
+
+    Entries are keyed on the set of atoms being grown rather than on their order, so that an entry is valid
+    whatever the proposal order. When an entry is checked out for a different proposal order, the growth
+    indices of its terms are changed with GeometrySystemGenerator.set_growth_order and pushed to its Context
+    with updateParametersInContext, instead of building a new System and Context.
+
+    Whether the sterics are restricted to a neighbor list is part of the key, as in GrowthSystemCache.
+    Entries with all-particle sterics (use_sterics_neighbor_list=False) are valid whatever the positions, so
+    they are always reused, but every sterics evaluation loops over all particles of the system. Entries with
+    a padded neighbor list are much cheaper to evaluate in large (e.g. solvated) systems, but are rebuilt,
+    like cached entries, once the environment moves out of their padded neighbor set.
+
+    Parameters
+    ----------
+    max_size : int, optional, default=4
+        Maximum number of pooled growth systems and Contexts. If 0, nothing is pooled.
+    max_memory : float, optional, default=1024
+        Maximum estimated memory of the pooled entries, in megabytes
+
+    Properties
+    ----------
+    n_reorders : int
+        Number of times a pooled entry was reused for a different proposal order
+    """
+    def __init__(self, max_size=4, max_memory=1024):
+        super(GrowthContextPool, self).__init__(max_size=max_size, max_memory=max_memory)
+        self.n_reorders = 0
+
+    @staticmethod
+    def make_key(chemical_state_key, reference_system, growth_indices, use_sterics, sterics_neighbor_list=False):
+        """
+        Make the pool key of a growth system, which does not depend on the proposal order.
+        The arguments are the same as for GrowthSystemCache.make_key.
+        """
+        return GrowthSystemCache.make_key(chemical_state_key, reference_system, sorted(growth_indices), use_sterics, sterics_neighbor_list=sterics_neighbor_list)
+
+    def reorder(self, entry, growth_indices):
+        """
+        Prepare a checked out entry for a proposal order, updating its Context if the order changed.
+
+        Parameters
+        ----------
+        entry : GrowthSystemCacheEntry
+            The entry from get()
+        growth_indices : list of atom
+            The atoms in proposal order
+        """
+        if entry.growth_system_generator.growth_order == [atom.idx for atom in growth_indices]:
+            return
+        entry.growth_system_generator.set_growth_order(growth_indices, context=entry.context)
+        # The vectorized energies hold the growth indices, so they are rebuilt when needed
+        entry.growth_energy = None
+        with self._lock:
+            self.n_reorders += 1
+
+    @property
+    def statistics(self):
+        """
+        Dict of pool statistics
+        """
+        statistics = super(GrowthContextPool, self).statistics
+        statistics['n_reorders'] = self.n_reorders
+        statistics['reuse_rate'] = self.hit_rate
+        return statistics
+
+class TorsionPMFCache(object):
+    """
+    Least-recently-used cache of valence-only torsion probability mass functions, so that growing the same
+    substituent in the same local environment again (e.g. the same residue proposed by PointMutationEngine,
+    or a sampler alternating between two ligands) does not recompute identical PMFs.
+
+    Without sterics, the torsion PMF of an atom only depends on the parameters of its active valence terms,
+    on its bond length r and angle theta, and on the positions of the other atoms of these terms in the local
+    frame of the torsion. The key of a PMF is made of these parameters and of r, theta and the local coordinates,
+    binned to length_tolerance (in nm) and angle_tolerance (in radians). In order for a PMF found in the cache to be
+    the PMF that would have been computed, the PMF is always computed at the bin centers: r and theta are replaced
+    by the centers of their bins, and the other atoms of the terms are moved to the centers of their bins in the
+    local frame (see make_key). A cached PMF therefore agrees with a recomputed one to floating point roundoff
+    (within 1e-8 in logp), and forward proposals and reverse logps use the same proposal density. The PMF differs
+    from the one computed at the exact geometry by moving each coordinate by at most half a tolerance.
+
+    Parameters
+    ----------
+    max_size : int, optional, default=1024
+        Maximum number of cached PMFs. If 0, nothing is cached.
+    length_tolerance : float, optional, default=1.0e-3
+        Bin width of r and of the local coordinates of the atoms of the terms, in nm
+    angle_tolerance : float, optional, default=1.0e-2
+        Bin width of theta, in radians
+
+    Properties
+    ----------
+    n_hits : int
+        Number of times a cached PMF was found
+    n_misses : int
+        Number of times no cached PMF was found
+    n_evictions : int
+        Number of PMFs evicted to respect max_size
+    """
+
+    def __init__(self, max_size=1024, length_tolerance=1.0e-3, angle_tolerance=1.0e-2):
+        self.max_size = max_size
+        self.length_tolerance = length_tolerance
+        self.angle_tolerance = angle_tolerance
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    def make_key(self, growth_energy, torsion, positions, r, theta, beta, n_divisions):
+        """
+        Make the cache key of a torsion PMF, and the binned geometry at which the PMF is computed.
+
+        Parameters
+        ----------
+        growth_energy : perses.rjmc.growth_energy.GrowthSystemEnergy
+            The vectorized growth system energy, at the growth stage of the atom being placed
+        torsion : GeometryTorsion
+            The torsion of the atom being placed
+        positions : np.ndarray [n, 3] of float, in nm
+            Positions of the atoms in the system; left unchanged
+        r : float
+            Bond length, in nm
+        theta : float
+            Bond angle, in radians
+        beta : float
+            Inverse temperature, in mol/kJ
+        n_divisions : int
+            Number of divisions of the torsion scan
+
+        Returns
+        -------
+        key : tuple or None
+            The cache key, or None if the PMF cannot be cached because the growth system has sterics
+        binned_positions : np.ndarray [n, 3] of float, in nm
+            The positions with the other atoms of the terms at the centers of their bins
+        binned_r : float
+            The center of the bin of r, in nm
+        binned_theta : float
+            The center of the bin of theta, in radians
+        """
+        from perses.rjmc import coordinate_numba
+        atom_idx = torsion.atom1.idx
+        terms = growth_energy.valence_terms(atom_idx)
+        if terms is None:
+            return None, positions, r, theta
+        origin = positions[torsion.atom2.idx]
+        frame = coordinate_numba.local_frames(origin, positions[torsion.atom3.idx], positions[torsion.atom4.idx])[0]
+        binned_positions = np.array(positions)
+        term_keys = list()
+        for kind, atoms, parameters in terms:
+            for term_atoms, term_parameters in zip(atoms, parameters):
+                atom_bins = list()
+                for atom_index in term_atoms:
+                    if atom_index == atom_idx:
+                        atom_bins.append(())
+                        continue
+                    local_bins = np.round(np.dot(frame, positions[atom_index] - origin) / self.length_tolerance).astype(np.int64)
+                    binned_positions[atom_index] = origin + np.dot(local_bins*self.length_tolerance, frame)
+                    atom_bins.append(tuple(local_bins.tolist()))
+                term_keys.append((kind, tuple(term_parameters.tolist()), tuple(atom_bins)))
+        r_bin = int(np.round(r / self.length_tolerance))
+        theta_bin = int(np.round(theta / self.angle_tolerance))
+        key = (n_divisions, float(beta), r_bin, theta_bin, tuple(sorted(term_keys)))
+        return key, binned_positions, r_bin*self.length_tolerance, theta_bin*self.angle_tolerance
+
+    def get(self, key):
+        """
+        Get the cached PMF for key.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+
+        Returns
+        -------
+        logp_torsions : np.ndarray of float or None
+            A copy of the cached PMF, or None if there is none
+        """
+        with self._lock:
+            logp_torsions = self._entries.get(key)
+            if logp_torsions is None:
+                self.n_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.n_hits += 1
+        return np.array(logp_torsions)
+
+    def put(self, key, logp_torsions):
+        """
+        Cache a PMF, evicting the least recently used PMFs if needed.
+
+        Parameters
+        ----------
+        key : tuple
+            The cache key from make_key()
+        logp_torsions : np.ndarray of float
+            The PMF computed at the binned geometry of make_key()
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = np.array(logp_torsions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.n_evictions += 1
+
+    def clear(self):
+        """
+        Remove all PMFs from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups that found a cached PMF
+        """
+        n_lookups = self.n_hits + self.n_misses
+        if n_lookups == 0:
+            return 0.0
+        return float(self.n_hits) / n_lookups
+
+    @property
+    def statistics(self):
+        """
+        Dict of cache statistics
+        """
+        return {'n_entries' : len(self._entries), 'n_hits' : self.n_hits, 'n_misses' : self.n_misses,
+                'n_evictions' : self.n_evictions, 'hit_rate' : self.hit_rate}
+
+class GeometryProfiler(object):
+    """
+    Collects a timing record for each proposal made by FFAllAngleGeometryEngine or BootstrapParticleFilter, in either direction.
+
+    Each record holds the times (in s) spent determining the proposal order, generating (or retrieving) the
+    growth system, creating the Context, computing the cartesian coordinates of the torsion scans, evaluating
+    growth energies and setting Context positions, and the total time, along with the number of atoms grown,
+    the number of energy calls and the number of positions at which the energy was evaluated. For
+    BootstrapParticleFilter, the torsion scan time is the time spent placing the atoms in all particles,
+    and each growth stage makes one energy call evaluated at every particle.
+
+    Examples
+    --------
+    >>> profiler = GeometryProfiler()
+    >>> geometry_engine = FFAllAngleGeometryEngine(metadata={})
+    >>> geometry_engine.profiler = profiler
+    >>> # ... make proposals ...
+    >>> records = profiler.get_records()
+    >>> total_energy_time = records.energy_time.sum()
+    """
+    record_dtype = np.dtype([('direction', 'U7'), ('n_atoms', np.int64), ('n_energy_calls', np.int64), ('n_energy_evaluations', np.int64),
+                             ('proposal_order_time', np.float64), ('system_generation_time', np.float64), ('context_creation_time', np.float64),
+                             ('torsion_scan_time', np.float64), ('energy_time', np.float64), ('position_set_time', np.float64), ('total_time', np.float64)])
+
+    def __init__(self):
+        self._records = list()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def new_record(cls, direction):
+        """
+        Create an empty timing record, as a dict of field name : value.
+        """
+        record = {name : 0 for name in cls.record_dtype.names}
+        record['direction'] = direction
+        return record
+
+    def add_record(self, record):
+        """
+        Add the timing record of a proposal.
+
+        Parameters
+        ----------
+        record : dict of str : float
+            The record, with the fields of record_dtype
+        """
+        with self._lock:
+            self._records.append(tuple(record[name] for name in self.record_dtype.names))
+
+    @property
+    def n_records(self):
+        return len(self._records)
+
+    def get_records(self):
+        """
+        Get the timing records collected so far.
+
+        Returns
+        -------
+        records : np.recarray of record_dtype
+            One record per proposal, in the order the proposals finished
+        """
+        with self._lock:
+            return np.rec.array(np.array(self._records, dtype=self.record_dtype))
+
+    def reset(self):
+        """
+        Discard all records.
+        """
+        with self._lock:
+            self._records = list()
+
+    def write(self, storage, iteration=None):
+        """
+        Write the records collected so far to storage, as the 'geometry_profile' object.
+
+        Parameters
+        ----------
+        storage : NetCDFStorage or NetCDFStorageView
+            The storage layer
+        iteration : int, optional, default=None
+            The iteration for which the records are written, or None to write them once
+        """
+        storage.write_object('geometry_profile', self.get_records(), iteration=iteration)
+
+def _find_geometry_engines(target):
+    """
+    Find the FFAllAngleGeometryEngines used by a geometry engine or a sampler, including the samplers it wraps.
+    """
+    if isinstance(target, FFAllAngleGeometryEngine):
+        return [target]
+    geometry_engines = list()
+    if hasattr(target, 'geometry_engine'):
+        geometry_engines += _find_geometry_engines(target.geometry_engine)
+    if hasattr(target, 'sampler'):
+        geometry_engines += _find_geometry_engines(target.sampler)
+    if hasattr(target, 'samplers'):
+        for sampler in target.samplers:
+            geometry_engines += _find_geometry_engines(sampler)
+    return geometry_engines
+
+@contextlib.contextmanager
+def profile_geometry(*targets, **kwargs):
+    """
+    Collect timing records of all geometry proposals made inside the context.
+
+    Parameters
+    ----------
+    targets : FFAllAngleGeometryEngine, ExpandedEnsembleSampler, SAMSSampler, MultiTargetDesign or ProtonationStateSampler
+        The geometry engines to profile, or samplers whose geometry engines are profiled
+    profiler : GeometryProfiler, optional, default=None
+        The profiler collecting the records; if None, a new GeometryProfiler is created
+    storage : NetCDFStorage or NetCDFStorageView, optional, default=None
+        If specified, the records are written to this storage when the context exits
+
+    Yields
+    ------
+    profiler : GeometryProfiler
+        The profiler collecting the records
+
+    Examples
+    --------
+    >>> from perses.tests.testsystems import AlanineDipeptideTestSystem
+    >>> testsystem = AlanineDipeptideTestSystem()
+    >>> with profile_geometry(testsystem.designer) as profiler:
+    ...     testsystem.designer.run(niterations=2)
+    >>> records = profiler.get_records()
+    """
+    profiler = kwargs.pop('profiler', None)
+    storage = kwargs.pop('storage', None)
+    if kwargs:
+        raise ValueError("Unexpected arguments %s" % str(list(kwargs.keys())))
+    if profiler is None:
+        profiler = GeometryProfiler()
+
+    geometry_engines = list()
+    for target in targets:
+        for geometry_engine in _find_geometry_engines(target):
+            if not any(geometry_engine is engine for engine in geometry_engines):
+                geometry_engines.append(geometry_engine)
+    previous_profilers = [geometry_engine.profiler for geometry_engine in geometry_engines]
+    for geometry_engine in geometry_engines:
+        geometry_engine.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        for geometry_engine, previous_profiler in zip(geometry_engines, previous_profilers):
+            geometry_engine.profiler = previous_profiler
+        if storage is not None:
+            profiler.write(storage)
 
 class PredHBond(oechem.OEUnaryBondPred):
     """
@@ -1853,18 +3766,29 @@ class ProposalOrderTools(object):
 
     Hydrogens are added last in growth order.
 
+    The bond graph of each topology is taken as compact integer arrays (CSR adjacency) from the
+    topology views of the proposal, and the deterministic part of the proposal order (which atoms
+    are placed in each round, and the candidate torsions of each atom) is memoized per (topology,
+    mapped atom set). Only the random choices of the order within each round and of the torsions
+    are made for each proposal.
+
     Parameters
     ----------
     topology_proposal : perses.rjmc.topology_proposal.TopologyProposal
         The topology proposal containing the relevant move.
     """
 
+    # Memoized proposal plans, shared by all instances since they only depend on the topology
+    _plan_cache = collections.OrderedDict()
+    _cache_size = 128
+    _cache_lock = threading.Lock()
+
     def __init__(self, topology_proposal, verbose=True):
         self._topology_proposal = topology_proposal
         self.verbose = True # DEBUG
         self._logger = logging.getLogger("geometry")
 
-    def determine_proposal_order(self, direction='forward'):
+    def determine_proposal_order(self, direction='forward', group_hydrogens=False):
         """
         Determine the proposal order of this system pair.
         This includes the choice of a torsion. As such, a logp is returned.
@@ -1873,188 +3797,179 @@ class ProposalOrderTools(object):
         ----------
         direction : str, optional
             whether to determine the forward or reverse proposal order
+        group_hydrogens : bool, optional, default=False
+            If True, the hydrogens bonded to the same atom are placed consecutively (in order of index) with
+            the same torsion atoms, so that they can be proposed jointly as a rotor; the order of the groups
+            and the torsion of each group are chosen at random instead of the order and torsion of each hydrogen.
 
         Returns
         -------
         atoms_torsions : ordereddict
-            parmed.Atom : parmed.Dihedral
+            GeometryAtom : GeometryTorsion
         logp_torsion_choice : float
             log probability of the chosen torsions
         """
+        from scipy import special
         if direction=='forward':
-            topology = self._topology_proposal.new_topology
-            system = self._topology_proposal.new_system
-            structure = parmed.openmm.load_topology(self._topology_proposal.new_topology, self._topology_proposal.new_system)
-            unique_atoms = self._topology_proposal.unique_new_atoms
-            #atoms_with_positions = [structure.atoms[atom_idx] for atom_idx in range(self._topology_proposal.n_atoms_new) if atom_idx not in self._topology_proposal.unique_new_atoms]
-            atoms_with_positions = [structure.atoms[atom_idx] for atom_idx in self._topology_proposal.new_to_old_atom_map.keys()]
+            topology_view = self._topology_proposal.new_topology_view
+            atoms_with_positions = list(self._topology_proposal.new_to_old_atom_map.keys())
         elif direction=='reverse':
-            topology = self._topology_proposal.old_topology
-            system = self._topology_proposal.old_system
-            structure = parmed.openmm.load_topology(self._topology_proposal.old_topology, self._topology_proposal.old_system)
-            unique_atoms = self._topology_proposal.unique_old_atoms
-            atoms_with_positions = [structure.atoms[atom_idx] for atom_idx in self._topology_proposal.old_to_new_atom_map.keys()]
+            topology_view = self._topology_proposal.old_topology_view
+            atoms_with_positions = list(self._topology_proposal.old_to_new_atom_map.keys())
         else:
             raise ValueError("direction parameter must be either forward or reverse.")
+        rounds, candidate_torsions = self._get_proposal_plan(topology_view, atoms_with_positions)
 
-        # Determine list of atoms to be added.
-        new_hydrogen_atoms = [ structure.atoms[idx] for idx in unique_atoms if structure.atoms[idx].atomic_number == 1 ]
-        new_heavy_atoms    = [ structure.atoms[idx] for idx in unique_atoms if structure.atoms[idx].atomic_number != 1 ]
-
-        # DEBUG
-        #print('STRUCTURE')
-        #print(structure)
-        #for atom in structure.atoms:
-        #    print(atom, atom.bonds, atom.angles, atom.dihedrals)
-        #print('')
-
-        def add_atoms(new_atoms, atoms_torsions):
-            """
-            Add the specified atoms to the ordered list of torsions to be drawn.
-
-            Parameters
-            ----------
-            new_atoms : list
-                List of atoms to be added.
-            atoms_torsions : OrderedDict
-                List of torsions to be added.
-
-            Returns
-            -------
-            logp_torsion_choice : float
-                The log torsion cchoice probability associated with these added torsions.
-
-            """
-            from scipy import special
-            logp_torsion_choice = 0.0
-            while(len(new_atoms))>0:
-                eligible_atoms = self._atoms_eligible_for_proposal(new_atoms, atoms_with_positions)
-
-                #randomize positions
-                eligible_atoms_in_order = np.random.choice(eligible_atoms, size=len(eligible_atoms), replace=False)
-
-                #the logp of this choice is log(1/n!)
-                #gamma is (n-1)!, log-gamma is more numerically stable.
-                logp_torsion_choice += -special.gammaln(len(eligible_atoms)+1)
-
-                if (len(new_atoms) > 0) and (len(eligible_atoms) == 0):
-                    raise Exception('new_atoms (%s) has remaining atoms to place, but eligible_atoms is empty.' % str(new_atoms))
-
-                #choose the torsions
-                for atom in eligible_atoms_in_order:
-                    chosen_torsion, logp_choice = self._choose_torsion(atoms_with_positions, atom)
-                    atoms_torsions[atom] = chosen_torsion
-                    logp_torsion_choice += logp_choice
-                    new_atoms.remove(atom)
-                    atoms_with_positions.append(atom)
-
-            return logp_torsion_choice
-
-        # Handle heavy atoms before hydrogen atoms
+        has_position = np.zeros(topology_view.n_atoms, dtype=bool)
+        has_position[atoms_with_positions] = True
         logp_torsion_choice = 0.0
         atoms_torsions = collections.OrderedDict()
-        logp_torsion_choice += add_atoms(new_heavy_atoms, atoms_torsions)
-        logp_torsion_choice += add_atoms(new_hydrogen_atoms, atoms_torsions)
-
-        return atoms_torsions, logp_torsion_choice
+        for eligible_atoms in rounds:
+            if group_hydrogens and np.all(topology_view.atomic_numbers[eligible_atoms] == 1):
+                logp_torsion_choice += self._choose_hydrogen_groups(topology_view, eligible_atoms, candidate_torsions, has_position, atoms_torsions)
+                continue
 
+            #randomize positions
+            eligible_atoms_in_order = get_random_state().choice(eligible_atoms, size=len(eligible_atoms), replace=False)
+
+            #the logp of this choice is log(1/n!)
+            #gamma is (n-1)!, log-gamma is more numerically stable.
+            logp_torsion_choice += -special.gammaln(len(eligible_atoms)+1)
+
+            #choose the torsions
+            for atom_index in eligible_atoms_in_order:
+                torsions = candidate_torsions[atom_index]
+                eligible_torsions = torsions[np.all(has_position[torsions[:, 1:]], axis=1)]
+                if len(eligible_torsions) == 0:
+                    raise NoTorsionError("No eligible torsions found for placing atom %s." % str(topology_view.atom(atom_index)))
+                torsion_idx = get_random_state().randint(0, len(eligible_torsions))
+                torsion = GeometryTorsion(*topology_view.atoms(eligible_torsions[torsion_idx]))
+                atoms_torsions[torsion.atom1] = torsion
+                logp_torsion_choice += np.log(1.0/len(eligible_torsions))
+                has_position[atom_index] = True
 
-    def _atoms_eligible_for_proposal(self, new_atoms, atoms_with_positions):
-        """
-        Get the set of atoms currently eligible for proposal
+        return atoms_torsions, logp_torsion_choice
 
-        Parameters
-        ----------
-        new_atoms : list of parmed.Atom
-            the new atoms that need positions
-        atoms_with_positions : list of parmed.Atom
-            the atoms with positions
+    @staticmethod
+    def _choose_hydrogen_groups(topology_view, eligible_atoms, candidate_torsions, has_position, atoms_torsions):
         """
-        eligible_atoms = []
-        for atom in new_atoms:
-            #get all topological torsions for the appropriate atom
-            torsions = self._get_topological_torsions(atoms_with_positions, atom)
-
-            #go through the topological torsions (atom1 is always the new atom), and if one of them has
-            #atoms 2, 3, 4 in atoms_with_positions, the atom is eligible.
-            for torsion in torsions:
-                if torsion.atom2 in atoms_with_positions and torsion.atom3 in atoms_with_positions and torsion.atom4 in atoms_with_positions:
-                    eligible_atoms.append(atom)
+        Choose the order and torsions of a round of hydrogens grouped by the atom they are bonded to,
+        adding them to atoms_torsions and marking them as positioned.
 
-        return list(set(eligible_atoms))
-
-    def _choose_torsion(self, atoms_with_positions, atom_for_proposal):
-        """
-        Get a torsion from the set of possible topological torsions.
+        Returns
+        -------
+        logp_choice : float
+            The log probability of the choice
+        """
+        from scipy import special
+        groups = collections.OrderedDict()
+        for atom_index in sorted(eligible_atoms):
+            groups.setdefault(candidate_torsions[atom_index][0, 1], list()).append(atom_index)
+        group_order = get_random_state().permutation(len(groups))
+        logp_choice = -special.gammaln(len(groups)+1)
+        bonded_atoms = list(groups.keys())
+        for group_index in group_order:
+            hydrogens = groups[bonded_atoms[group_index]]
+            torsions = candidate_torsions[hydrogens[0]]
+            eligible_torsions = torsions[np.all(has_position[torsions[:, 1:]], axis=1)]
+            if len(eligible_torsions) == 0:
+                raise NoTorsionError("No eligible torsions found for placing atom %s." % str(topology_view.atom(hydrogens[0])))
+            torsion_idx = get_random_state().randint(0, len(eligible_torsions))
+            logp_choice += np.log(1.0/len(eligible_torsions))
+            for atom_index in hydrogens:
+                torsion = GeometryTorsion(*topology_view.atoms([atom_index] + list(eligible_torsions[torsion_idx, 1:])))
+                atoms_torsions[torsion.atom1] = torsion
+                has_position[atom_index] = True
+        return logp_choice
+
+    @classmethod
+    def _get_proposal_plan(cls, topology_view, atoms_with_positions):
+        """
+        Get the memoized proposal plan for a topology and set of atoms with positions, computing it if needed.
+        """
+        plan_key = (topology_view.graph_key, frozenset(atoms_with_positions))
+        with cls._cache_lock:
+            if plan_key in cls._plan_cache:
+                cls._plan_cache.move_to_end(plan_key)
+                return cls._plan_cache[plan_key]
+        plan = cls._compute_proposal_plan(topology_view.bond_graph, topology_view.atomic_numbers, atoms_with_positions)
+        with cls._cache_lock:
+            cls._plan_cache[plan_key] = plan
+            while len(cls._plan_cache) > cls._cache_size:
+                cls._plan_cache.popitem(last=False)
+        return plan
+
+    @classmethod
+    def _compute_proposal_plan(cls, bond_graph, atomic_numbers, atoms_with_positions):
+        """
+        Compute the deterministic part of the proposal order: heavy atoms are placed before hydrogens,
+        and in each round, all atoms with a torsion to atoms that already have positions are placed.
 
         Parameters
         ----------
-        atoms_with_positions : list of parmed.Atom
-            list of the atoms that already have positions
-        atom_for_proposal : parmed.Atom
-            atom that is being proposed now
+        bond_graph : tuple of (np.ndarray of int, np.ndarray of int)
+            The CSR row pointers and neighbor indices of the bond graph
+        atomic_numbers : np.ndarray of int
+            The atomic number of each atom
+        atoms_with_positions : list of int
+            The atoms that already have positions
 
         Returns
         -------
-        torsion_selected, logp_torsion_choice : parmed.Dihedral, float
-            The torsion that was selected, along with the logp of the choice.
-
-        """
-        eligible_torsions = self._get_topological_torsions(atoms_with_positions, atom_for_proposal)
-        if not eligible_torsions:
-            raise NoTorsionError("No eligible torsions found for placing atom %s." % str(atom_for_proposal))
-        torsion_idx = np.random.randint(0, len(eligible_torsions))
-        torsion_selected = eligible_torsions[torsion_idx]
-        return torsion_selected, np.log(1.0/len(eligible_torsions))
+        rounds : list of np.ndarray of int
+            The atoms placed in each round
+        candidate_torsions : dict of int : np.ndarray [n_torsions, 4] of int
+            The topological torsions (atom, bond atom, angle atom, torsion atom) that may be used to place each atom.
+            Torsions involving atoms of the same round are only eligible once those atoms have been placed.
+        """
+        indptr, indices = bond_graph
+        has_position = np.zeros(len(atomic_numbers), dtype=bool)
+        has_position[atoms_with_positions] = True
+        unique_atoms = np.nonzero(~has_position)[0]
+        rounds = list()
+        candidate_torsions = dict()
+        # Handle heavy atoms before hydrogen atoms
+        for new_atoms in [unique_atoms[atomic_numbers[unique_atoms] != 1], unique_atoms[atomic_numbers[unique_atoms] == 1]]:
+            while len(new_atoms) > 0:
+                torsions = cls._enumerate_torsions(new_atoms, indptr, indices)
+                eligible_atoms = np.unique(torsions[np.all(has_position[torsions[:, 1:]], axis=1), 0])
+                if len(eligible_atoms) == 0:
+                    raise Exception('new_atoms (%s) has remaining atoms to place, but eligible_atoms is empty.' % str(new_atoms))
+                has_position[eligible_atoms] = True
+                torsions = torsions[np.isin(torsions[:, 0], eligible_atoms) & np.all(has_position[torsions[:, 1:]], axis=1)]
+                for atom_index in eligible_atoms:
+                    candidate_torsions[atom_index] = torsions[torsions[:, 0] == atom_index]
+                rounds.append(eligible_atoms)
+                new_atoms = new_atoms[~np.isin(new_atoms, eligible_atoms)]
+        return rounds, candidate_torsions
 
-    def _get_topological_torsions(self, atoms_with_positions, new_atom):
+    @staticmethod
+    def _enumerate_torsions(atoms, indptr, indices):
         """
-        Get the topological torsions involving new_atom. This includes
-        torsions which don't have any parameters assigned to them.
+        Enumerate all topological torsions (paths of four distinct bonded atoms) beginning with the given atoms.
 
         Parameters
         ----------
-        atoms_with_positions : list
-            list of atoms with a valid position
-        new_atom : parmed.Atom object
-            Atom object for the new atom
+        atoms : np.ndarray of int
+            The first atom of the torsions
+        indptr, indices : np.ndarray of int
+            The CSR bond graph
+
         Returns
         -------
-        torsions : list of parmed.Dihedral objects with no "type"
-            list of topological torsions including only atoms with positions
-        """
-        # Compute topological torsions beginning with atom `new_atom` in which all other atoms have positions
-        topological_torsions = list()
-        atom1 = new_atom
-        for bond12 in atom1.bonds:
-            atom2 = bond12.atom2 if bond12.atom1==atom1 else bond12.atom1
-            if atom2 not in atoms_with_positions:
-                continue
-            for bond23 in atom2.bonds:
-                atom3 = bond23.atom2 if bond23.atom1==atom2 else bond23.atom1
-                if (atom3 not in atoms_with_positions) or (atom3 in set([atom1, atom2])):
-                    continue
-                for bond34 in atom3.bonds:
-                    atom4 = bond34.atom2 if bond34.atom1==atom3 else bond34.atom1
-                    if (atom4 not in atoms_with_positions) or (atom4 in set([atom1, atom2, atom3])):
-                        continue
-                    topological_torsions.append((atom1, atom2, atom3, atom4))
-
-        if len(topological_torsions) == 0:
-            # Print debug information
-            self._logger.debug('No topological torsions found!')
-            self._logger.debug('atoms_with_positions: %s' % str(atoms_with_positions))
-            self._logger.debug('new_atom: %s' % new_atom)
-            self._logger.debug('bonds involving new atom:')
-            self._logger.debug(new_atom.bonds)
-            self._logger.debug('angles involving new atom:')
-            self._logger.debug(new_atom.angles)
-            self._logger.debug('dihedrals involving new atom:')
-            self._logger.debug(new_atom.dihedrals)
-
-        # Recode topological torsions as parmed Dihedral objects
-        topological_torsions = [ parmed.Dihedral(atoms[0], atoms[1], atoms[2], atoms[3]) for atoms in topological_torsions ]
-        return topological_torsions
+        torsions : np.ndarray [n_torsions, 4] of int
+            The atoms of each torsion
+        """
+        paths = np.asarray(atoms, dtype=np.int64).reshape([-1, 1])
+        for path_length in range(3):
+            last_atoms = paths[:, -1]
+            n_neighbors = indptr[last_atoms+1] - indptr[last_atoms]
+            offsets = np.arange(np.sum(n_neighbors)) - np.repeat(np.cumsum(n_neighbors) - n_neighbors, n_neighbors)
+            next_atoms = indices[np.repeat(indptr[last_atoms], n_neighbors) + offsets]
+            paths = np.repeat(paths, n_neighbors, axis=0)
+            distinct = np.all(paths != next_atoms[:, np.newaxis], axis=1)
+            paths = np.column_stack([paths[distinct], next_atoms[distinct]])
+        return paths
 
 
 class NoTorsionError(Exception):
@@ -0,0 +1,428 @@
+"""
+Vectorized, incremental evaluation of the growth-system energies used by the geometry engine.
+
+The torsion probability mass function only depends on the energy terms that contain
+the atom being placed, so instead of setting positions in an OpenMM Context once per
+torsion grid point, the terms are read from the growth System generated by
+GeometrySystemGenerator and evaluated for all candidate positions at once with numpy.
+"""
+import collections
+import numpy as np
+import simtk.openmm as openmm
+import simtk.unit as units
+
+ONE_4PI_EPS0 = 138.935456 # OpenMM constant for Coulomb interactions (openmm/platforms/reference/include/SimTKOpenMMRealType.h) in OpenMM units
+
+def _distances(xyz_a, xyz_b):
+    """
+    Compute distances between two sets of points along the last axis
+    """
+    return np.sqrt(np.sum((xyz_a - xyz_b)**2, axis=-1))
+
+def _angles(xyz_a, xyz_b, xyz_c):
+    """
+    Compute the angle a-b-c (centered on b) in radians along the last axis
+    """
+    u = xyz_a - xyz_b
+    v = xyz_c - xyz_b
+    cos_angle = np.sum(u*v, axis=-1) / np.sqrt(np.sum(u*u, axis=-1)*np.sum(v*v, axis=-1))
+    return np.arccos(np.clip(cos_angle, -1.0, 1.0))
+
+def _dihedrals(xyz_a, xyz_b, xyz_c, xyz_d):
+    """
+    Compute the dihedral a-b-c-d in radians along the last axis, using the same sign convention as OpenMM
+    """
+    b1 = xyz_b - xyz_a
+    b2 = xyz_c - xyz_b
+    b3 = xyz_d - xyz_c
+    n1 = np.cross(b1, b2)
+    n2 = np.cross(b2, b3)
+    y = np.sqrt(np.sum(b2*b2, axis=-1)) * np.sum(b1*n2, axis=-1)
+    x = np.sum(n1*n2, axis=-1)
+    return np.arctan2(y, x)
+
+class GrowthSystemEnergy(object):
+    """
+    Evaluate the energy terms of a growth System that involve a single atom for many
+    candidate positions of that atom in one vectorized pass.
+
+    The energy of the atoms that have already been placed is cached in fixed_energy and
+    updated incrementally with update_fixed_energy() as each atom is placed, so that only
+    the terms of the atom being placed (the bonds, angles, torsions and exceptions carrying
+    its growth_idx, and its nonbonded partners within the cutoff) are computed for each
+    candidate position. The cost per placed atom is therefore proportional to the number
+    of its terms and neighbors rather than to the size of the system.
+
+    Terms between atoms that are never grown (growth_idx 0), such as the extra ring torsions and angles
+    GeometrySystemGenerator adds between core atoms, are constant during a proposal; their energy is
+    added to fixed_energy by reset() when the positions of the core atoms are given.
+
+    Parameters
+    ----------
+    growth_system : simtk.openmm.System
+        The System returned by GeometrySystemGenerator.get_modified_system()
+    """
+
+    def __init__(self, growth_system):
+        self._n_particles = growth_system.getNumParticles()
+        self._bonds = None
+        self._angles = None
+        self._torsions = None
+        self._exceptions = None
+        self._nonbonded = None
+        self.growth_stage = 0
+        self.fixed_energy = 0.0
+        self._box_vectors = np.array([vector.value_in_unit(units.nanometers) for vector in growth_system.getDefaultPeriodicBoxVectors()])
+        for force_index in range(growth_system.getNumForces()):
+            force = growth_system.getForce(force_index)
+            if isinstance(force, openmm.CustomBondForce):
+                if force.getPerBondParameterName(0) == 'chargeprod':
+                    self._exceptions = self._read_terms(force, force.getNumBonds(), force.getBondParameters, 2)
+                else:
+                    self._bonds = self._read_terms(force, force.getNumBonds(), force.getBondParameters, 2)
+            elif isinstance(force, openmm.CustomAngleForce):
+                self._angles = self._read_terms(force, force.getNumAngles(), force.getAngleParameters, 3)
+            elif isinstance(force, openmm.CustomTorsionForce):
+                self._torsions = self._read_terms(force, force.getNumTorsions(), force.getTorsionParameters, 4)
+            elif isinstance(force, openmm.CustomNonbondedForce):
+                self._nonbonded = self._read_nonbonded(force)
+            else:
+                raise ValueError("Force %s is not supported in a growth system" % force.__class__.__name__)
+
+    def _read_terms(self, force, n_terms, get_parameters, n_atoms):
+        """
+        Read the atom indices and per-term parameters of a custom valence force into arrays.
+
+        Returns
+        -------
+        atoms : np.ndarray [n_terms, n_atoms] of int
+            The atom indices of each term
+        parameters : np.ndarray [n_terms, n_parameters] of float
+            The parameters of each term; the last parameter is growth_idx
+        atom_terms : dict of int : np.ndarray of int
+            The indices of the terms containing each atom
+        """
+        terms = [get_parameters(term_index) for term_index in range(n_terms)]
+        atoms = np.array([term[:n_atoms] for term in terms], dtype=np.int64).reshape([n_terms, n_atoms])
+        parameters = np.array([term[n_atoms] for term in terms], dtype=np.float64).reshape([n_terms, -1])
+        atom_terms = collections.defaultdict(list)
+        for term_index, term_atoms in enumerate(atoms):
+            for atom_index in set(term_atoms):
+                atom_terms[atom_index].append(term_index)
+        atom_terms = {atom_index : np.array(term_indices, dtype=np.int64) for atom_index, term_indices in atom_terms.items()}
+        return atoms, parameters, atom_terms
+
+    def _read_nonbonded(self, force):
+        """
+        Read the per-particle parameters, exclusions, interaction groups and cutoff of the sterics force.
+        """
+        nonbonded = dict()
+        n_particles = force.getNumParticles()
+        parameters = np.array([force.getParticleParameters(particle_index) for particle_index in range(n_particles)], dtype=np.float64)
+        nonbonded['charge'] = parameters[:, 0]
+        nonbonded['sigma'] = parameters[:, 1]
+        nonbonded['epsilon'] = parameters[:, 2]
+        nonbonded['growth_idx'] = parameters[:, 3]
+        exclusions = collections.defaultdict(list)
+        for exclusion_index in range(force.getNumExclusions()):
+            particle_index_1, particle_index_2 = force.getExclusionParticles(exclusion_index)
+            exclusions[particle_index_1].append(particle_index_2)
+            exclusions[particle_index_2].append(particle_index_1)
+        nonbonded['exclusions'] = {particle_index : np.array(excluded, dtype=np.int64) for particle_index, excluded in exclusions.items()}
+        interaction_groups = []
+        for group_index in range(force.getNumInteractionGroups()):
+            set1, set2 = force.getInteractionGroupParameters(group_index)
+            in_set1 = np.zeros(n_particles, dtype=bool)
+            in_set2 = np.zeros(n_particles, dtype=bool)
+            in_set1[list(set1)] = True
+            in_set2[list(set2)] = True
+            interaction_groups.append((in_set1, in_set2))
+        nonbonded['interaction_groups'] = interaction_groups
+        nonbonded['method'] = force.getNonbondedMethod()
+        nonbonded['cutoff'] = force.getCutoffDistance().value_in_unit(units.nanometers)
+        return nonbonded
+
+    def set_growth_stage(self, growth_stage):
+        """
+        Set the growth stage, mirroring GeometrySystemGenerator.set_growth_parameter_index
+
+        Parameters
+        ----------
+        growth_stage : int
+            Terms with growth_idx <= growth_stage are active
+        """
+        self.growth_stage = growth_stage
+
+    def reset(self, positions=None):
+        """
+        Reset the growth stage and the cached fixed_energy so that a new proposal can be started.
+
+        Parameters
+        ----------
+        positions : np.ndarray [n_atoms, 3] of float, in nm, optional, default=None
+            Positions of the system at the start of the proposal; if specified, fixed_energy starts at the
+            energy of the terms with growth_idx 0, so that growth energies match the growth Context
+        """
+        self.growth_stage = 0
+        self.fixed_energy = 0.0
+        if positions is not None:
+            self.fixed_energy = self.compute_constant_energy(positions)
+
+    def compute_constant_energy(self, positions):
+        """
+        Compute the energy of the terms with growth_idx 0, which are active at all growth stages
+        and only contain atoms that are not grown.
+
+        Parameters
+        ----------
+        positions : np.ndarray [n_atoms, 3] of float, in nm
+            Positions of the system; only those of the atoms that are not grown are used
+
+        Returns
+        -------
+        energy : float
+            The energy of the constant terms, in kJ/mol
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        energy = 0.0
+        for kind, terms in [('bonds', self._bonds), ('angles', self._angles), ('torsions', self._torsions), ('exceptions', self._exceptions)]:
+            if terms is None:
+                continue
+            atoms, parameters, _ = terms
+            constant = (parameters[:, -1] == 0)
+            if np.any(constant):
+                energy += np.sum(self._term_energies(kind, positions[atoms[constant]][np.newaxis], parameters[constant]))
+        return energy
+
+    @staticmethod
+    def _term_energies(kind, coordinates, parameters):
+        """
+        Compute the energies of valence terms or exceptions from their coordinates.
+
+        Parameters
+        ----------
+        kind : str
+            One of 'bonds', 'angles', 'torsions' or 'exceptions'
+        coordinates : np.ndarray [n_positions, n_terms, n_atoms, 3] of float, in nm
+            The coordinates of the atoms of each term
+        parameters : np.ndarray [n_terms, n_parameters] of float
+            The parameters of each term
+
+        Returns
+        -------
+        energies : np.ndarray [n_positions] of float, in kJ/mol
+            The summed energy of the terms
+        """
+        if kind == 'bonds':
+            r = _distances(coordinates[:, :, 0], coordinates[:, :, 1])
+            return np.sum(0.5*parameters[:, 1]*(r - parameters[:, 0])**2, axis=1)
+        elif kind == 'angles':
+            theta = _angles(coordinates[:, :, 0], coordinates[:, :, 1], coordinates[:, :, 2])
+            return np.sum(0.5*parameters[:, 1]*(theta - parameters[:, 0])**2, axis=1)
+        elif kind == 'torsions':
+            phi = _dihedrals(coordinates[:, :, 0], coordinates[:, :, 1], coordinates[:, :, 2], coordinates[:, :, 3])
+            return np.sum(parameters[:, 2]*(1.0 + np.cos(parameters[:, 0]*phi - parameters[:, 1])), axis=1)
+        else:
+            r = _distances(coordinates[:, :, 0], coordinates[:, :, 1])
+            x = (parameters[:, 1]/r)**6
+            return np.sum(ONE_4PI_EPS0*parameters[:, 0]/r + 4.0*parameters[:, 2]*x*(x - 1.0), axis=1)
+
+    def update_fixed_energy(self, atom_index, positions):
+        """
+        Add the energy of the terms of an atom that has just been placed to the cached fixed_energy.
+
+        This should be called once the atom placed at the current growth stage has its final position,
+        before moving to the next growth stage.
+
+        Parameters
+        ----------
+        atom_index : int
+            The index of the atom that was placed
+        positions : np.ndarray [n_atoms, 3] of float, in nm
+            Positions of all atoms in the system, including the placed atom
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        self.fixed_energy += self.compute_atom_energies(atom_index, positions[atom_index][np.newaxis, :], positions)[0]
+
+    def compute_growth_energies(self, atom_index, xyzs, positions):
+        """
+        Compute the potential energy of the growth system for each candidate position of atom_index,
+        as the cached fixed_energy plus the energy of the terms of atom_index.
+
+        Parameters
+        ----------
+        atom_index : int
+            The index of the atom being placed at the current growth stage
+        xyzs : np.ndarray [n_positions, 3] of float, in nm
+            Candidate positions of the atom being placed
+        positions : np.ndarray [n_atoms, 3] of float, in nm
+            Positions of all atoms in the system; the entry for atom_index is ignored
+
+        Returns
+        -------
+        energies : np.ndarray [n_positions] of float, in kJ/mol
+            The potential energy of the growth system for each candidate position
+        """
+        return self.fixed_energy + self.compute_atom_energies(atom_index, xyzs, positions)
+
+    def _active_terms(self, terms, atom_index):
+        """
+        Select the terms containing atom_index that are active at the current growth stage
+        """
+        atoms, parameters, atom_terms = terms
+        if atom_index not in atom_terms:
+            return atoms[:0], parameters[:0]
+        term_indices = atom_terms[atom_index]
+        term_indices = term_indices[self.growth_stage + 0.1 - parameters[term_indices, -1] >= 0]
+        return atoms[term_indices], parameters[term_indices]
+
+    def valence_terms(self, atom_index):
+        """
+        Get the active terms containing atom_index, if they are the only terms its growth energy depends on.
+
+        Parameters
+        ----------
+        atom_index : int
+            The index of the atom being placed
+
+        Returns
+        -------
+        terms : list of (str, np.ndarray [n_terms, n_atoms] of int, np.ndarray [n_terms, n_parameters] of float) or None
+            The kind ('bonds', 'angles', 'torsions' or 'exceptions'), atom indices and parameters (without growth_idx)
+            of the active terms containing atom_index, or None if the growth system has a sterics force
+        """
+        if self._nonbonded is not None:
+            return None
+        terms = list()
+        for kind, kind_terms in [('bonds', self._bonds), ('angles', self._angles), ('torsions', self._torsions), ('exceptions', self._exceptions)]:
+            if kind_terms is None:
+                continue
+            atoms, parameters = self._active_terms(kind_terms, atom_index)
+            if len(atoms) > 0:
+                terms.append((kind, atoms, parameters[:, :-1]))
+        return terms
+
+    def _term_coordinates(self, atoms, atom_index, xyzs, positions, moving_positions=None):
+        """
+        Gather the coordinates of each term for each candidate position of the moving atom,
+        and of the other moving atoms if specified
+
+        Returns
+        -------
+        coordinates : np.ndarray [n_positions, n_terms, n_atoms, 3]
+        """
+        coordinates = np.broadcast_to(positions[..., atoms, :], (len(xyzs),) + atoms.shape + (3,)).copy()
+        term_index, atom_slot = np.nonzero(atoms == atom_index)
+        coordinates[:, term_index, atom_slot, :] = xyzs[:, np.newaxis, :]
+        if moving_positions:
+            for moving_atom_index, moving_xyzs in moving_positions.items():
+                term_index, atom_slot = np.nonzero(atoms == moving_atom_index)
+                coordinates[:, term_index, atom_slot, :] = moving_xyzs[:, np.newaxis, :]
+        return coordinates
+
+    def compute_atom_energies(self, atom_index, xyzs, positions, moving_positions=None):
+        """
+        Compute the energy of all active terms containing atom_index for each candidate position.
+
+        Parameters
+        ----------
+        atom_index : int
+            The index of the atom being placed
+        xyzs : np.ndarray [n_positions, 3] of float, in nm
+            Candidate positions of the atom being placed
+        positions : np.ndarray [n_atoms, 3] or [n_positions, n_atoms, 3] of float, in nm
+            Positions of all atoms in the system, shared by all candidate positions or one set per
+            candidate position (e.g. for the particles of BootstrapParticleFilter); the entry for atom_index is ignored
+        moving_positions : dict of int : np.ndarray [n_positions, 3] of float, optional, default=None
+            Positions of other atoms that also move with each candidate position (e.g. the other hydrogens of a rotor),
+            overriding their entries in positions
+
+        Returns
+        -------
+        energies : np.ndarray [n_positions] of float, in kJ/mol
+            The energy of the terms containing atom_index for each candidate position
+        """
+        xyzs = np.asarray(xyzs, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.float64)
+        energies = np.zeros(len(xyzs))
+
+        for kind, terms in [('bonds', self._bonds), ('angles', self._angles), ('torsions', self._torsions), ('exceptions', self._exceptions)]:
+            if terms is None:
+                continue
+            atoms, parameters = self._active_terms(terms, atom_index)
+            if len(atoms) > 0:
+                coordinates = self._term_coordinates(atoms, atom_index, xyzs, positions, moving_positions)
+                energies += self._term_energies(kind, coordinates, parameters)
+
+        if self._nonbonded is not None:
+            energies += self._compute_nonbonded_energies(atom_index, xyzs, positions, moving_positions)
+
+        return energies
+
+    def _minimum_image(self, displacements):
+        """
+        Apply the minimum image convention to displacements if the sterics force is periodic
+        """
+        if self._nonbonded['method'] == openmm.CustomNonbondedForce.CutoffPeriodic:
+            # Only rectangular boxes are supported, since the growth system is not periodic in the general case
+            box_lengths = np.diag(self._box_vectors)
+            displacements = displacements - box_lengths*np.round(displacements/box_lengths)
+        return displacements
+
+    def _nonbonded_partners(self, atom_index, xyzs, positions, moving_positions=None):
+        """
+        Determine the particles interacting with atom_index through the sterics force at the current growth stage.
+
+        If the sterics force has a cutoff, only particles within the cutoff of the sphere enclosing all
+        candidate positions are returned, so the pair energies only need to be computed for neighbors.
+        Moving atoms are always returned if they interact with atom_index.
+        """
+        nonbonded = self._nonbonded
+        if nonbonded['interaction_groups']:
+            partners = np.zeros(self._n_particles, dtype=bool)
+            for in_set1, in_set2 in nonbonded['interaction_groups']:
+                if in_set1[atom_index]:
+                    partners |= in_set2
+                if in_set2[atom_index]:
+                    partners |= in_set1
+        else:
+            partners = np.ones(self._n_particles, dtype=bool)
+        partners[atom_index] = False
+        if atom_index in nonbonded['exclusions']:
+            partners[nonbonded['exclusions'][atom_index]] = False
+        growth_idx = np.maximum(nonbonded['growth_idx'], nonbonded['growth_idx'][atom_index])
+        partners &= (self.growth_stage + 0.1 - growth_idx >= 0)
+        partners = np.nonzero(partners)[0]
+        if nonbonded['method'] != openmm.CustomNonbondedForce.NoCutoff:
+            center = np.mean(xyzs, axis=0)
+            radius = np.max(_distances(xyzs, center))
+            distances = np.sqrt(np.sum(self._minimum_image(positions[..., partners, :] - center)**2, axis=-1))
+            # With one set of positions per candidate position, keep the partners that are close in any set
+            distances = np.min(distances.reshape([-1, len(partners)]), axis=0)
+            is_moving = np.isin(partners, list(moving_positions.keys())) if moving_positions else np.zeros(len(partners), dtype=bool)
+            partners = partners[(distances < nonbonded['cutoff'] + radius) | is_moving]
+        return partners
+
+    def _compute_nonbonded_energies(self, atom_index, xyzs, positions, moving_positions=None):
+        """
+        Compute the sterics and electrostatics energy of atom_index with its partners for each candidate position
+        """
+        nonbonded = self._nonbonded
+        partners = self._nonbonded_partners(atom_index, xyzs, positions, moving_positions)
+        if len(partners) == 0:
+            return np.zeros(len(xyzs))
+        partner_positions = np.broadcast_to(positions[..., partners, :], (len(xyzs), len(partners), 3))
+        if moving_positions:
+            partner_positions = partner_positions.copy()
+            for moving_atom_index, moving_xyzs in moving_positions.items():
+                partner_positions[:, partners == moving_atom_index, :] = moving_xyzs[:, np.newaxis, :]
+        displacements = self._minimum_image(partner_positions - xyzs[:, np.newaxis, :])
+        r = np.sqrt(np.sum(displacements**2, axis=-1))
+        epsilon = np.sqrt(nonbonded['epsilon'][atom_index]*nonbonded['epsilon'][partners])
+        sigma = 0.5*(nonbonded['sigma'][atom_index] + nonbonded['sigma'][partners])
+        chargeprod = nonbonded['charge'][atom_index]*nonbonded['charge'][partners]
+        x = (sigma/r)**6
+        pair_energies = 4.0*epsilon*x*(x - 1.0) + ONE_4PI_EPS0*chargeprod/r
+        if nonbonded['method'] != openmm.CustomNonbondedForce.NoCutoff:
+            pair_energies = np.where(r < nonbonded['cutoff'], pair_energies, 0.0)
+        return np.sum(pair_energies, axis=1)
@@ -0,0 +1,68 @@
+"""
+Per-thread random number streams for proposals.
+
+All random numbers drawn by the proposal and geometry engines and by the samplers come from
+get_random_state(), which is numpy's global random state unless the calling thread has selected
+its own stream with using_random_state(). Samplers updated concurrently in a thread pool can thus
+each draw from their own stream, and produce the same results regardless of thread scheduling.
+"""
+import contextlib
+import threading
+import numpy as np
+
+_thread_state = threading.local()
+
+def get_random_state():
+    """
+    Get the random number stream of the calling thread.
+
+    Returns
+    -------
+    random_state : np.random.RandomState or the np.random module
+        The stream selected with using_random_state in this thread, or np.random if none is selected;
+        both provide randn, uniform, choice, randint and random
+    """
+    random_state = getattr(_thread_state, 'random_state', None)
+    if random_state is None:
+        return np.random
+    return random_state
+
+@contextlib.contextmanager
+def using_random_state(random_state):
+    """
+    Draw the random numbers of the calling thread from the given stream inside the context.
+
+    Parameters
+    ----------
+    random_state : np.random.RandomState or None
+        The stream; if None, the global numpy random state is used
+    """
+    previous_random_state = getattr(_thread_state, 'random_state', None)
+    _thread_state.random_state = random_state
+    try:
+        yield random_state
+    finally:
+        _thread_state.random_state = previous_random_state
+
+def spawn_random_states(random_state, n_streams):
+    """
+    Create independent, reproducible random number streams.
+
+    Parameters
+    ----------
+    random_state : int, np.random.RandomState or None
+        Seed or stream from which the seeds of the new streams are drawn; if None, they are drawn
+        from the global numpy random state
+    n_streams : int
+        Number of streams
+
+    Returns
+    -------
+    random_states : list of np.random.RandomState
+        The new streams
+    """
+    if random_state is None:
+        random_state = np.random
+    elif not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    return [np.random.RandomState(random_state.randint(2**31 - 1)) for stream_index in range(n_streams)]
@@ -16,6 +16,8 @@ import tempfile
 from openmoltools import forcefield_generators
 import openeye.oegraphsim as oegraphsim
 from perses.rjmc.geometry import FFAllAngleGeometryEngine
+from perses.rjmc.topology_view import GeometryTopologyView
+from perses.rjmc.random_state import get_random_state
 from perses.storage import NetCDFStorageView
 try:
     from StringIO import StringIO
@@ -160,6 +162,10 @@ class TopologyProposal(object):
         The proposed chemical state key
     metadata : dict
         additional information of interest about the state
+    new_topology_view : perses.rjmc.topology_view.GeometryTopologyView
+        Array-backed view of the new topology and system, built on first use
+    old_topology_view : perses.rjmc.topology_view.GeometryTopologyView
+        Array-backed view of the old topology and system, built on first use
     """
 
     def __init__(self,
@@ -188,6 +194,8 @@ class TopologyProposal(object):
         self._old_environment_atoms = set(range(old_system.getNumParticles())) - self._old_alchemical_atoms
         self._new_environment_atoms = set(range(new_system.getNumParticles())) - self._new_alchemical_atoms
         self._metadata = metadata
+        self._new_topology_view = None
+        self._old_topology_view = None
 
     @property
     def new_topology(self):
@@ -243,6 +251,16 @@ class TopologyProposal(object):
     @property
     def metadata(self):
         return self._metadata
+    @property
+    def new_topology_view(self):
+        if self._new_topology_view is None:
+            self._new_topology_view = GeometryTopologyView(self._new_topology, self._new_system)
+        return self._new_topology_view
+    @property
+    def old_topology_view(self):
+        if self._old_topology_view is None:
+            self._old_topology_view = GeometryTopologyView(self._old_topology, self._old_system)
+        return self._old_topology_view
 
 class ProposalEngine(object):
     """
@@ -765,7 +783,7 @@ class PolymerProposalEngine(ProposalEngine):
             msg += 'oegraphmol_proposed:\n'
             msg += describe_oemol(oegraphmol_proposed)
             raise Exception(msg)
-        match = np.random.choice(matches)
+        match = get_random_state().choice(matches)
         new_to_old_atom_map = {}
         for matchpair in match.GetAtoms():
             old_index = matchpair.pattern.GetData("topology_index")
@@ -924,7 +942,7 @@ class PointMutationEngine(PolymerProposalEngine):
                 location_prob[allowed_mutations.index(current_mutation)] = 0.0
         else:
             location_prob = np.array([1.0/(len(allowed_mutations)+1.0) for i in range(len(allowed_mutations)+1)])
-        proposed_location = np.random.choice(range(len(allowed_mutations)+1), p=location_prob)
+        proposed_location = get_random_state().choice(range(len(allowed_mutations)+1), p=location_prob)
         if proposed_location == len(allowed_mutations):
             # choose WT
             pass
@@ -941,7 +959,7 @@ class PointMutationEngine(PolymerProposalEngine):
                 if residue_name == 'HIS':
                     his_state = ['HIE','HID']
                     his_prob = np.array([0.5 for i in range(len(his_state))])
-                    his_choice = np.random.choice(range(len(his_state)),p=his_prob)
+                    his_choice = get_random_state().choice(range(len(his_state)),p=his_prob)
                     index_to_new_residues[residue_id_to_index[residue_id]] = his_state[his_choice]
                 # DEBUG
                 if self.verbose: print('Proposed mutation: %s %s %s' % (original_residue.name, residue_id, residue_name))
@@ -999,7 +1017,7 @@ class PointMutationEngine(PolymerProposalEngine):
 
         for i in range(self._max_point_mutants):
             # proposed_location : int, index of chosen entry in location_prob
-            proposed_location = np.random.choice(range(num_residues), p=location_prob)
+            proposed_location = get_random_state().choice(range(num_residues), p=location_prob)
             # original_residue : simtk.openmm.app.topology.Residue
             original_residue = chain_residues[proposed_location]
             if original_residue.name in ['HIE','HID']:
@@ -1011,7 +1029,7 @@ class PointMutationEngine(PolymerProposalEngine):
             else:
                 amino_prob = np.array([1.0/(len(aminos)) for k in range(len(aminos))])
             # proposed_amino_index : int, index of three letter residue name in aminos list
-            proposed_amino_index = np.random.choice(range(len(aminos)), p=amino_prob)
+            proposed_amino_index = get_random_state().choice(range(len(aminos)), p=amino_prob)
             # index_to_new_residues : dict, key : int (index of residue, 0-indexed), value : str (three letter residue name)
             if self._residues_allowed_to_mutate is not None:
                 proposed_location = residue_id_to_index[self._residues_allowed_to_mutate[proposed_location]]
@@ -1019,7 +1037,7 @@ class PointMutationEngine(PolymerProposalEngine):
             if aminos[proposed_amino_index] == 'HIS':
                 his_state = ['HIE','HID']
                 his_prob = np.array([0.5 for j in range(len(his_state))])
-                his_choice = np.random.choice(range(len(his_state)),p=his_prob)
+                his_choice = get_random_state().choice(range(len(his_state)),p=his_prob)
                 index_to_new_residues[proposed_location] = his_state[his_choice]
         return index_to_new_residues
 
@@ -1123,7 +1141,7 @@ class PeptideLibraryEngine(PolymerProposalEngine):
             raise Exception("Chain '%s' not found in Topology. Chains present are: %s" % (chain_id, str(chains)))
         # location_prob : np.array, probability value for each residue location (uniform)
         location_prob = np.array([1.0/len(library) for i in range(len(library))])
-        proposed_location = np.random.choice(range(len(library)), p=location_prob)
+        proposed_location = get_random_state().choice(range(len(library)), p=location_prob)
         for residue_index, residue_one_letter in enumerate(library[proposed_location]):
             # original_residue : simtk.openmm.app.topology.Residue
             original_residue = chain._residues[residue_index]
@@ -1135,7 +1153,7 @@ class PeptideLibraryEngine(PolymerProposalEngine):
             if residue_name == 'HIS':
                 his_state = ['HIE','HID']
                 his_prob = np.array([0.5 for i in range(len(his_state))])
-                his_choice = np.random.choice(range(len(his_state)),p=his_prob)
+                his_choice = get_random_state().choice(range(len(his_state)),p=his_prob)
                 index_to_new_residues[residue_index] = his_state[his_choice]
 
         # index_to_new_residues : dict, key : int (index of residue, 0-indexed), value : str (three letter residue name)
@@ -1254,7 +1272,7 @@ class SystemGenerator(object):
         if self._barostat is not None:
             MAXINT = np.iinfo(np.int32).max
             barostat = openmm.MonteCarloBarostat(*self._barostat)
-            seed = np.random.randint(MAXINT)
+            seed = get_random_state().randint(MAXINT)
             barostat.setRandomNumberSeed(seed)
             system.addForce(barostat)
 
@@ -1710,7 +1728,7 @@ class SmallMoleculeSetProposalEngine(ProposalEngine):
 
         # Propose a new molecule
         molecule_probabilities = self._probability_matrix[current_smiles_idx, :]
-        proposed_smiles_idx = np.random.choice(range(len(self._smiles_list)), p=molecule_probabilities)
+        proposed_smiles_idx = get_random_state().choice(range(len(self._smiles_list)), p=molecule_probabilities)
         reverse_probability = self._probability_matrix[proposed_smiles_idx, current_smiles_idx]
         forward_probability = molecule_probabilities[proposed_smiles_idx]
         proposed_smiles = self._smiles_list[proposed_smiles_idx]
@@ -0,0 +1,212 @@
+"""
+Lightweight, array-backed view of the atoms, bonds and valence parameters of a Topology and System,
+exposing only what the geometry engine needs in place of a full parmed Structure.
+"""
+import collections
+import hashlib
+import numpy as np
+import simtk.openmm as openmm
+import simtk.unit as units
+
+GeometryAtom = collections.namedtuple('GeometryAtom', ['idx', 'name', 'atomic_number', 'residue_name'])
+GeometryBondType = collections.namedtuple('GeometryBondType', ['req', 'k'])
+GeometryAngleType = collections.namedtuple('GeometryAngleType', ['theteq', 'k'])
+GeometryBond = collections.namedtuple('GeometryBond', ['atom1', 'atom2', 'type'])
+GeometryAngle = collections.namedtuple('GeometryAngle', ['atom1', 'atom2', 'atom3', 'type'])
+GeometryTorsion = collections.namedtuple('GeometryTorsion', ['atom1', 'atom2', 'atom3', 'atom4'])
+
+class GeometryTopologyView(object):
+    """
+    Array-backed view of a Topology and its System for the geometry engine.
+
+    The atoms, bonds and angles are stored as integer arrays, and the harmonic bond and angle parameters
+    as float arrays in OpenMM units. Record objects with parmed-like attributes (atom.idx, bond.type.req, ...)
+    are only created for the atoms and terms that are queried. Bonds are the union of the Topology bonds and
+    the HarmonicBondForce terms; bonds without a HarmonicBondForce term (e.g. constrained bonds) have type None.
+
+    Parameters
+    ----------
+    topology : simtk.openmm.app.Topology
+        The topology
+    system : simtk.openmm.System
+        The system with the HarmonicBondForce and HarmonicAngleForce of the topology
+
+    Properties
+    ----------
+    n_atoms : int
+        The number of atoms
+    atomic_numbers : np.ndarray [n_atoms] of int
+        The atomic number of each atom, 0 for atoms without an element
+    bonds : np.ndarray [n_bonds, 2] of int
+        The atoms of each bond, with the lower index first
+    bond_parameters : np.ndarray [n_bonds, 2] of float
+        The equilibrium length (nm) and force constant (kJ/mol/nm**2) of each bond, nan if the bond has no parameters
+    angles : np.ndarray [n_angles, 3] of int
+        The atoms of each angle
+    angle_parameters : np.ndarray [n_angles, 2] of float
+        The equilibrium angle (radians) and force constant (kJ/mol/radian**2) of each angle
+    """
+    def __init__(self, topology, system):
+        atoms = list(topology.atoms())
+        self._n_atoms = len(atoms)
+        self._atomic_numbers = np.array([atom.element.atomic_number if atom.element is not None else 0 for atom in atoms], dtype=np.int64)
+        self._atom_names = [atom.name for atom in atoms]
+        self._residue_names = [atom.residue.name for atom in atoms]
+
+        bond_force = None
+        angle_force = None
+        for force in system.getForces():
+            if isinstance(force, openmm.HarmonicBondForce) and bond_force is None:
+                bond_force = force
+            elif isinstance(force, openmm.HarmonicAngleForce) and angle_force is None:
+                angle_force = force
+
+        # Bonds are the union of topology bonds and bond terms, identified by a unique pair key
+        topology_bonds = np.array([[bond[0].index, bond[1].index] for bond in topology.bonds()], dtype=np.int64).reshape([-1, 2])
+        force_bonds = np.zeros([0, 2], dtype=np.int64)
+        force_bond_parameters = np.zeros([0, 2], dtype=np.float64)
+        if bond_force is not None:
+            n_force_bonds = bond_force.getNumBonds()
+            force_bonds = np.zeros([n_force_bonds, 2], dtype=np.int64)
+            force_bond_parameters = np.zeros([n_force_bonds, 2], dtype=np.float64)
+            for index in range(n_force_bonds):
+                atom1, atom2, r0, k = bond_force.getBondParameters(index)
+                force_bonds[index] = [atom1, atom2]
+                force_bond_parameters[index] = [r0.value_in_unit(units.nanometers), k.value_in_unit(units.kilojoule_per_mole/units.nanometers**2)]
+        all_bonds = np.sort(np.concatenate([topology_bonds, force_bonds]), axis=1)
+        bond_keys, unique_indices, inverse = np.unique(all_bonds[:, 0]*self._n_atoms + all_bonds[:, 1], return_index=True, return_inverse=True)
+        self._bonds = all_bonds[unique_indices]
+        self._bond_parameters = np.full([len(bond_keys), 2], np.nan)
+        self._bond_parameters[inverse[len(topology_bonds):]] = force_bond_parameters
+
+        self._angles = np.zeros([0, 3], dtype=np.int64)
+        self._angle_parameters = np.zeros([0, 2], dtype=np.float64)
+        if angle_force is not None:
+            n_angles = angle_force.getNumAngles()
+            self._angles = np.zeros([n_angles, 3], dtype=np.int64)
+            self._angle_parameters = np.zeros([n_angles, 2], dtype=np.float64)
+            for index in range(n_angles):
+                atom1, atom2, atom3, theta0, k = angle_force.getAngleParameters(index)
+                self._angles[index] = [atom1, atom2, atom3]
+                self._angle_parameters[index] = [theta0.value_in_unit(units.radians), k.value_in_unit(units.kilojoule_per_mole/units.radians**2)]
+
+        self._atoms = dict()
+        self._graph = None
+        self._graph_key = None
+
+    @property
+    def n_atoms(self):
+        return self._n_atoms
+
+    @property
+    def atomic_numbers(self):
+        return self._atomic_numbers
+
+    @property
+    def bonds(self):
+        return self._bonds
+
+    @property
+    def bond_parameters(self):
+        return self._bond_parameters
+
+    @property
+    def angles(self):
+        return self._angles
+
+    @property
+    def angle_parameters(self):
+        return self._angle_parameters
+
+    @property
+    def bond_graph(self):
+        """
+        The bond graph in compressed sparse row form, as (indptr, indices) arrays:
+        the neighbors of atom i are indices[indptr[i]:indptr[i+1]].
+        """
+        if self._graph is None:
+            sources = np.concatenate([self._bonds[:, 0], self._bonds[:, 1]])
+            targets = np.concatenate([self._bonds[:, 1], self._bonds[:, 0]])
+            order = np.argsort(sources, kind='mergesort')
+            indptr = np.zeros(self._n_atoms+1, dtype=np.int64)
+            indptr[1:] = np.cumsum(np.bincount(sources, minlength=self._n_atoms))
+            self._graph = (indptr, targets[order])
+        return self._graph
+
+    @property
+    def graph_key(self):
+        """
+        A key identifying the elements and bonds of the topology, equal for views of identical topologies.
+        """
+        if self._graph_key is None:
+            self._graph_key = hashlib.sha1(self._atomic_numbers.tobytes() + b'|' + self._bonds.tobytes()).hexdigest()
+        return self._graph_key
+
+    def atom(self, index):
+        """
+        Get the record of an atom, which is the same object for each call with the same index.
+
+        Parameters
+        ----------
+        index : int
+            The index of the atom
+
+        Returns
+        -------
+        atom : GeometryAtom
+            The atom
+        """
+        index = int(index)
+        if index not in self._atoms:
+            self._atoms[index] = GeometryAtom(index, self._atom_names[index], int(self._atomic_numbers[index]), self._residue_names[index])
+        return self._atoms[index]
+
+    def atoms(self, indices):
+        """
+        Get the records of a list of atoms.
+        """
+        return [self.atom(index) for index in indices]
+
+    def get_bonds(self, atom_indices):
+        """
+        Get all bonds involving any of the given atoms.
+
+        Parameters
+        ----------
+        atom_indices : iterable of int
+            The atoms
+
+        Returns
+        -------
+        bonds : list of GeometryBond
+            The bonds, with type None if the bond has no harmonic bond parameters
+        """
+        selected = np.nonzero(np.any(np.isin(self._bonds, list(atom_indices)), axis=1))[0]
+        bonds = list()
+        for index in selected:
+            r0, k = self._bond_parameters[index]
+            bond_type = None if np.isnan(r0) else GeometryBondType(units.Quantity(r0, unit=units.nanometers), units.Quantity(k, unit=units.kilojoule_per_mole/units.nanometers**2))
+            bonds.append(GeometryBond(self.atom(self._bonds[index, 0]), self.atom(self._bonds[index, 1]), bond_type))
+        return bonds
+
+    def get_angles(self, atom_indices):
+        """
+        Get all angles involving any of the given atoms.
+
+        Parameters
+        ----------
+        atom_indices : iterable of int
+            The atoms
+
+        Returns
+        -------
+        angles : list of GeometryAngle
+            The angles
+        """
+        selected = np.nonzero(np.any(np.isin(self._angles, list(atom_indices)), axis=1))[0]
+        angles = list()
+        for index in selected:
+            theta0, k = self._angle_parameters[index]
+            angle_type = GeometryAngleType(units.Quantity(theta0, unit=units.radians), units.Quantity(k, unit=units.kilojoule_per_mole/units.radians**2))
+            angles.append(GeometryAngle(*self.atoms(self._angles[index]), type=angle_type))
+        return angles
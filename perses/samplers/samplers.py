@@ -23,11 +23,13 @@ import numpy as np
 from openmmtools import testsystems
 import copy
 import time
+import concurrent.futures
 from openmmtools.constants import kB
 
 from perses.storage import NetCDFStorageView
 from perses.samplers import thermodynamics
 from perses.tests.utils import quantity_is_finite
+from perses.rjmc.random_state import get_random_state, using_random_state, spawn_random_states
 
 ################################################################################
 # LOGGER
@@ -58,6 +60,43 @@ def log_sum_exp(a_n):
     a_n = np.array(list(a_n.values()))
     return np.log( np.sum( np.exp(a_n - a_n.max() ) ) )
 
+def _update_samplers(samplers, random_states, n_workers=1):
+    """
+    Update independent samplers, each drawing from its own random number stream, concurrently
+    in a thread pool if n_workers > 1. All updates are complete when this returns.
+
+    Parameters
+    ----------
+    samplers : list of SAMSSampler or ExpandedEnsembleSampler
+        The samplers to update
+    random_states : list of np.random.RandomState or None
+        random_states[i] is the random number stream of samplers[i], or None to use the global numpy random state
+    n_workers : int, optional, default=1
+        Number of threads
+    """
+    def update_sampler(sampler, random_state):
+        with using_random_state(random_state):
+            sampler.update()
+
+    if n_workers == 1:
+        for sampler, random_state in zip(samplers, random_states):
+            update_sampler(sampler, random_state)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(update_sampler, sampler, random_state) for sampler, random_state in zip(samplers, random_states)]
+        # Re-raise the first exception of a sampler update, if any
+        for future in futures:
+            future.result()
+
+def _sampler_random_states(random_state, n_samplers, n_workers):
+    """
+    Create one random number stream per sampler, or None for each sampler if the samplers are updated serially
+    without a random_state, in which case they keep drawing from the global numpy random state.
+    """
+    if random_state is None and n_workers == 1:
+        return [None] * n_samplers
+    return spawn_random_states(random_state, n_samplers)
+
 ################################################################################
 # MCMC sampler state
 ################################################################################
@@ -616,12 +655,15 @@ class MCMCSampler(object):
             if self.verbose: print("Taking %d steps of Langevin dynamics..." % self.nsteps)
         else:
             raise Exception("integrator_name '%s' not valid." % (self.integrator_name))
+        # Seed from this thread's random stream so threaded updates are reproducible
+        MAXINT = np.iinfo(np.int32).max
+        integrator.setRandomNumberSeed(get_random_state().randint(MAXINT))
 
         start_time = time.time()
 
         # Create a Context
         context = self.sampler_state.createContext(integrator=integrator, thermodynamic_state=self.thermodynamic_state)
-        context.setVelocitiesToTemperature(self.thermodynamic_state.temperature)
+        context.setVelocitiesToTemperature(self.thermodynamic_state.temperature, get_random_state().randint(MAXINT))
 
         if self.verbose:
             # Print platform
@@ -918,6 +960,40 @@ class ExpandedEnsembleSampler(object):
         if self.verbose: print('calculation took %.3f s' % (time.time() - initial_time))
         return geometry_logp_reverse
 
+    def _geometry_forward_and_reverse(self, topology_proposal, old_positions):
+        """
+        Run geometry engine to propose new positions, computing the logP of the forward
+        proposal and of the reverse proposal of the old positions in a single pass
+
+        Parameters
+        ----------
+        topology_proposal : TopologyProposal
+            Contains old/new Topology and System objects and atom mappings.
+        old_positions : simtk.unit.Quantity with dimension [natoms, 3] with units of distance.
+            Positions of the old system atoms.
+
+        Returns
+        -------
+        new_positions : simtk.unit.Quantity with dimension [natoms, 3] with units of distance.
+            Positions of new atoms proposed by geometry engine calculation.
+        geometry_logp_propose : float
+            The log probability of the forward-only proposal
+        geometry_logp_reverse : float
+            The log probability of the reverse proposal of the old positions
+        """
+        if self.verbose: print("Geometry engine proposal and logP_reverse calculation...")
+        initial_time = time.time()
+        new_positions, geometry_logp_propose, geometry_logp_reverse = self.geometry_engine.propose_and_logp_reverse(topology_proposal, old_positions, self.sampler.thermodynamic_state.beta)
+        if self.verbose: print('proposal and calculation took %.3f s' % (time.time() - initial_time))
+
+        if self.geometry_pdbfile is not None:
+            print("Writing proposed geometry...")
+            from simtk.openmm.app import PDBFile
+            PDBFile.writeFile(topology_proposal.new_topology, new_positions, file=self.geometry_pdbfile)
+            self.geometry_pdbfile.flush()
+
+        return new_positions, geometry_logp_propose, geometry_logp_reverse
+
     def _ncmc_insert(self, topology_proposal, ncmc_old_positions):
         """
         Run an NCMC protocol from lambda = 0 to lambda = 1
@@ -1121,9 +1197,7 @@ class ExpandedEnsembleSampler(object):
         ncmc_old_positions, logP_delete_work, logP_delete_energy = self._ncmc_delete(topology_proposal, old_positions)
 
         geometry_old_positions = ncmc_old_positions
-        geometry_new_positions, logP_forward = self._geometry_forward(topology_proposal, geometry_old_positions)
-
-        logP_reverse = self._geometry_reverse(topology_proposal, geometry_new_positions, geometry_old_positions)
+        geometry_new_positions, logP_forward, logP_reverse = self._geometry_forward_and_reverse(topology_proposal, geometry_old_positions)
 
         ncmc_new_positions, logP_insert_work, logP_insert_energy = self._ncmc_insert(topology_proposal, geometry_new_positions)
         new_positions = ncmc_new_positions
@@ -1198,7 +1272,7 @@ class ExpandedEnsembleSampler(object):
             accept = False
             print('logp_accept = NaN')
         else:
-            accept = ((logp_accept>=0.0) or (np.random.uniform() < np.exp(logp_accept)))
+            accept = ((logp_accept>=0.0) or (get_random_state().uniform() < np.exp(logp_accept)))
             if self.accept_everything:
                 print('accept_everything option is turned on; accepting')
                 accept = True
@@ -1504,7 +1578,7 @@ class MultiTargetDesign(object):
         If True, verbose output is printed.
 
     """
-    def __init__(self, target_samplers, storage=None, verbose=False):
+    def __init__(self, target_samplers, storage=None, verbose=False, n_workers=1, random_state=None):
         """
         Initialize a multi-objective design sampler with the specified target sampler powers.
 
@@ -1516,6 +1590,13 @@ class MultiTargetDesign(object):
             If specified, will use the storage layer to write trajectory data.
         verbose : bool, optional, default=False
             If true, will print verbose output
+        n_workers : int, optional, default=1
+            Number of threads in which the target samplers are updated concurrently at each iteration
+        random_state : int or np.random.RandomState, optional, default=None
+            Seed or stream from which an independent random number stream is created for each target sampler,
+            so that sampling is reproducible whatever the order in which the threads run. If None and n_workers > 1,
+            the streams are seeded from the global numpy random state; if None and n_workers == 1, the samplers
+            draw from the global numpy random state.
 
         The target sampler weights for N samplers with specified exponents \alpha_n are given by
 
@@ -1538,6 +1619,8 @@ class MultiTargetDesign(object):
         # Store target samplers.
         self.sampler_exponents = target_samplers
         self.samplers = list(target_samplers.keys())
+        self.n_workers = n_workers
+        self._random_states = _sampler_random_states(random_state, len(self.samplers), n_workers)
 
         self.storage = None
         if storage is not None:
@@ -1554,10 +1637,9 @@ class MultiTargetDesign(object):
 
     def update_samplers(self):
         """
-        Update all samplers.
+        Update all samplers, concurrently if n_workers > 1.
         """
-        for sampler in self.samplers:
-            sampler.update()
+        _update_samplers(self.samplers, self._random_states, self.n_workers)
 
     def update_target_probabilities(self):
         """
@@ -1637,7 +1719,7 @@ class ProtonationStateSampler(object):
         If True, verbose output is printed.
 
     """
-    def __init__(self, complex_sampler, solvent_sampler, log_state_penalties, storage=None, verbose=False):
+    def __init__(self, complex_sampler, solvent_sampler, log_state_penalties, storage=None, verbose=False, n_workers=1, random_state=None):
         """
         Initialize a protonation state sampler with fixed target probabilities for ligand in solvent.
 
@@ -1653,11 +1735,18 @@ class ProtonationStateSampler(object):
             If specified, will use the storage layer to write trajectory data.
         verbose : bool, optional, default=False
             If true, will print verbose output
+        n_workers : int, optional, default=1
+            Number of threads in which the complex and solvent samplers are updated concurrently at each iteration
+        random_state : int or np.random.RandomState, optional, default=None
+            Seed or stream from which an independent random number stream is created for each sampler,
+            as in MultiTargetDesign
 
         """
         # Store target samplers.
         self.log_state_penalties = log_state_penalties
         self.samplers = [complex_sampler, solvent_sampler]
+        self.n_workers = n_workers
+        self._random_states = _sampler_random_states(random_state, len(self.samplers), n_workers)
         self.complex_sampler = complex_sampler
         self.solvent_sampler = solvent_sampler
 
@@ -1676,10 +1765,9 @@ class ProtonationStateSampler(object):
 
     def update_samplers(self):
         """
-        Update all samplers.
+        Update all samplers, concurrently if n_workers > 1.
         """
-        for sampler in self.samplers:
-            sampler.update()
+        _update_samplers(self.samplers, self._random_states, self.n_workers)
 
     def update_target_probabilities(self):
         """
@@ -26,6 +26,8 @@ import json
 import mdtraj
 from simtk import unit
 import codecs
+import functools
+import threading
 
 ################################################################################
 # LOGGER
@@ -38,6 +40,15 @@ logger = logging.getLogger(__name__)
 # STORAGE
 ################################################################################
 
+def _synchronized(method):
+    """Serialize calls to a storage method across threads, since the NetCDF library is not thread-safe.
+    """
+    @functools.wraps(method)
+    def synchronized_method(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return synchronized_method
+
 class NetCDFStorage(object):
     """NetCDF storage layer.
     """
@@ -55,6 +66,7 @@ class NetCDFStorage(object):
         """
         self._filename = filename
         self._ncfile = netcdf.Dataset(self._filename, mode=mode)
+        self._lock = threading.RLock()
         self._envname = None
         self._modname = None
 
@@ -84,16 +96,19 @@ class NetCDFStorage(object):
         except UnicodeEncodeError:
             return string
 
+    @_synchronized
     def sync(self):
         """Flush write buffer.
         """
         self._ncfile.sync()
 
+    @_synchronized
     def close(self):
         """Close the storage layer.
         """
         self._ncfile.close()
 
+    @_synchronized
     def write_configuration(self, varname, positions, topology, iteration=None, frame=None, nframes=None):
         """Write a configuration (or one of a sequence of configurations) to be stored as a native NetCDF array
 
@@ -164,6 +179,7 @@ class NetCDFStorage(object):
         else:
             ncgrp.variables[varname] = positions[:,:] / positions_unit
 
+    @_synchronized
     def write_object(self, varname, obj, iteration=None):
         """Serialize a Python object, encoding as pickle when storing as string in NetCDF.
 
@@ -222,6 +238,7 @@ class NetCDFStorage(object):
         obj = pickle.loads(codecs.decode(pickled.encode(), "base64"))
         return obj
 
+    @_synchronized
     def write_quantity(self, varname, value, iteration=None):
         """Write a floating-point number
 
@@ -247,6 +264,7 @@ class NetCDFStorage(object):
         else:
             ncgrp.variables[varname] = value
 
+    @_synchronized
     def write_array(self, varname, array, iteration=None):
         """Write a numpy array as a native NetCDF array
 
@@ -316,6 +334,7 @@ class NetCDFStorageView(NetCDFStorage):
         """
         self._filename = storage._filename
         self._ncfile = storage._ncfile
+        self._lock = storage._lock
         self._envname = storage._envname
         self._modname = storage._modname
 
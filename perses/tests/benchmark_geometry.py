@@ -0,0 +1,210 @@
+"""
+Benchmarks for the geometry engine.
+
+Run with
+
+    python -m perses.tests.benchmark_geometry
+
+"""
+from simtk import unit
+import time
+import numpy as np
+from openmmtools.constants import kB
+
+################################################################################
+# CONSTANTS
+################################################################################
+
+temperature = 300.0 * unit.kelvin
+kT = kB * temperature
+beta = 1.0/kT
+
+def _scan_bond(atom1, atom2):
+    """Bond lookup by intersecting the bond lists of the atoms, as done before GeometryTermIndex."""
+    return set(atom1.bonds).intersection(set(atom2.bonds)).pop()
+
+def _scan_angle(atom1, atom2, atom3):
+    """Angle lookup by intersecting the angle lists of the atoms, as done before GeometryTermIndex."""
+    return set(atom1.angles).intersection(set(atom2.angles), set(atom3.angles)).pop()
+
+def _scan_constraint(atom1, atom2, system):
+    """Constraint lookup by scanning all constraints of the system, as done before GeometryTermIndex."""
+    atom_indices = {atom1.idx, atom2.idx}
+    constraint = None
+    for i in range(system.getNumConstraints()):
+        constraint_parameters = system.getConstraintParameters(i)
+        if len(set(constraint_parameters[:2]).intersection(atom_indices)) == 2:
+            constraint = constraint_parameters[2]
+    return constraint
+
+def benchmark_term_lookup(niterations=10):
+    """
+    Compare bond, angle and constraint lookups through GeometryTermIndex with the linear scans
+    they replace, for the atoms proposed in a mutation of alanine dipeptide in explicit solvent.
+
+    Parameters
+    ----------
+    niterations : int, optional, default=10
+        Number of topology proposals to time
+    """
+    import parmed
+    from perses.tests.testsystems import AlanineDipeptideTestSystem
+    from perses.rjmc.geometry import GeometryTermIndex
+
+    testsystem = AlanineDipeptideTestSystem()
+    environment = 'explicit'
+    system = testsystem.systems[environment]
+    topology = testsystem.topologies[environment]
+    proposal_engine = testsystem.proposal_engines[environment]
+    print('Explicit solvent system with %d atoms and %d constraints' % (system.getNumParticles(), system.getNumConstraints()))
+
+    scan_time = 0.0
+    index_time = 0.0
+    nlookups = 0
+    for iteration in range(niterations):
+        top_proposal = proposal_engine.propose(system, topology)
+        structure = parmed.openmm.load_topology(top_proposal.new_topology, top_proposal.new_system)
+        new_atoms = [structure.atoms[atom_index] for atom_index in top_proposal.unique_new_atoms]
+
+        # Queries: every bond and angle of the new atoms, and a constraint for every bond
+        bond_queries = [(bond.atom1, bond.atom2) for atom in new_atoms for bond in atom.bonds]
+        angle_queries = [(angle.atom1, angle.atom2, angle.atom3) for atom in new_atoms for angle in atom.angles]
+        nlookups += 2*len(bond_queries) + len(angle_queries)
+
+        initial_time = time.time()
+        for (atom1, atom2) in bond_queries:
+            _scan_bond(atom1, atom2)
+            _scan_constraint(atom1, atom2, top_proposal.new_system)
+        for (atom1, atom2, atom3) in angle_queries:
+            _scan_angle(atom1, atom2, atom3)
+        scan_time += time.time() - initial_time
+
+        # The index is built once per proposal, so its construction is included in the timing
+        initial_time = time.time()
+        term_index = GeometryTermIndex.from_atoms(new_atoms, system=top_proposal.new_system)
+        for (atom1, atom2) in bond_queries:
+            term_index.get_bond(atom1.idx, atom2.idx)
+            term_index.get_constraint(atom1.idx, atom2.idx)
+        for (atom1, atom2, atom3) in angle_queries:
+            term_index.get_angle(atom1.idx, atom2.idx, atom3.idx)
+        index_time += time.time() - initial_time
+
+    print('%d lookups over %d proposals' % (nlookups, niterations))
+    print('Linear scans      : %10.6f s' % scan_time)
+    print('GeometryTermIndex : %10.6f s' % index_time)
+    print('Speedup           : %10.1fx' % (scan_time / index_time))
+    return scan_time, index_time
+
+_cold_start_script = """
+import json, time
+initial_time = time.time()
+import perses.rjmc
+import_time = time.time() - initial_time
+initial_time = time.time()
+if %(warmup)s:
+    perses.rjmc.warmup()
+warmup_time = time.time() - initial_time
+
+import numpy as np
+from simtk import unit
+from openmmtools.constants import kB
+from perses.rjmc.geometry import FFAllAngleGeometryEngine
+from perses.rjmc.topology_proposal import SmallMoleculeSetProposalEngine, TopologyProposal
+from perses.tests.utils import createOEMolFromIUPAC, createSystemFromIUPAC
+mol = createOEMolFromIUPAC("naphthalene")
+_, system, positions, topology = createSystemFromIUPAC("naphthalene")
+atom_map = SmallMoleculeSetProposalEngine._get_mol_atom_map(mol, createOEMolFromIUPAC("benzene"))
+atom_map = {value : value for value in atom_map.values()}
+top_proposal = TopologyProposal(new_topology=topology, new_system=system, old_topology=topology, old_system=system, new_to_old_atom_map=atom_map, new_chemical_state_key="n1", old_chemical_state_key="n2")
+beta = 1.0/(kB*300.0*unit.kelvin)
+geometry_engine = FFAllAngleGeometryEngine(verbose=False)
+
+propose_times = []
+for iteration in range(2):
+    initial_time = time.time()
+    geometry_engine.propose(top_proposal, positions, beta)
+    propose_times.append(time.time() - initial_time)
+print(json.dumps([import_time, warmup_time] + propose_times))
+"""
+
+def benchmark_cold_start():
+    """
+    Time the first FFAllAngleGeometryEngine.propose in fresh processes, with an empty and a populated
+    numba cache, with and without calling perses.rjmc.warmup() at startup.
+
+    The coordinate kernels are compiled (or loaded from the numba cache) when perses.rjmc is imported,
+    so the import time is reported separately from the first and second proposals.
+    """
+    import json
+    import os
+    import subprocess
+    import sys
+    import tempfile
+
+    cache_dir = tempfile.mkdtemp()
+    environment = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    print('%-32s %10s %10s %14s %14s' % ('', 'import', 'warmup', 'first propose', 'second propose'))
+    results = dict()
+    for name, warmup in [('empty numba cache', False), ('populated numba cache', False), ('populated cache and warmup', True)]:
+        output = subprocess.check_output([sys.executable, '-c', _cold_start_script % {'warmup' : warmup}], env=environment)
+        results[name] = json.loads(output.decode().strip().split('\n')[-1])
+        print('%-32s %9.3fs %9.3fs %13.3fs %13.3fs' % tuple([name] + results[name]))
+    return results
+
+def benchmark_omega_geometry_engine(nproposals=20):
+    """
+    Compare the OmegaGeometryEngine with the FFAllAngleGeometryEngine on the mean Metropolis acceptance
+    probability of small molecule transformations between clinical kinase inhibitors in vacuum, per CPU-second
+    spent in the geometry engine.
+
+    The conformer library is generated before timing, as it is computed once per molecule and read from disk
+    in later runs.
+
+    Parameters
+    ----------
+    nproposals : int, optional, default=20
+        Number of topology proposals
+    """
+    import tempfile
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, OmegaGeometryEngine
+    from perses.tests.testsystems import KinaseInhibitorsTestSystem
+    from perses.tests.utils import compute_potential
+
+    testsystem = KinaseInhibitorsTestSystem()
+    environment = 'vacuum'
+    system = testsystem.systems[environment]
+    topology = testsystem.topologies[environment]
+    positions = testsystem.positions[environment]
+    proposal_engine = testsystem.proposal_engines[environment]
+    top_proposals = [proposal_engine.propose(system, topology) for iteration in range(nproposals)]
+    old_potential = compute_potential(system, positions)
+
+    geometry_engines = [('FFAllAngleGeometryEngine', FFAllAngleGeometryEngine()), ('OmegaGeometryEngine', OmegaGeometryEngine(conformer_cache_directory=tempfile.mkdtemp()))]
+    for top_proposal in top_proposals:
+        geometry_engines[1][1].propose(top_proposal, positions, beta)
+
+    print('%-26s %16s %12s %22s' % ('', 'mean acceptance', 'CPU time', 'acceptance per CPU-s'))
+    results = dict()
+    for name, geometry_engine in geometry_engines:
+        cpu_time = 0.0
+        acceptance = 0.0
+        for top_proposal in top_proposals:
+            initial_time = time.process_time()
+            new_positions, logp_forward = geometry_engine.propose(top_proposal, positions, beta)
+            logp_reverse = geometry_engine.logp_reverse(top_proposal, new_positions, positions, beta)
+            cpu_time += time.process_time() - initial_time
+            try:
+                new_potential = compute_potential(top_proposal.new_system, new_positions)
+            except Exception:
+                continue
+            log_acceptance = -beta*(new_potential - old_potential) + logp_reverse - logp_forward + top_proposal.logp_proposal
+            acceptance += min(1.0, np.exp(min(log_acceptance, 0.0)))
+        acceptance /= nproposals
+        results[name] = (acceptance, cpu_time)
+        print('%-26s %16.3e %11.3fs %22.3e' % (name, acceptance, cpu_time, acceptance / cpu_time))
+    return results
+
+if __name__ == "__main__":
+    benchmark_term_lookup()
+    benchmark_cold_start()
+    benchmark_omega_geometry_engine()
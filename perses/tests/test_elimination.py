@@ -629,6 +629,134 @@ def test_ncmc_engine_molecule():
             f.description = "Testing alchemical null elimination for '%s' with %d NCMC steps" % (molecule_name, ncmc_nsteps)
             yield f
 
+def test_ncmc_engine_context_cache():
+    """
+    Check that the NCMC engine reuses the alchemical Contexts of repeated transitions, with finite acceptance probabilities.
+    """
+    from perses.tests.utils import createSystemFromIUPAC
+    from perses.rjmc.topology_proposal import TopologyProposal
+    from perses.annihilation.ncmc_switching import NCMCEngine
+
+    [molecule, system, positions, topology] = createSystemFromIUPAC('pentane')
+    new_to_old_atom_map = { atom.index : atom.index for atom in topology.atoms() if str(atom.element.name) == 'carbon' }
+    topology_proposal = TopologyProposal(
+        new_topology=topology, new_system=system, old_topology=topology, old_system=system,
+        old_chemical_state_key='pentane', new_chemical_state_key='pentane', logp_proposal=0.0, new_to_old_atom_map=new_to_old_atom_map, metadata={'test':0.0})
+
+    ncmc_engine = NCMCEngine(temperature=temperature, nsteps=5, context_cache_size=2)
+    for attempt in range(2):
+        for direction in ['delete', 'insert']:
+            [ncmc_positions, logP_work, logP_energy] = ncmc_engine.integrate(topology_proposal, positions, direction=direction)
+            if np.isnan(logP_work + logP_energy):
+                raise Exception("NCMC %s with a %s Context gave NaN log acceptance probability." % (direction, 'cached' if attempt else 'new'))
+
+    assert ncmc_engine.context_cache.n_misses == 2
+    assert ncmc_engine.context_cache.n_hits == 2
+    assert ncmc_engine.nattempted == 4
+
+def test_alchemical_system_store():
+    """
+    Check that alchemically modified systems are reused in memory, and loaded from the cache directory by another engine.
+    """
+    import tempfile
+    import shutil
+    from perses.tests.utils import createSystemFromIUPAC
+    from perses.annihilation.ncmc_switching import NCMCEngine
+
+    [molecule, system, positions, topology] = createSystemFromIUPAC('pentane')
+    alchemical_atoms = [ atom.index for atom in topology.atoms() if str(atom.element.name) == 'hydrogen' ]
+
+    cache_directory = tempfile.mkdtemp()
+    try:
+        ncmc_engine = NCMCEngine(temperature=temperature, alchemical_system_cache_size=2, alchemical_system_cache_directory=cache_directory)
+        alchemical_system = ncmc_engine.make_alchemical_system(system, alchemical_atoms, direction='delete', chemical_state_key='pentane')
+        assert ncmc_engine.make_alchemical_system(system, alchemical_atoms, direction='delete', chemical_state_key='pentane') is alchemical_system
+        assert ncmc_engine.alchemical_system_store.n_hits == 1
+
+        other_ncmc_engine = NCMCEngine(temperature=temperature, alchemical_system_cache_size=2, alchemical_system_cache_directory=cache_directory)
+        loaded_system = other_ncmc_engine.make_alchemical_system(system, alchemical_atoms, direction='delete', chemical_state_key='pentane')
+        assert other_ncmc_engine.alchemical_system_store.n_disk_hits == 1
+        assert openmm.XmlSerializer.serialize(loaded_system) == openmm.XmlSerializer.serialize(alchemical_system)
+
+        # A system with the same chemical state key and signature but other parameters is not loaded from the cache directory
+        import copy
+        modified_system = copy.deepcopy(system)
+        modified_system.setParticleMass(0, 2.0*system.getParticleMass(0))
+        modified_ncmc_engine = NCMCEngine(temperature=temperature, alchemical_system_cache_size=2, alchemical_system_cache_directory=cache_directory)
+        modified_ncmc_engine.make_alchemical_system(modified_system, alchemical_atoms, direction='delete', chemical_state_key='pentane')
+        assert modified_ncmc_engine.alchemical_system_store.n_misses == 1
+        assert modified_ncmc_engine.alchemical_system_store.n_disk_hits == 0
+    finally:
+        shutil.rmtree(cache_directory)
+
+def test_alchemical_system_store_fresh_system():
+    """
+    Check that an identical System built for another proposal finds the stored alchemical system without being serialized.
+    """
+    import copy
+    try:
+        from unittest import mock
+    except ImportError:
+        import mock
+    from perses.tests.utils import createSystemFromIUPAC
+    from perses.annihilation.ncmc_switching import NCMCEngine
+
+    [molecule, system, positions, topology] = createSystemFromIUPAC('pentane')
+    alchemical_atoms = [ atom.index for atom in topology.atoms() if str(atom.element.name) == 'hydrogen' ]
+    ncmc_engine = NCMCEngine(temperature=temperature, alchemical_system_cache_size=2)
+    alchemical_system = ncmc_engine.make_alchemical_system(system, alchemical_atoms, direction='insert', chemical_state_key='pentane')
+
+    fresh_system = copy.deepcopy(system)
+    with mock.patch.object(openmm.XmlSerializer, 'serialize', side_effect=AssertionError("The unmodified System was serialized.")):
+        assert ncmc_engine.make_alchemical_system(fresh_system, alchemical_atoms, direction='insert', chemical_state_key='pentane') is alchemical_system
+    assert ncmc_engine.alchemical_system_store.n_hits == 1
+
+def test_global_parameter_names_cache():
+    """
+    Check that the alchemical parameters of a System are cached, and recomputed if forces are added.
+    """
+    from perses.tests.utils import createSystemFromIUPAC
+    from perses.annihilation.ncmc_switching import NCMCEngine, get_global_parameter_names
+
+    [molecule, system, positions, topology] = createSystemFromIUPAC('pentane')
+    alchemical_atoms = [ atom.index for atom in topology.atoms() if str(atom.element.name) == 'hydrogen' ]
+    ncmc_engine = NCMCEngine(temperature=temperature)
+    alchemical_system = ncmc_engine.make_alchemical_system(system, alchemical_atoms, direction='delete')
+
+    parameter_names = get_global_parameter_names(alchemical_system)
+    assert get_global_parameter_names(alchemical_system) is parameter_names
+    assert set(ncmc_engine._getAvailableParameters(alchemical_system)) == set(name for name in parameter_names if name.startswith('lambda_'))
+    functions = ncmc_engine._get_functions(alchemical_system)
+    assert set(functions.keys()) <= parameter_names
+
+    force = openmm.CustomExternalForce('lambda_test*x')
+    force.addGlobalParameter('lambda_test', 1.0)
+    alchemical_system.addForce(force)
+    assert 'lambda_test' in ncmc_engine._getAvailableParameters(alchemical_system)
+
+def test_ncmc_hybrid_engine_caches():
+    """
+    Check that repeated hybrid proposals of the same pair reuse the hybrid factory and Context, and give the same hybrid
+    positions as a new factory.
+    """
+    from perses.annihilation.ncmc_switching import NCMCHybridEngine
+    from perses.annihilation.new_relative import HybridTopologyFactory
+
+    topology_proposal, positions = generate_hybrid_test_topology(mol_name='naphthalene', ref_mol_name='benzene')
+    ncmc_engine = NCMCHybridEngine(temperature=temperature, nsteps=2, hybrid_factory_cache_size=2, context_cache_size=2)
+    for iteration in range(3):
+        [final_positions, new_old_positions, logP_work, logP_energy] = ncmc_engine.integrate(topology_proposal, positions, positions)
+        assert np.all(np.isfinite(final_positions / unit.nanometers))
+        positions = new_old_positions
+    assert ncmc_engine.hybrid_factory_cache.n_misses == 1
+    assert ncmc_engine.hybrid_factory_cache.n_hits == 2
+    assert ncmc_engine.context_cache.n_hits == 2
+
+    factory_key = ncmc_engine.hybrid_factory_cache.make_key(topology_proposal)
+    cached_factory = ncmc_engine.hybrid_factory_cache.get(factory_key)
+    factory = HybridTopologyFactory(topology_proposal, positions, positions)
+    assert np.allclose(cached_factory.compute_hybrid_positions(positions, positions) / unit.nanometers, factory.hybrid_positions / unit.nanometers)
+
 @skipIf(istravis, "Skip expensive test on travis")
 def test_ncmc_hybrid_engine_molecule():
     """
@@ -653,6 +653,631 @@ def test_propose_torsion():
     if pval < pval_threshold:
         raise Exception("Torsion may not have been drawn from the correct distribution.")
 
+def test_adaptive_torsion_grid():
+    """
+    Test that the adaptive torsion density integrates to one and that proposals and logps agree
+    """
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine
+
+    geometry_engine = FFAllAngleGeometryEngine(adaptive_torsion_grid=True, n_torsion_divisions=360, n_coarse_torsion_divisions=36)
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    positions = testsystem.positions.value_in_unit(unit.nanometers).astype(np.float64)
+    r, theta, _ = testsystem.internal_coordinates
+    torsion = testsystem.structure.dihedrals[0]
+    beta_unitless = beta.value_in_unit(unit.mole/unit.kilojoule)
+
+    bin_edges, logp_bins = geometry_engine._adaptive_torsion_grid_unitless(testsystem._context, torsion, positions, r, theta, beta_unitless)
+    assert len(logp_bins) < 360
+    if np.abs(1.0 - np.sum(np.exp(logp_bins))) > 1.0e-6:
+        raise Exception("The adaptive torsion distribution is not normalized.")
+
+    for i in range(20):
+        phi, logp = geometry_engine._propose_torsion_adaptive_unitless(testsystem._context, torsion, positions, r, theta, beta_unitless)
+        logp_reverse = geometry_engine._torsion_logp_adaptive_unitless(testsystem._context, torsion, positions, r, theta, phi, beta_unitless)
+        if np.abs(logp - logp_reverse) > 1.0e-10:
+            raise Exception("The adaptive torsion logp of a proposal doesn't match its proposal logp.")
+
+def test_vectorized_torsion_energies():
+    """
+    Test that the torsion pmf computed with the vectorized growth energies matches the one computed with an OpenMM Context
+    """
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, GeometrySystemGenerator
+    from perses.rjmc.growth_energy import GrowthSystemEnergy
+
+    n_divisions = 360
+
+    #the engine checks the vectorized energies against the context energies for every pmf
+    geometry_engine = FFAllAngleGeometryEngine(use_vectorized_energies=True, check_vectorized_energies=True)
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+
+    #make the growth system for atom 0, which is the only new atom
+    growth_indices = [testsystem.structure.atoms[0]]
+    growth_system_generator = GeometrySystemGenerator(testsystem.system, growth_indices, 'growth_stage', add_extra_torsions=False, add_extra_angles=False)
+    growth_system = growth_system_generator.get_modified_system()
+    growth_context = openmm.Context(growth_system, openmm.VerletIntegrator(1.0), openmm.Platform.getPlatformByName("Reference"))
+    growth_system_generator.set_growth_parameter_index(1, growth_context)
+    growth_energy = GrowthSystemEnergy(growth_system)
+    growth_energy.set_growth_stage(1)
+
+    internals = testsystem.internal_coordinates
+    r = unit.Quantity(internals[0], unit=unit.nanometer)
+    theta = unit.Quantity(internals[1], unit=unit.radian)
+    torsion = testsystem.structure.dihedrals[0]
+
+    logp_vectorized, phis = geometry_engine._torsion_log_probability_mass_function(growth_context, torsion, copy.deepcopy(testsystem.positions), r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
+    logp_context, phis = geometry_engine._torsion_log_probability_mass_function(growth_context, torsion, copy.deepcopy(testsystem.positions), r, theta, beta, n_divisions=n_divisions)
+
+    if np.max(np.abs(logp_vectorized - logp_context)) > 1.0e-6:
+        raise Exception("Vectorized torsion pmf didn't match the OpenMM torsion pmf.")
+
+    #once the atom is placed, the cached fixed energy should be the energy of the growth context
+    growth_energy.update_fixed_energy(0, testsystem.positions.value_in_unit(unit.nanometers))
+    growth_context.setPositions(testsystem.positions)
+    context_energy = growth_context.getState(getEnergy=True).getPotentialEnergy().value_in_unit(unit.kilojoule_per_mole)
+    if np.abs(growth_energy.fixed_energy - context_energy) > 1.0e-6:
+        raise Exception("Incremental growth energy didn't match the OpenMM energy.")
+
+def test_vectorized_energies_extra_terms():
+    """
+    Test that the vectorized growth energies include the constant extra ring torsions and angles between core atoms,
+    and that a proposal with extra torsions and angles passes the check against the Context energies
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, GeometrySystemGenerator, ProposalOrderTools
+    from perses.rjmc.growth_energy import GrowthSystemEnergy
+
+    top_proposal, positions = generate_hybrid_test_topology()
+    positions = unit.Quantity(np.array(positions.value_in_unit(unit.nanometers)), unit=unit.nanometers)
+    atom_proposal_order, _ = ProposalOrderTools(top_proposal).determine_proposal_order(direction='reverse')
+    growth_system_generator = GeometrySystemGenerator(top_proposal.old_system, atom_proposal_order.keys(), 'growth_stage', add_extra_torsions=True, add_extra_angles=True, reference_topology=top_proposal.old_topology)
+    growth_system = growth_system_generator.get_modified_system()
+    growth_energy = GrowthSystemEnergy(growth_system)
+    constant_terms = [force.getTorsionParameters(index)[-1][-1] == 0 for force in growth_system.getForces() if isinstance(force, openmm.CustomTorsionForce) for index in range(force.getNumTorsions())]
+    constant_terms += [force.getAngleParameters(index)[-1][-1] == 0 for force in growth_system.getForces() if isinstance(force, openmm.CustomAngleForce) for index in range(force.getNumAngles())]
+    assert any(constant_terms)
+
+    #before any atom is placed, the fixed energy is the energy of the constant terms in the growth context
+    growth_context = openmm.Context(growth_system, openmm.VerletIntegrator(1.0), openmm.Platform.getPlatformByName("Reference"))
+    growth_system_generator.set_growth_parameter_index(0, growth_context)
+    growth_context.setPositions(positions)
+    context_energy = growth_context.getState(getEnergy=True).getPotentialEnergy().value_in_unit(unit.kilojoule_per_mole)
+    growth_energy.reset(positions.value_in_unit(unit.nanometers))
+    if np.abs(growth_energy.fixed_energy - context_energy) > 1.0e-6:
+        raise Exception("Constant growth energy %f didn't match the OpenMM energy %f." % (growth_energy.fixed_energy, context_energy))
+
+    #the engine checks the vectorized energies against the context energies for every pmf
+    geometry_engine = FFAllAngleGeometryEngine(use_vectorized_energies=True, check_vectorized_energies=True, verbose=False)
+    new_positions, logp_forward = geometry_engine.propose(top_proposal, positions, beta)
+    logp_reverse = geometry_engine.logp_reverse(top_proposal, new_positions, positions, beta)
+    assert np.isfinite(logp_forward) and np.isfinite(logp_reverse)
+
+def test_torsion_pmf_cache():
+    """
+    Test that memoized torsion pmfs are found for a rigidly moved environment, and agree with recomputed ones
+    to roundoff and with the unmemoized pmf to the binning tolerance
+    """
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, GeometrySystemGenerator
+    from perses.rjmc.growth_energy import GrowthSystemEnergy
+
+    n_divisions = 360
+    geometry_engine = FFAllAngleGeometryEngine(use_vectorized_energies=True, torsion_pmf_cache_size=4)
+    reference_engine = FFAllAngleGeometryEngine(use_vectorized_energies=True)
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+
+    growth_indices = [testsystem.structure.atoms[0]]
+    growth_system_generator = GeometrySystemGenerator(testsystem.system, growth_indices, 'growth_stage', add_extra_torsions=False, add_extra_angles=False)
+    growth_energy = GrowthSystemEnergy(growth_system_generator.get_modified_system())
+    growth_energy.set_growth_stage(1)
+
+    internals = testsystem.internal_coordinates
+    r = unit.Quantity(internals[0], unit=unit.nanometer)
+    theta = unit.Quantity(internals[1], unit=unit.radian)
+    torsion = testsystem.structure.dihedrals[0]
+    positions = copy.deepcopy(testsystem.positions)
+    translated_positions = positions + unit.Quantity(np.array([0.3, -0.2, 0.1]), unit=unit.nanometers)
+
+    logp_miss, _ = geometry_engine._torsion_log_probability_mass_function(None, torsion, positions, r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
+    logp_hit, _ = geometry_engine._torsion_log_probability_mass_function(None, torsion, translated_positions, r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
+    assert geometry_engine.torsion_pmf_cache.n_hits == 1
+    assert geometry_engine.torsion_pmf_cache.n_misses == 1
+    geometry_engine.torsion_pmf_cache.clear()
+    logp_recomputed, _ = geometry_engine._torsion_log_probability_mass_function(None, torsion, translated_positions, r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
+    if np.max(np.abs(logp_hit - logp_recomputed)) > 1.0e-8:
+        raise Exception("Memoized torsion pmf didn't match the recomputed torsion pmf.")
+
+    #binning moves each coordinate by at most half a tolerance, so the distributions are close
+    logp_reference, _ = reference_engine._torsion_log_probability_mass_function(None, torsion, positions, r, theta, beta, n_divisions=n_divisions, growth_energy=growth_energy)
+    if np.sum(np.abs(np.exp(logp_miss) - np.exp(logp_reference))) > 0.05:
+        raise Exception("Memoized torsion pmf is too far from the unmemoized torsion pmf.")
+
+def test_growth_system_cache():
+    """
+    Test that the growth system cache reuses entries, evicts the least recently used ones and counts hits and misses
+    """
+    from perses.rjmc.geometry import GeometrySystemGenerator, GrowthSystemCache, GrowthSystemCacheEntry
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    growth_indices = [testsystem.structure.atoms[0]]
+    growth_system_generator = GeometrySystemGenerator(testsystem.system, growth_indices, 'growth_stage', add_extra_torsions=False, add_extra_angles=False)
+    entry = GrowthSystemCacheEntry(growth_system_generator, growth_system_generator.get_modified_system())
+
+    cache = GrowthSystemCache(max_size=2)
+    keys = [cache.make_key(chemical_state_key, testsystem.system, [0], False) for chemical_state_key in ['A', 'B', 'C']]
+    assert cache.get(keys[0]) is None
+    for key in keys:
+        cache.put(key, entry)
+
+    #the first entry was evicted, and checking out an entry removes it until it is put back
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[1]) is entry
+    assert cache.get(keys[1]) is None
+    assert cache.n_hits == 1
+    assert cache.n_misses == 3
+    assert cache.n_evictions == 1
+
+def test_growth_system_cache_neighbor_sets():
+    """
+    Test that a cached growth system with restricted sterics is only valid for neighbor sets it contains
+    """
+    from perses.rjmc.geometry import GeometrySystemGenerator, GrowthSystemCache, GrowthSystemCacheEntry
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    growth_indices = [testsystem.structure.atoms[0]]
+    growth_system_generator = GeometrySystemGenerator(testsystem.system, growth_indices, 'growth_stage', add_extra_torsions=False, add_extra_angles=False)
+    entry = GrowthSystemCacheEntry(growth_system_generator, growth_system_generator.get_modified_system(), sterics_neighbor_indices=np.array([1, 2]))
+    assert entry.contains_sterics_neighbors(np.array([1]))
+    assert entry.contains_sterics_neighbors(np.array([1, 2]))
+    assert not entry.contains_sterics_neighbors(np.array([1, 3]))
+    assert not entry.contains_sterics_neighbors(None)
+
+    #growth systems with restricted sterics have their own keys, but the neighbor set, which changes between proposals, is not part of them
+    assert GrowthSystemCache.make_key('A', testsystem.system, [0], True, sterics_neighbor_list=True) != GrowthSystemCache.make_key('A', testsystem.system, [0], True)
+
+def test_checkout_growth_system_neighbor_padding():
+    """
+    Test that a cached growth system with restricted sterics is reused while the environment moves less than
+    the neighbor padding, and rebuilt when a particle moves into the sterics range from outside the padded set
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, GeometryTermIndex, ProposalOrderTools
+    from perses.rjmc.topology_view import GeometryTopologyView
+
+    #add two environment particles to the naphthalene proposal, each in its own residue
+    top_proposal, positions = generate_hybrid_test_topology()
+    system = copy.deepcopy(top_proposal.new_system)
+    topology = top_proposal.new_topology
+    nonbonded_force = [force for force in system.getForces() if isinstance(force, openmm.NonbondedForce)][0]
+    environment_chain = topology.addChain()
+    environment_indices = []
+    for particle_index in range(2):
+        environment_indices.append(system.addParticle(39.948))
+        nonbonded_force.addParticle(0.0, 0.3, 0.5)
+        topology.addAtom('AR', app.Element.getBySymbol('Ar'), topology.addResidue('ENV', environment_chain))
+    topology_view = GeometryTopologyView(topology, system)
+
+    geometry_engine = FFAllAngleGeometryEngine(use_sterics=True, verbose=False)
+    beta_unitless = beta.value_in_unit(unit.mole/unit.kilojoule)
+    atom_proposal_order, _ = ProposalOrderTools(top_proposal).determine_proposal_order(direction='forward')
+    growth_indices = [atom.idx for atom in atom_proposal_order.keys()]
+    positioned_indices = list(top_proposal.new_to_old_atom_map.keys()) + environment_indices
+    atoms_with_positions = topology_view.atoms(positioned_indices)
+    term_index = GeometryTermIndex.from_view(topology_view, growth_indices, system=system)
+
+    #move the environment particles away from an anchor of the growing atoms
+    molecule_positions = np.array(positions.value_in_unit(unit.nanometers))
+    anchor_position = molecule_positions[list(atom_proposal_order.values())[0].atom2.idx]
+    direction = anchor_position - molecule_positions[list(top_proposal.new_to_old_atom_map.keys())].mean(axis=0)
+    direction /= np.linalg.norm(direction)
+    def environment_positions(distances):
+        return np.concatenate([molecule_positions, anchor_position + np.outer(distances, direction)])
+
+    #find the smallest distance at which an environment particle is not a sterics neighbor
+    distances = np.arange(0.5, 5.0, 0.02)
+    range_distance = [distance for distance in distances
+                      if environment_indices[0] not in geometry_engine._get_sterics_neighbors(topology_view, system, positioned_indices, growth_indices, environment_positions([distance, 10.0]), term_index, beta_unitless)][0]
+    padding = geometry_engine.sterics_neighbor_padding.value_in_unit(unit.nanometers)
+
+    def checkout(distances):
+        entry = geometry_engine._checkout_growth_system(geometry_engine.growth_system_cache, top_proposal.new_chemical_state_key, system, topology, atom_proposal_order,
+                                                        'growth_stage', True, topology_view, atoms_with_positions, environment_positions(distances), term_index, beta_unitless)
+        geometry_engine.growth_system_cache.put(entry.key, entry)
+        return entry
+
+    #the first particle is outside the sterics range, but inside the padded neighbor set of the new growth system
+    entry = checkout([range_distance + padding/3, 10.0])
+    assert environment_indices[0] in entry.sterics_neighbor_indices
+    assert environment_indices[1] not in entry.sterics_neighbor_indices
+
+    #moving the first particle into the sterics range, by less than the padding, reuses the growth system
+    assert checkout([range_distance - padding/3, 10.0]) is entry
+    assert geometry_engine.growth_system_cache.n_hits == 1
+
+    #moving the second particle into the sterics range from outside the padded set rebuilds the growth system
+    rebuilt_entry = checkout([range_distance - padding/3, range_distance - 2*padding/3])
+    assert rebuilt_entry is not entry
+    assert environment_indices[1] in rebuilt_entry.sterics_neighbor_indices
+
+def test_growth_context_pool():
+    """
+    Test that the growth context pool reuses a growth system for another proposal order of the same atoms,
+    with the growth indices of the growth system built for that order
+    """
+    from perses.rjmc.geometry import GeometrySystemGenerator, GrowthContextPool, GrowthSystemCacheEntry
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    atoms = testsystem.structure.atoms
+    growth_system_generator = GeometrySystemGenerator(testsystem.system, [atoms[0], atoms[1]], 'growth_stage', add_extra_torsions=False, add_extra_angles=False)
+    entry = GrowthSystemCacheEntry(growth_system_generator, growth_system_generator.get_modified_system())
+
+    pool = GrowthContextPool(max_size=2)
+    key = pool.make_key('A', testsystem.system, [0, 1], False)
+    assert pool.make_key('A', testsystem.system, [1, 0], False) == key
+    #growth systems with sterics restricted to a neighbor list are pooled separately from those with all-particle sterics
+    assert pool.make_key('A', testsystem.system, [1, 0], True, sterics_neighbor_list=True) != pool.make_key('A', testsystem.system, [0, 1], True)
+    pool.put(key, entry)
+    assert pool.get(key) is entry
+    pool.reorder(entry, [atoms[1], atoms[0]])
+    pool.reorder(entry, [atoms[1], atoms[0]])
+    assert pool.n_reorders == 1
+    assert growth_system_generator.growth_order == [1, 0]
+
+    reference_generator = GeometrySystemGenerator(testsystem.system, [atoms[1], atoms[0]], 'growth_stage', add_extra_torsions=False, add_extra_angles=False)
+    reordered_system = growth_system_generator.get_modified_system()
+    reference_system = reference_generator.get_modified_system()
+    for force, reference_force in zip(reordered_system.getForces(), reference_system.getForces()):
+        for method_name in ['getBondParameters', 'getAngleParameters', 'getTorsionParameters']:
+            count_name = method_name.replace('get', 'getNum').replace('Parameters', 's')
+            if hasattr(force, method_name):
+                for term_index in range(getattr(force, count_name)()):
+                    assert getattr(force, method_name)(term_index)[-1][-1] == getattr(reference_force, method_name)(term_index)[-1][-1]
+
+def test_geometry_system_generator_fast():
+    """
+    Test that GeometrySystemGeneratorFast turns terms off and back on as the growth index changes
+    """
+    from perses.rjmc.geometry import GeometrySystemGeneratorFast
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    growth_indices = [testsystem.structure.atoms[0]]
+    growth_system_generator = GeometrySystemGeneratorFast(testsystem.system, growth_indices, 'growth_stage', add_extra_torsions=False, add_extra_angles=False, use_sterics=False)
+    growth_system = growth_system_generator.get_modified_system()
+    context = openmm.Context(growth_system, openmm.VerletIntegrator(1.0), openmm.Platform.getPlatformByName("Reference"))
+    context.setPositions(testsystem.positions)
+
+    #all terms involve atom 0, so the energy is zero before it is grown
+    growth_system_generator.set_growth_parameter_index(0, context)
+    energy = context.getState(getEnergy=True).getPotentialEnergy()
+    if np.abs(energy.value_in_unit(unit.kilojoule_per_mole)) > 1.0e-6:
+        raise Exception("Terms of atoms that are not grown yet are still on.")
+
+    #once atom 0 is grown, the energy is that of the original system
+    growth_system_generator.set_growth_parameter_index(1, context)
+    energy = context.getState(getEnergy=True).getPotentialEnergy()
+    if np.abs((energy - testsystem.energy).value_in_unit(unit.kilojoule_per_mole)) > 1.0e-6:
+        raise Exception("Terms of grown atoms were not turned back on.")
+
+def test_geometry_system_generator_fast_growth_order():
+    """
+    Test that GeometrySystemGeneratorFast gives the same energies after changing the growth order as a new generator
+    """
+    from perses.rjmc.geometry import GeometrySystemGeneratorFast
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    atoms = testsystem.structure.atoms
+    platform = openmm.Platform.getPlatformByName("Reference")
+    growth_system_generator = GeometrySystemGeneratorFast(testsystem.system, [atoms[0], atoms[1]], 'growth_stage', add_extra_torsions=False, add_extra_angles=False, use_sterics=False)
+    context = openmm.Context(growth_system_generator.get_modified_system(), openmm.VerletIntegrator(1.0), platform)
+    context.setPositions(testsystem.positions)
+    growth_system_generator.set_growth_order([atoms[1], atoms[0]], context)
+
+    reference_generator = GeometrySystemGeneratorFast(testsystem.system, [atoms[1], atoms[0]], 'growth_stage', add_extra_torsions=False, add_extra_angles=False, use_sterics=False)
+    reference_context = openmm.Context(reference_generator.get_modified_system(), openmm.VerletIntegrator(1.0), platform)
+    reference_context.setPositions(testsystem.positions)
+    for growth_index in [0, 1, 2]:
+        growth_system_generator.set_growth_parameter_index(growth_index, context)
+        reference_generator.set_growth_parameter_index(growth_index, reference_context)
+        energy = context.getState(getEnergy=True).getPotentialEnergy()
+        reference_energy = reference_context.getState(getEnergy=True).getPotentialEnergy()
+        if np.abs((energy - reference_energy).value_in_unit(unit.kilojoule_per_mole)) > 1.0e-6:
+            raise Exception("Energy at growth index %d differs from a new generator after changing the growth order." % growth_index)
+
+def test_geometry_term_index():
+    """
+    Test that GeometryTermIndex finds bonds and angles regardless of the order of the atoms
+    """
+    from perses.rjmc.geometry import GeometryTermIndex
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    structure = testsystem.structure
+    term_index = GeometryTermIndex.from_atoms([structure.atoms[0]], system=testsystem.system)
+
+    assert term_index.get_bond(0, 1) is structure.bonds[0]
+    assert term_index.get_bond(1, 0) is structure.bonds[0]
+    assert term_index.get_angle(0, 1, 2) is structure.angles[0]
+    assert term_index.get_angle(2, 1, 0) is structure.angles[0]
+    assert term_index.get_angle(1, 0, 2) is None
+    assert term_index.get_constraint(0, 1) is None
+
+def test_unitless_logp_regression():
+    """
+    Test that the unitless growth loop gives the same reverse logp as the unit-based geometry engine methods
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, GeometrySystemGenerator, GeometryTermIndex, ProposalOrderTools
+
+    #map the benzene ring of naphthalene onto itself, so that the other ring is grown
+    top_proposal, positions = generate_hybrid_test_topology()
+    positions = unit.Quantity(np.array(positions.value_in_unit(unit.nanometers)), unit=unit.nanometers)
+
+    geometry_engine = FFAllAngleGeometryEngine(verbose=False)
+    np.random.seed(0)
+    logp = geometry_engine.logp_reverse(top_proposal, positions, positions, beta)
+
+    #recompute the logp with the unit-based methods, using the same proposal order
+    np.random.seed(0)
+    atom_proposal_order, logp_reference = ProposalOrderTools(top_proposal).determine_proposal_order(direction='reverse')
+    growth_system_generator = GeometrySystemGenerator(top_proposal.old_system, atom_proposal_order.keys(), 'growth_stage', reference_topology=top_proposal.old_topology)
+    growth_context = openmm.Context(growth_system_generator.get_modified_system(), openmm.VerletIntegrator(1.0), openmm.Platform.getPlatformByName("Reference"))
+    term_index = GeometryTermIndex.from_view(top_proposal.old_topology_view, [atom.idx for atom in atom_proposal_order.keys()])
+    for growth_parameter_value, (atom, torsion) in enumerate(atom_proposal_order.items(), 1):
+        growth_system_generator.set_growth_parameter_index(growth_parameter_value, growth_context)
+        internal_coordinates, detJ = geometry_engine._cartesian_to_internal(positions[atom.idx], positions[torsion.atom2.idx], positions[torsion.atom3.idx], positions[torsion.atom4.idx])
+        r = unit.Quantity(internal_coordinates[0], unit=unit.nanometers)
+        theta = unit.Quantity(internal_coordinates[1], unit=unit.radians)
+        phi = unit.Quantity(internal_coordinates[2], unit=unit.radians)
+        bond = geometry_engine._get_relevant_bond(atom, torsion.atom2, term_index)
+        if bond is not None:
+            sigma_r = unit.sqrt(1/(beta*bond.type.k))
+            logp_reference += geometry_engine._bond_logq(r, bond, beta) - np.log(np.sqrt(2*np.pi)*sigma_r.value_in_unit(unit.angstrom))
+        angle = geometry_engine._get_relevant_angle(atom, torsion.atom2, torsion.atom3, term_index)
+        sigma_theta = unit.sqrt(1/(beta*angle.type.k))
+        logp_reference += geometry_engine._angle_logq(theta, angle, beta) - np.log(np.sqrt(2*np.pi)*sigma_theta.value_in_unit(unit.radians))
+        logp_reference += geometry_engine._torsion_logp(growth_context, torsion, copy.deepcopy(positions), r, theta, phi, beta) + np.log(detJ)
+
+    if np.abs(logp - logp_reference) > 1.0e-6:
+        raise Exception("Unitless logp %f didn't match the unit-based logp %f." % (logp, logp_reference))
+
+def test_propose_and_logp_reverse():
+    """
+    Test that the fused forward proposal and reverse logp agree with the logps of the separate directions
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, ProposalOrderTools
+
+    top_proposal, positions = generate_hybrid_test_topology()
+    positions = unit.Quantity(np.array(positions.value_in_unit(unit.nanometers)), unit=unit.nanometers)
+
+    geometry_engine = FFAllAngleGeometryEngine(verbose=False)
+    np.random.seed(0)
+    new_positions, logp_forward, logp_reverse = geometry_engine.propose_and_logp_reverse(top_proposal, positions, beta)
+
+    #the proposal orders are drawn first, forward then reverse
+    np.random.seed(0)
+    proposal_order_tool = ProposalOrderTools(top_proposal)
+    forward_proposal_order = proposal_order_tool.determine_proposal_order(direction='forward')
+    reverse_proposal_order = proposal_order_tool.determine_proposal_order(direction='reverse')
+    logp_reverse_reference, _ = geometry_engine._logp_propose(top_proposal, positions, beta, new_positions=new_positions, direction='reverse', proposal_order=reverse_proposal_order)
+    if np.abs(logp_reverse - logp_reverse_reference) > 1.0e-6:
+        raise Exception("Fused reverse logp %f didn't match the reverse logp %f." % (logp_reverse, logp_reverse_reference))
+
+    #the old and new systems are the same, so the forward logp is the reverse logp of the proposed positions
+    logp_forward_reference, _ = geometry_engine._logp_propose(top_proposal, new_positions, beta, new_positions=positions, direction='reverse', proposal_order=forward_proposal_order)
+    if np.abs(logp_forward - logp_forward_reference) > 1.0e-6:
+        raise Exception("Fused forward logp %f didn't match the reverse logp of the proposed positions %f." % (logp_forward, logp_forward_reference))
+
+def test_batched_hydrogen_rotor():
+    """
+    Test that the hydrogens of a methyl group are proposed jointly when batch_hydrogens is set,
+    and that the forward logp is the reverse logp of the proposed positions
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, ProposalOrderTools
+
+    top_proposal, positions = generate_hybrid_test_topology(mol_name="toluene")
+    positions = unit.Quantity(np.array(positions.value_in_unit(unit.nanometers)), unit=unit.nanometers)
+
+    geometry_engine = FFAllAngleGeometryEngine(use_vectorized_energies=True, batch_hydrogens=True, verbose=False)
+    proposal_order, logp_choice = ProposalOrderTools(top_proposal).determine_proposal_order(direction='forward', group_hydrogens=True)
+    hydrogen_rotors = geometry_engine._get_hydrogen_rotors(proposal_order)
+    assert [len(rotor) for rotor in hydrogen_rotors.values()] == [3]
+
+    logp_forward, new_positions = geometry_engine._logp_propose(top_proposal, positions, beta, direction='forward', proposal_order=(proposal_order, logp_choice))
+    assert np.all(np.isfinite(new_positions.value_in_unit(unit.nanometers)))
+    assert np.isfinite(logp_forward)
+
+    #the old and new systems are the same, so the forward logp is the reverse logp of the proposed positions
+    logp_reverse, _ = geometry_engine._logp_propose(top_proposal, new_positions, beta, new_positions=positions, direction='reverse', proposal_order=(proposal_order, logp_choice))
+    if np.abs(logp_forward - logp_reverse) > 1.0e-6:
+        raise Exception("Batched hydrogen forward logp %f didn't match the reverse logp %f." % (logp_forward, logp_reverse))
+
+def test_geometry_profiler():
+    """
+    Test that the geometry profiler collects one timing record per proposal direction, and only inside the context,
+    for FFAllAngleGeometryEngine and BootstrapParticleFilter
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import FFAllAngleGeometryEngine, BootstrapParticleFilter, profile_geometry
+
+    top_proposal, positions = generate_hybrid_test_topology()
+    positions = unit.Quantity(np.array(positions.value_in_unit(unit.nanometers)), unit=unit.nanometers)
+    n_new_atoms = len(top_proposal.unique_new_atoms)
+
+    for geometry_engine in [FFAllAngleGeometryEngine(verbose=False), BootstrapParticleFilter(n_particles=4, verbose=False)]:
+        with profile_geometry(geometry_engine) as profiler:
+            new_positions, logp_forward, logp_reverse = geometry_engine.propose_and_logp_reverse(top_proposal, positions, beta)
+        geometry_engine.propose(top_proposal, positions, beta)
+        assert geometry_engine.profiler is None
+
+        records = profiler.get_records()
+        assert len(records) == 2
+        assert sorted(records.direction) == ['forward', 'reverse']
+        assert np.all(records.n_atoms == n_new_atoms)
+        assert np.all(records.n_energy_calls >= n_new_atoms)
+        assert np.all(records.energy_time > 0)
+        assert np.all(records.energy_time <= records.total_time)
+
+    #the particle filter evaluates the energy of every particle once per growth stage
+    assert np.all(records.n_energy_calls == n_new_atoms)
+    assert np.all(records.n_energy_evaluations == 4*n_new_atoms)
+
+def test_bootstrap_particle_filter():
+    """
+    Test that the BootstrapParticleFilter makes finite proposals, and that with a single particle
+    its forward and reverse logps are those of the bootstrap proposal
+    """
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import BootstrapParticleFilter, ProposalOrderTools
+
+    top_proposal, positions = generate_hybrid_test_topology()
+    positions = unit.Quantity(np.array(positions.value_in_unit(unit.nanometers)), unit=unit.nanometers)
+
+    geometry_engine = BootstrapParticleFilter(n_particles=16, n_workers=2, verbose=False)
+    new_positions, logp_forward, logp_reverse = geometry_engine.propose_and_logp_reverse(top_proposal, positions, beta)
+    assert np.all(np.isfinite(new_positions.value_in_unit(unit.nanometers)))
+    assert np.isfinite(logp_forward) and np.isfinite(logp_reverse)
+
+    #the old and new systems are the same, so the reverse logp of the proposed positions is the forward logp
+    geometry_engine = BootstrapParticleFilter(n_particles=1, verbose=False)
+    proposal_order = ProposalOrderTools(top_proposal).determine_proposal_order(direction='forward')
+    logp_forward, new_positions = geometry_engine._logp_propose(top_proposal, positions, beta, direction='forward', proposal_order=proposal_order)
+    logp_reverse, _ = geometry_engine._logp_propose(top_proposal, new_positions, beta, new_positions=positions, direction='reverse', proposal_order=proposal_order)
+    if np.abs(logp_forward - logp_reverse) > 1.0e-6:
+        raise Exception("Single particle forward logp %f didn't match the reverse logp %f." % (logp_forward, logp_reverse))
+
+def test_omega_geometry_engine():
+    """
+    Test that the OmegaGeometryEngine makes finite proposals, that the forward logp is the density of the
+    proposed positions, and that a second engine reading the on-disk conformer library gives the same logps
+    """
+    import tempfile
+    import shutil
+    from perses.tests.test_elimination import generate_hybrid_test_topology
+    from perses.rjmc.geometry import OmegaGeometryEngine
+
+    top_proposal, positions = generate_hybrid_test_topology()
+
+    cache_directory = tempfile.mkdtemp()
+    try:
+        geometry_engine = OmegaGeometryEngine(n_omega_references=5, conformer_cache_directory=cache_directory)
+        new_positions, logp_forward = geometry_engine.propose(top_proposal, positions, beta)
+        assert np.all(np.isfinite(new_positions.value_in_unit(unit.nanometers)))
+        assert np.isfinite(logp_forward)
+        assert len(os.listdir(cache_directory)) == 1
+
+        #the old and new systems are the same, so the reverse logp of the proposed positions is the forward logp
+        logp_reverse = geometry_engine.logp_reverse(top_proposal, positions, new_positions, beta)
+        if np.abs(logp_forward - logp_reverse) > 1.0e-6:
+            raise Exception("Forward logp %f didn't match the reverse logp %f of the proposed positions." % (logp_forward, logp_reverse))
+
+        cached_geometry_engine = OmegaGeometryEngine(n_omega_references=5, conformer_cache_directory=cache_directory)
+        cached_logp_reverse = cached_geometry_engine.logp_reverse(top_proposal, positions, new_positions, beta)
+        if np.abs(cached_logp_reverse - logp_reverse) > 1.0e-6:
+            raise Exception("The conformer library read from disk gave logp %f instead of %f." % (cached_logp_reverse, logp_reverse))
+    finally:
+        shutil.rmtree(cache_directory)
+
+def test_systematic_resample():
+    """
+    Test that systematic resampling gives each particle floor or ceil of n_particles times its weight descendants
+    """
+    from perses.rjmc.geometry import BootstrapParticleFilter
+    n_particles = 10
+    for conditional in [False, True]:
+        for trial in range(100):
+            weights = np.random.dirichlet(np.ones(n_particles))
+            ancestors = BootstrapParticleFilter._systematic_resample(weights, conditional=conditional)
+            counts = np.bincount(ancestors, minlength=n_particles)
+            assert np.all(counts >= np.floor(n_particles*weights)) and np.all(counts <= np.ceil(n_particles*weights))
+            if conditional:
+                assert ancestors[0] == 0
+
+def test_neighbor_cell_list():
+    """
+    Test that NeighborCellList finds the same neighbors as a brute force search, with and without periodic boundaries
+    """
+    from perses.rjmc.geometry import NeighborCellList
+
+    positions = np.random.uniform(0.0, 3.0, size=[500, 3])
+    points = np.random.uniform(0.0, 3.0, size=[3, 3])
+    radius = 0.9
+    for box_lengths in [None, np.array([3.0, 3.0, 3.0])]:
+        cell_list = NeighborCellList(positions, radius, box_lengths=box_lengths)
+        displacements = positions[np.newaxis, :, :] - points[:, np.newaxis, :]
+        if box_lengths is not None:
+            displacements -= np.round(displacements / box_lengths) * box_lengths
+        expected = np.nonzero(np.any(np.sum(displacements**2, axis=2) <= radius**2, axis=0))[0]
+        assert np.array_equal(cell_list.query(points, radius), expected)
+
+def test_sterics_nonbonded_method():
+    """
+    Test that the growth system sterics use the cutoff method and box of the reference system, and only the given neighbors
+    """
+    from perses.rjmc.geometry import GeometrySystemGenerator
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    system = copy.deepcopy(testsystem.system)
+    system.setDefaultPeriodicBoxVectors(*[unit.Quantity(vector, unit=unit.nanometers) for vector in 3.0*np.eye(3)])
+    nonbonded_force = openmm.NonbondedForce()
+    nonbonded_force.setNonbondedMethod(openmm.NonbondedForce.PME)
+    for particle_index in range(4):
+        nonbonded_force.addParticle(0.0, 0.3, 0.5)
+    system.addForce(nonbonded_force)
+
+    growth_indices = [testsystem.structure.atoms[0]]
+    growth_system_generator = GeometrySystemGenerator(system, growth_indices, 'growth_stage', add_extra_torsions=False, add_extra_angles=False, use_sterics=True, sterics_neighbor_indices=[2, 3])
+    growth_system = growth_system_generator.get_modified_system()
+    sterics_force = [force for force in growth_system.getForces() if isinstance(force, openmm.CustomNonbondedForce)][0]
+    assert sterics_force.getNonbondedMethod() == openmm.CustomNonbondedForce.CutoffPeriodic
+    assert growth_system.getDefaultPeriodicBoxVectors()[0][0] == 3.0*unit.nanometers
+    assert set(sterics_force.getInteractionGroupParameters(0)[1]) == {2, 3}
+
+def test_topology_view():
+    """
+    Test that GeometryTopologyView exposes the same bonds, angles and parameters as the parmed structure
+    """
+    from perses.rjmc.topology_view import GeometryTopologyView
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    topology_view = GeometryTopologyView(testsystem.topology, testsystem.system)
+    r0, bond_k = testsystem.bond_parameters
+    theta0, angle_k = testsystem.angle_parameters
+
+    assert topology_view.n_atoms == 4
+    assert topology_view.atomic_numbers.tolist() == [6, 6, 6, 6]
+    assert topology_view.bonds.tolist() == [[0, 1], [1, 2], [2, 3]]
+    assert topology_view.atom(0) is topology_view.atom(0)
+
+    bonds = topology_view.get_bonds([0])
+    assert len(bonds) == 1
+    assert bonds[0].atom1.idx == 0 and bonds[0].atom2.idx == 1
+    assert abs(bonds[0].type.req - r0) < 1.0e-6*unit.nanometers
+    assert abs(bonds[0].type.k - bond_k) < 1.0e-6*bond_k
+    assert topology_view.get_bonds([2])[1].type is None
+
+    angles = topology_view.get_angles([0])
+    assert [atom.idx for atom in angles[0][:3]] == [0, 1, 2]
+    assert abs(angles[0].type.theteq - theta0) < 1.0e-6*unit.radians
+    assert abs(angles[0].type.k - angle_k) < 1.0e-6*angle_k
+
+def test_proposal_order_plan():
+    """
+    Test that ProposalOrderTools finds the topological torsions of a new atom and memoizes its proposal plan
+    """
+    from perses.rjmc.geometry import ProposalOrderTools
+    from perses.rjmc.topology_view import GeometryTopologyView
+
+    testsystem = FourAtomValenceTestSystem(bond=True, angle=True, torsion=True)
+    topology_view = GeometryTopologyView(testsystem.topology, testsystem.system)
+    indptr, indices = topology_view.bond_graph
+
+    torsions = ProposalOrderTools._enumerate_torsions(np.array([0, 3]), indptr, indices)
+    assert torsions.tolist() == [[0, 1, 2, 3], [3, 2, 1, 0]]
+
+    rounds, candidate_torsions = ProposalOrderTools._get_proposal_plan(topology_view, [1, 2, 3])
+    assert [atoms.tolist() for atoms in rounds] == [[0]]
+    assert candidate_torsions[0].tolist() == [[0, 1, 2, 3]]
+    assert ProposalOrderTools._get_proposal_plan(GeometryTopologyView(testsystem.topology, testsystem.system), [3, 2, 1])[1] is candidate_torsions
+
 def create_cdf(log_probability_mass_function, phis, n_divisions):
     """
     Create a callable CDF function for the scipy KS test
@@ -1279,6 +1904,31 @@ def test_coordinate_conversion():
         xyz, _ = geometry_engine._internal_to_cartesian(bond_position, angle_position, torsion_position, r, theta, phi)
         assert np.linalg.norm(xyz-atom_position) < 1.0e-12
 
+def test_batched_coordinate_kernels():
+    """
+    Test that the batched coordinate kernels agree with the single-atom conversions, in float64 and float32
+    """
+    n_atoms = 20
+    phis = np.linspace(-np.pi, np.pi, 36, endpoint=False)
+    bond_positions, angle_positions, torsion_positions = np.random.randn(3, n_atoms, 3)
+    internal_coordinates = np.stack([np.random.uniform(0.1, 0.2, n_atoms), np.random.uniform(0.1, np.pi-0.1, n_atoms), np.random.uniform(-np.pi, np.pi, n_atoms)], axis=1)
+
+    frames = coordinate_numba.local_frames(bond_positions, angle_positions, torsion_positions)
+    xyzs, detJ = coordinate_numba.internal_to_cartesian_batch(bond_positions, frames, internal_coordinates)
+    scan_xyzs, scan_detJ = coordinate_numba.torsion_scan_batch(bond_positions, frames, internal_coordinates[:, 0], internal_coordinates[:, 1], phis)
+    assert np.allclose(detJ, np.abs(internal_coordinates[:, 0]**2*np.sin(internal_coordinates[:, 1])))
+    assert np.allclose(scan_detJ, detJ)
+    for i in range(n_atoms):
+        assert np.allclose(coordinate_numba.cartesian_to_internal(xyzs[i], bond_positions[i], angle_positions[i], torsion_positions[i]), internal_coordinates[i])
+        reference_xyzs = coordinate_numba.torsion_scan(bond_positions[i], angle_positions[i], torsion_positions[i], np.array([internal_coordinates[i, 0], internal_coordinates[i, 1], 0.0]), phis)
+        assert np.allclose(scan_xyzs[i], reference_xyzs)
+
+    frames_32 = coordinate_numba.local_frames(bond_positions.astype(np.float32), angle_positions, torsion_positions)
+    xyzs_32, detJ_32 = coordinate_numba.internal_to_cartesian_batch(bond_positions.astype(np.float32), frames_32, internal_coordinates)
+    assert xyzs_32.dtype == np.float32
+    assert np.allclose(xyzs_32, xyzs, atol=1.0e-5)
+    assert np.allclose(detJ_32, detJ, atol=1.0e-5)
+
 def test_openmm_dihedral():
     import perses.rjmc.geometry as geometry
     geometry_engine = geometry.FFAllAngleGeometryEngine({'test': 'true'})
@@ -154,3 +154,45 @@ def test_ncmc_integrator_harmonic_oscillator():
             f = partial(check_harmonic_oscillator_ncmc, ncmc_nsteps, ncmc_integrator=integrator_type)
             f.description = "Testing %s NCMC switching using harmonic oscillator with %d NCMC steps" % (integrator_type, ncmc_nsteps)
             yield f
+
+def test_ncmc_integrator_chunked_steps():
+    """
+    Check that the work read after chunks of integrator.step(nsteps_per_chunk) matches the work read after each step(1).
+
+    """
+    from perses.annihilation import NCMCVVAlchemicalIntegrator
+    temperature = 300.0 * unit.kelvin
+    timestep = 1.0 * unit.femtoseconds
+    ncmc_nsteps = 10
+    platform = openmm.Platform.getPlatformByName('Reference')
+
+    # Create a 3D harmonic oscillator with context parameter controlling center of oscillator.
+    system = openmm.System()
+    system.addParticle(39.948 * unit.amu)
+    force = openmm.CustomExternalForce('(K/2.0) * ((x-x0)^2 + y^2 + z^2);')
+    force.addGlobalParameter('K', 100.0)
+    force.addGlobalParameter('x0', 0.0)
+    force.addParticle(0, [])
+    system.addForce(force)
+    positions = unit.Quantity(np.zeros([1, 3], np.float32), unit.angstroms)
+    velocities = unit.Quantity(np.array([[0.1, -0.2, 0.3]]), unit.nanometers/unit.picoseconds)
+    functions = { 'x0' : 'lambda' }
+
+    work = dict()
+    for nsteps_per_chunk in [1, 5]:
+        ncmc_integrator = NCMCVVAlchemicalIntegrator(temperature, system, functions, direction='insert', nsteps=ncmc_nsteps, timestep=timestep)
+        context = openmm.Context(system, ncmc_integrator, platform)
+        context.setPositions(positions)
+        context.setVelocities(velocities)
+        total_work = [0.0]
+        for step in range(0, ncmc_nsteps, nsteps_per_chunk):
+            ncmc_integrator.step(nsteps_per_chunk)
+            total_work.append(ncmc_integrator.getTotalWork(context))
+        # Further steps have no effect on the accumulated work
+        ncmc_integrator.step(1)
+        assert ncmc_integrator.getTotalWork(context) == total_work[-1]
+        work[nsteps_per_chunk] = np.array(total_work)
+        del context, ncmc_integrator
+
+    if np.max(np.abs(work[1][::5] - work[5])) > 1.0e-6:
+        raise Exception("Work read after chunks of steps %s didn't match the stepwise work %s." % (str(work[5]), str(work[1][::5])))
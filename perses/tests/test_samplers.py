@@ -132,6 +132,69 @@ def run_samplers(testsystem_names, niterations=5):
             f.description = "Testing MultiTargetDesign sampler with %s transfer free energy from vacuum -> %s" % (testsystem_name, environment)
             yield f
 
+def test_threaded_sampler_updates():
+    """
+    Test that samplers updated concurrently draw from their own random number streams,
+    giving the same results as serial updates whatever the thread scheduling.
+    """
+    import time
+    from perses.samplers.samplers import _update_samplers, _sampler_random_states
+    from perses.rjmc.random_state import get_random_state
+
+    class RandomSampler(object):
+        def __init__(self):
+            self.draws = list()
+        def update(self):
+            for step in range(5):
+                self.draws.append(get_random_state().uniform())
+                time.sleep(0.001*get_random_state().randint(3))
+
+    draws = list()
+    for n_workers in [1, 4, 4]:
+        samplers = [RandomSampler() for sampler_index in range(4)]
+        random_states = _sampler_random_states(1234, len(samplers), n_workers)
+        for iteration in range(3):
+            _update_samplers(samplers, random_states, n_workers)
+        draws.append([sampler.draws for sampler in samplers])
+    assert draws[0] == draws[1] == draws[2]
+    assert len(set(draws[0][0]).intersection(draws[0][1])) == 0
+
+def test_threaded_expanded_ensemble_updates():
+    """
+    Test that expanded ensemble samplers sharing a geometry engine give the same trajectories
+    when updated concurrently as when updated serially with the same random_state.
+    """
+    from perses.tests.testsystems import AlanineDipeptideTestSystem
+    from perses.samplers.samplers import _update_samplers, _sampler_random_states
+    niterations = 2 # number of iterations to run
+    environments = ['implicit', 'vacuum']
+
+    if 'TESTSYSTEMS' in os.environ:
+        testsystem_names = os.environ['TESTSYSTEMS'].split(' ')
+        if 'AlanineDipeptideTestSystem' not in testsystem_names:
+            return
+
+    trajectories = list()
+    for n_workers in [1, 2]:
+        testsystem = AlanineDipeptideTestSystem()
+        testsystem.geometry_engine.write_proposal_pdb = False
+        samplers = [testsystem.exen_samplers[environment] for environment in environments]
+        for sampler in samplers:
+            sampler.verbose = False
+            sampler.sampler.verbose = False
+        random_states = _sampler_random_states(1234, len(samplers), n_workers)
+        trajectory = list()
+        for iteration in range(niterations):
+            _update_samplers(samplers, random_states, n_workers)
+            trajectory.append([(sampler.state_key, sampler.sampler.sampler_state.positions / unit.nanometers) for sampler in samplers])
+        trajectories.append(trajectory)
+        assert testsystem.geometry_engine.nproposed == niterations * len(samplers)
+
+    for serial_states, threaded_states in zip(*trajectories):
+        for (serial_key, serial_positions), (threaded_key, threaded_positions) in zip(serial_states, threaded_states):
+            assert serial_key == threaded_key
+            assert np.allclose(serial_positions, threaded_positions)
+
 def test_hybrid_scheme():
     """
     Test ncmc hybrid switching
@@ -182,5 +182,33 @@ def test_storage_with_samplers():
             #yield f
             f()
 
+def test_write_cache_file_concurrently():
+    """Test that concurrent writers of the same cache file leave one complete file and no temporary files.
+    """
+    import shutil
+    import threading
+    from perses.rjmc.cache_files import write_cache_file
+    cache_directory = tempfile.mkdtemp()
+    filename = os.path.join(cache_directory, 'entry.txt')
+    contents = ['%d\n' % writer_index * 10000 for writer_index in range(8)]
+
+    def write_contents(text):
+        def write(temporary_filename):
+            with open(temporary_filename, 'w') as outfile:
+                outfile.write(text)
+        write_cache_file(filename, write)
+
+    try:
+        threads = [threading.Thread(target=write_contents, args=(text,)) for text in contents]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert os.listdir(cache_directory) == ['entry.txt']
+        with open(filename, 'r') as infile:
+            assert infile.read() in contents
+    finally:
+        shutil.rmtree(cache_directory)
+
 if __name__=="__main__":
     test_write_object()
\ No newline at end of file